@@ -4,23 +4,639 @@ Database Schema Generator and Sync Tool
 Generates PostgreSQL schemas from TypeScript collection types and syncs them with the database.
 """
 
+import argparse
+import contextlib
+import io
+import itertools
 import json
 import os
 import re
 from pathlib import Path
-from typing import Dict, List, Any, Optional, Set
+from typing import Dict, List, Any, Iterable, Iterator, Optional, Set, TextIO, Tuple
 import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 try:
 	import psycopg2  # type: ignore
+	import psycopg2.pool  # type: ignore
 except Exception:  # pragma: no cover - optional for fuzzing environments
 	psycopg2 = None  # type: ignore
-from datetime import datetime
+from datetime import datetime, timezone
 
-class SchemaGenerator:
-    def __init__(self):
+from schema_common import (
+    DATA_GIN_CHOICES, DEFAULT_DATA_GIN, UNIT_MANIFEST, CollectionGenerator, GenerationCache, content_hash,
+    field_index_specs, format_index_report, index_spec, is_append_only, load_collection_fields,
+    load_collection_slug, load_migration_units, migration_unit, plan_indexes, render_collection_registry,
+    render_collection_stats, render_index_phase, render_index_plan, render_partition_functions,
+    render_registry_tables, render_row_counter_triggers, render_row_counters, render_search_document_sync,
+    render_search_documents, render_set_updated_at, render_storage_profile, render_table_partitions,
+    render_typed_casts, render_typed_columns, typed_columns, unit_checksum, write_migration_units,
+)
+
+DOLLAR_QUOTE_RE = re.compile(r'\$[A-Za-z_]*\$')
+
+# Maps the type spellings used in the templates to PostgreSQL's format_type() output
+SQL_TYPE_ALIASES = {
+    'uuid': 'uuid',
+    'timestamptz': 'timestamp with time zone',
+    'jsonb': 'jsonb',
+    'tsvector': 'tsvector',
+    'text': 'text',
+    'boolean': 'boolean',
+    'numeric': 'numeric',
+    'integer': 'integer',
+    'bigint': 'bigint',
+}
+
+# Session settings for applying migrations; the lock timeout makes a statement that queues
+# behind a long-running transaction fail fast instead of blocking every query behind it
+DEFAULT_LOCK_TIMEOUT = '5s'
+DEFAULT_STATEMENT_TIMEOUT = '0'
+
+USER_RELATIONS = "n.nspname NOT IN ('pg_catalog', 'information_schema') AND n.nspname NOT LIKE 'pg_toast%'"
+
+# Relation locks this backend holds, outside the system catalogs
+HELD_LOCKS_QUERY = f"""
+SELECT c.oid, c.oid::regclass::text, l.mode
+FROM pg_locks l
+JOIN pg_class c ON c.oid = l.relation
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE l.pid = pg_backend_pid() AND l.granted AND {USER_RELATIONS}
+"""
+
+EXISTING_RELATIONS_QUERY = f"""
+SELECT c.oid FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace WHERE {USER_RELATIONS}
+"""
+
+# Index builds the index phase runs at once, each on its own connection
+DEFAULT_INDEX_CONCURRENCY = 4
+
+# Migration units applied at once, each in its own transaction on its own connection
+DEFAULT_UNIT_CONCURRENCY = 4
+
+# deadlock_detected and serialization_failure: the unit rolled back and can simply run again
+RETRYABLE_ERRORS = ('40P01', '40001')
+
+# Checksums of the units applied so far. Kept outside public, so neither the Supabase API nor
+# the grants on public expose it.
+CREATE_LEDGER = """
+CREATE SCHEMA IF NOT EXISTS schema_generator;
+CREATE TABLE IF NOT EXISTS schema_generator.schema_migrations (
+    unit TEXT PRIMARY KEY,
+    checksum TEXT NOT NULL,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+)
+"""
+
+RECORDED_UNITS_QUERY = "SELECT unit, checksum FROM schema_generator.schema_migrations"
+
+RECORD_UNIT = """
+INSERT INTO schema_generator.schema_migrations (unit, checksum) VALUES (%s, %s)
+ON CONFLICT (unit) DO UPDATE SET checksum = EXCLUDED.checksum, applied_at = NOW()
+"""
+
+INDEX_NAME_RE = re.compile(r'INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)', re.IGNORECASE)
+
+INVALID_INDEXES_QUERY = """
+SELECT c.oid::regclass::text
+FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+WHERE NOT i.indisvalid AND c.relname = ANY(%s)
+"""
+
+# Rows the bulk loader sends per COPY; each batch commits on its own
+DEFAULT_LOAD_BATCH_SIZE = 50000
+
+# The collection table columns a loaded document fills; typed and search columns follow from data
+LOAD_COLUMNS = ('id', 'created_at', 'updated_at', 'data')
+
+# Seed documents carry ids like "1"; they map to the same UUID on every load
+LOAD_ID_NAMESPACE = uuid.UUID('6f1c2b8e-3d4a-5e6f-8a9b-0c1d2e3f4a5b')
+
+# Characters the JSON reader pulls from a load file at a time
+LOAD_READ_SIZE = 1 << 16
+
+# Secondary indexes the loader may drop and rebuild: unique indexes stay, they back ON CONFLICT
+# and a rebuild would fail on whatever duplicates they kept out
+DEFERRABLE_INDEXES_QUERY = """
+SELECT i.indexrelid::regclass::text, pg_get_indexdef(i.indexrelid)
+FROM pg_index i
+WHERE i.indrelid = %s::regclass AND NOT i.indisunique
+  AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+ORDER BY 1
+"""
+
+PARTITIONED_TABLE_QUERY = "SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass"
+
+CREATE_LOAD_STAGING = """
+CREATE TEMP TABLE IF NOT EXISTS bulk_load_staging (
+    id UUID, created_at TIMESTAMPTZ, updated_at TIMESTAMPTZ, data JSONB
+) ON COMMIT DELETE ROWS
+"""
+
+COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+class MigrationRunner:
+    """Applies migration statements over pooled psycopg2 connections, timing each statement
+    and recording the relation locks it acquired"""
+    
+    def __init__(self, database_url: str, lock_timeout: str = DEFAULT_LOCK_TIMEOUT,
+                 statement_timeout: str = DEFAULT_STATEMENT_TIMEOUT, max_connections: int = 1,
+                 settings: Optional[Dict[str, str]] = None):
+        self.lock_timeout = lock_timeout
+        self.statement_timeout = statement_timeout
+        self.settings = settings or {}
+        self.pool = psycopg2.pool.ThreadedConnectionPool(1, max_connections, database_url)
+        self.timings: List[Dict[str, Any]] = []
+        self.started_at = datetime.now()
+    
+    @contextlib.contextmanager
+    def connection(self, autocommit: bool = False):
+        """Borrow a pooled connection with the migration timeouts and session settings applied"""
+        conn = self.pool.getconn()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET lock_timeout = %s", (self.lock_timeout,))
+                cur.execute("SET statement_timeout = %s", (self.statement_timeout,))
+                for name, value in self.settings.items():
+                    cur.execute("SELECT set_config(%s, %s, false)", (name, value))
+            conn.commit()
+            conn.autocommit = autocommit
+            yield conn
+        finally:
+            conn.autocommit = False
+            self.pool.putconn(conn)
+    
+    def held_locks(self, cur) -> Set[Tuple[int, str, str]]:
+        cur.execute(HELD_LOCKS_QUERY)
+        return set(cur.fetchall())
+    
+    def execute(self, cur, statement: str, existing: Optional[Set[int]] = None,
+                unit: Optional[str] = None) -> Dict[str, Any]:
+        """Run one statement and record how long it took and, given the relations that existed
+        before its transaction, which locks it added"""
+        track_locks = existing is not None
+        before = self.held_locks(cur) if track_locks else set()
+        started = time.perf_counter()
+        timing = {'statement': ' '.join(re.sub(r'--[^\n]*', '', statement).split())[:120]}
+        if unit:
+            timing['unit'] = unit
+        try:
+            cur.execute(statement)
+        except Exception as e:
+            timing['error'] = str(e).strip()
+            raise
+        finally:
+            timing['duration_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            self.timings.append(timing)
+        if not track_locks:
+            return timing
+        # Locks on relations this migration created block nobody: they are invisible until commit
+        timing['locks'] = [{'relation': relation, 'mode': mode, 'new_relation': oid not in existing}
+                           for oid, relation, mode in sorted(self.held_locks(cur) - before)]
+        return timing
+    
+    def apply(self, statements: Iterable[str], unit: Optional[str] = None, checksum: Optional[str] = None) -> int:
+        """Apply statements in one transaction; returns how many ran, raising after a rollback on failure
+        
+        With a checksum, the unit is recorded in the ledger in the same transaction.
+        """
+        applied = 0
+        with self.connection() as conn:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(EXISTING_RELATIONS_QUERY)
+                    existing = {oid for oid, in cur.fetchall()}
+                    for statement in statements:
+                        self.execute(cur, statement, existing, unit)
+                        applied += 1
+                    if checksum:
+                        cur.execute(RECORD_UNIT, (unit, checksum))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return applied
+    
+    def apply_unit(self, unit: Dict[str, Any]) -> int:
+        """Apply one unit in its own transaction, retrying once when it lost a deadlock"""
+        try:
+            return self.apply(unit['statements'], unit['name'], unit.get('checksum'))
+        except Exception as e:
+            if getattr(e, 'pgcode', None) not in RETRYABLE_ERRORS:
+                raise
+            return self.apply(unit['statements'], unit['name'], unit.get('checksum'))
+    
+    def recorded_checksums(self) -> Dict[str, str]:
+        """Checksums of the units already applied, creating the ledger on first use"""
+        with self.connection(autocommit=True) as conn:
+            with conn.cursor() as cur:
+                cur.execute(CREATE_LEDGER)
+                cur.execute(RECORDED_UNITS_QUERY)
+                return dict(cur.fetchall())
+    
+    def apply_units(self, units: List[Dict[str, Any]], concurrency: int = DEFAULT_UNIT_CONCURRENCY,
+                    recorded: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """Apply migration units on up to `concurrency` connections, starting each unit once every
+        unit it depends on has committed; returns the failed and skipped units
+        
+        Units whose checksum is already `recorded` count as done without running. No new unit
+        starts after a failure; units already running are allowed to finish.
+        """
+        recorded = recorded or {}
+        done: Set[str] = {unit['name'] for unit in units
+                          if unit.get('checksum') and recorded.get(unit['name']) == unit['checksum']}
+        pending = {unit['name']: unit for unit in units if unit['name'] not in done}
+        running = {}
+        failed = []
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            while pending or running:
+                if not failed:
+                    for name, unit in list(pending.items()):
+                        if set(unit['depends_on']) <= done:
+                            running[executor.submit(self.apply_unit, unit)] = name
+                            del pending[name]
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        future.result()
+                        done.add(name)
+                    except Exception as e:
+                        failed.append({'statement': f"unit {name}", 'error': str(e).strip(),
+                                       'pgcode': getattr(e, 'pgcode', None)})
+        return failed + [{'statement': f"unit {name}", 'error': 'skipped: a unit it depends on did not apply'}
+                         for name in pending]
+    
+    def invalid_indexes(self, cur, names: List[str]) -> List[str]:
+        """Qualified names of the given indexes that a failed CONCURRENTLY build left INVALID"""
+        cur.execute(INVALID_INDEXES_QUERY, (names,))
+        return [name for name, in cur.fetchall()]
+    
+    def drop_invalid_indexes(self, cur, names: List[str]) -> List[str]:
+        dropped = self.invalid_indexes(cur, names)
+        for name in dropped:
+            self.execute(cur, f"DROP INDEX CONCURRENTLY IF EXISTS {name}")
+        return dropped
+    
+    def build_index(self, statement: str) -> Optional[Dict[str, Any]]:
+        """Run one index phase statement on its own connection, retrying once after dropping the
+        INVALID index a failed build leaves behind; returns the failure, if any"""
+        match = INDEX_NAME_RE.search(statement)
+        with self.connection(autocommit=True) as conn:
+            with conn.cursor() as cur:
+                for attempt in (1, 2):
+                    try:
+                        self.execute(cur, statement)
+                        return None
+                    except Exception as e:
+                        error = str(e).strip()
+                        if match:
+                            self.drop_invalid_indexes(cur, [match.group(1)])
+        return {'statement': statement, 'error': error}
+    
+    def build_indexes(self, statements: List[str], concurrency: int = DEFAULT_INDEX_CONCURRENCY) -> List[Dict[str, Any]]:
+        """Run an index phase with up to `concurrency` builds at once; returns the failed statements
+        
+        Invalid leftovers of earlier runs are dropped first so the builds redo them. Superseded
+        indexes are only dropped once every build succeeded, so a replacement is always in place.
+        """
+        drops = [statement for statement in statements if statement.lstrip().upper().startswith('DROP')]
+        builds = [statement for statement in statements if statement not in drops]
+        names = [match.group(1) for match in map(INDEX_NAME_RE.search, builds) if match]
+        if names:
+            with self.connection(autocommit=True) as conn:
+                with conn.cursor() as cur:
+                    rebuilt = self.drop_invalid_indexes(cur, names)
+            if rebuilt:
+                print(f"🧹 Dropped {len(rebuilt)} invalid indexes left by earlier builds; rebuilding them")
+        
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            failed = [failure for failure in executor.map(self.build_index, builds) if failure]
+        if failed:
+            return failed + [{'statement': statement, 'error': 'skipped: an index build failed'}
+                             for statement in drops]
+        
+        with self.connection(autocommit=True) as conn:
+            with conn.cursor() as cur:
+                for statement in drops:
+                    self.execute(cur, statement)
+        return []
+    
+    def report(self) -> Dict[str, Any]:
+        return {
+            'started_at': self.started_at.isoformat(),
+            'lock_timeout': self.lock_timeout,
+            'statement_timeout': self.statement_timeout,
+            'elapsed_ms': round((datetime.now() - self.started_at).total_seconds() * 1000, 3),
+            'total_ms': round(sum(timing['duration_ms'] for timing in self.timings), 3),
+            'statements': self.timings,
+        }
+    
+    def write_report(self, path: str) -> None:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+    
+    def print_summary(self, limit: int = 5) -> None:
+        """Print the slowest statements and how many took ACCESS EXCLUSIVE locks on existing relations"""
+        print(f"⏱️ Ran {len(self.timings)} statements in {self.report()['elapsed_ms'] / 1000:.2f}s; slowest:")
+        for timing in sorted(self.timings, key=lambda t: t['duration_ms'], reverse=True)[:limit]:
+            print(f"   {timing['duration_ms']:>10.1f} ms  {timing['statement'][:80]}")
+        blocking = [t for t in self.timings
+                    if any(lock['mode'] == 'AccessExclusiveLock' and not lock['new_relation']
+                           for lock in t.get('locks', []))]
+        if blocking:
+            print(f"🔒 {len(blocking)} statements took ACCESS EXCLUSIVE locks on existing tables "
+                  f"(reads and writes on them wait until commit)")
+    
+    def close(self) -> None:
+        self.pool.closeall()
+
+class JsonStream:
+    """Reads the top-level array, or object of arrays, of a JSON file one element at a time
+    
+    Only the element being decoded is held in memory, so a dump of any size loads like NDJSON.
+    """
+    
+    def __init__(self, f: TextIO):
+        self.f = f
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+    
+    def fill(self) -> bool:
+        """Read more of the file into the buffer; False at the end of the file"""
+        if self.eof:
+            return False
+        chunk = self.f.read(LOAD_READ_SIZE)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+    
+    def peek(self) -> str:
+        """The next non-whitespace character, '' at the end of the file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self.fill():
+                return self.buffer[self.pos:self.pos + 1]
+    
+    def expect(self, char: str) -> None:
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at offset {self.pos} of the JSON stream")
+        self.pos += 1
+    
+    def value(self) -> Any:
+        """Decode the next value, reading until it is complete"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self.fill():
+                    raise
+                continue
+            # A number running up to the end of the buffer may continue in the next chunk ("1e" of "1e5")
+            if (isinstance(value, (int, float)) and not isinstance(value, bool)
+                    and not self.buffer[end:].lstrip('0123456789+-.eE') and self.fill()):
+                continue
+            self.pos = end
+            return value
+    
+    def elements(self) -> Iterator[Any]:
+        """The elements of the array starting at the current position"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ']':
+                self.pos += 1
+                return
+            self.expect(',')
+    
+    def members(self) -> Iterator[Tuple[str, Iterator[Any]]]:
+        """(key, elements) for an object of arrays; elements left unread are skipped on advancing"""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            elements = self.elements()
+            yield key, elements
+            for _ in elements:
+                pass
+            if self.peek() == '}':
+                self.pos += 1
+                return
+            self.expect(',')
+
+class BulkLoader:
+    """Streams documents into collection tables with COPY ... FROM STDIN, one transaction per batch
+    
+    Rows go through the tables' insert triggers as usual, so typed columns, search documents and
+    row counters stay in step. With skip_existing, batches are copied into a temporary staging
+    table and inserted with ON CONFLICT DO NOTHING, so a load can be rerun after a failure.
+    
+    Non-UUID source ids are mapped to UUIDs derived from table and id; relationships (table ->
+    field -> target slug, None for polymorphic fields) go through the same mapping, with
+    relation_tables resolving a slug to its table.
+    """
+    
+    def __init__(self, database_url: str, batch_size: int = DEFAULT_LOAD_BATCH_SIZE,
+                 skip_existing: bool = False, async_commit: bool = False,
+                 relationships: Optional[Dict[str, Dict[str, Optional[str]]]] = None,
+                 relation_tables: Optional[Dict[str, str]] = None):
+        self.batch_size = max(1, batch_size)
+        self.skip_existing = skip_existing
+        self.relationships = relationships or {}
+        self.relation_tables = relation_tables or {}
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        self.conn = psycopg2.connect(database_url)
+        with self.conn.cursor() as cur:
+            if async_commit:
+                # A lost batch is reloaded from the file; no need to wait for each commit to be flushed
+                cur.execute("SET synchronous_commit = off")
+            if skip_existing:
+                cur.execute(CREATE_LOAD_STAGING)
+        self.conn.commit()
+    
+    def resolve_table(self, table: str) -> Optional[str]:
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)::text", (table,))
+            row = cur.fetchone()
+        self.conn.commit()
+        return row[0] if row else None
+    
+    def document_id(self, table: str, source_id: Any) -> str:
+        """The id a source document gets: kept if it is a UUID, otherwise derived from it"""
+        try:
+            return str(uuid.UUID(str(source_id)))
+        except ValueError:
+            return str(uuid.uuid5(LOAD_ID_NAMESPACE, f"{table}/{source_id}"))
+    
+    def relation_table(self, slug: str) -> str:
+        return self.relation_tables.get(slug) or re.sub(r'([a-z0-9])([A-Z])', r'\1_\2', slug).replace('-', '_').lower()
+    
+    def reference(self, slug: Optional[str], value: Any) -> Any:
+        """A relationship value with its ids mapped like the documents they point at"""
+        if isinstance(value, list):
+            return [self.reference(slug, item) for item in value]
+        if isinstance(value, dict):
+            if 'relationTo' in value and 'value' in value:
+                return {**value, 'value': self.reference(value['relationTo'], value['value'])}
+            if slug and value.get('id') is not None:
+                # A populated document
+                return {**value, 'id': self.document_id(self.relation_table(slug), value['id'])}
+            return value
+        if not slug or value is None or isinstance(value, bool) or value == '':
+            return value
+        return self.document_id(self.relation_table(slug), value)
+    
+    def row(self, table: str, record: Dict[str, Any]) -> str:
+        """One COPY text-format line, with the document's id and relationships mapped to UUIDs"""
+        source_id = record.get('id')
+        row_id = str(uuid.uuid4()) if source_id is None else self.document_id(table, source_id)
+        relationships = self.relationships.get(table, {})
+        if relationships:
+            record = {key: self.reference(relationships[key], value) if key in relationships else value
+                      for key, value in record.items()}
+        created_at = record.get('createdAt') or record.get('created_at') or self.loaded_at
+        updated_at = record.get('updatedAt') or record.get('updated_at') or created_at
+        values = (row_id, str(created_at), str(updated_at), json.dumps(record, ensure_ascii=False))
+        return '\t'.join(value.translate(COPY_ESCAPES) for value in values) + '\n'
+    
+    def copy_batch(self, table: str, lines: List[str]) -> int:
+        """COPY one batch and commit it; returns the rows written"""
+        columns = ', '.join(LOAD_COLUMNS)
+        buffer = io.StringIO(''.join(lines))
+        try:
+            with self.conn.cursor() as cur:
+                if self.skip_existing:
+                    cur.copy_expert(f"COPY bulk_load_staging ({columns}) FROM STDIN", buffer)
+                    cur.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM bulk_load_staging "
+                                f"ON CONFLICT DO NOTHING")
+                else:
+                    cur.copy_expert(f"COPY {table} ({columns}) FROM STDIN", buffer)
+                written = cur.rowcount
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        return written if written >= 0 else len(lines)
+    
+    def load(self, table: str, records: Iterable[Dict[str, Any]]) -> Tuple[int, int]:
+        """Load records into table in batches; returns (rows read, rows written)"""
+        read = written = 0
+        rows = (self.row(table, record) for record in records)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                return read, written
+            written += self.copy_batch(table, batch)
+            read += len(batch)
+    
+    def is_partitioned(self, table: str) -> bool:
+        with self.conn.cursor() as cur:
+            cur.execute(PARTITIONED_TABLE_QUERY, (table,))
+            partitioned = cur.fetchone()[0]
+        self.conn.commit()
+        return partitioned
+    
+    def deferrable_indexes(self, table: str) -> List[Tuple[str, str]]:
+        with self.conn.cursor() as cur:
+            cur.execute(DEFERRABLE_INDEXES_QUERY, (table,))
+            indexes = cur.fetchall()
+        self.conn.commit()
+        return indexes
+    
+    def drop_indexes(self, names: List[str]) -> None:
+        try:
+            with self.conn.cursor() as cur:
+                for name in names:
+                    cur.execute(f"DROP INDEX IF EXISTS {name}")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+    
+    def close(self) -> None:
+        self.conn.close()
+
+# Compact mode: the collection table templates, as format() strings over the registry columns.
+# The search column is left out when search_documents holds the search vectors.
+COMPACT_SEARCH_COLUMN = """    search_vector TSVECTOR GENERATED ALWAYS AS (
+        to_tsvector('english', COALESCE(data->>'title', '') || ' ' || 
+                               COALESCE(data->>'name', '') || ' ' ||
+                               COALESCE(data->>'description', '') || ' ' ||
+                               COALESCE(data->>'content', ''))
+    ) STORED,
+"""
+
+COMPACT_TABLE_DDL = f"""
+CREATE TABLE IF NOT EXISTS %1$I (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    data JSONB NOT NULL DEFAULT '{{}}'::jsonb,
+%2$s{COMPACT_SEARCH_COLUMN}    CONSTRAINT %3$I CHECK (jsonb_typeof(data) = 'object')
+)"""
+
+COMPACT_PARTITIONED_DDL = """
+CREATE TABLE IF NOT EXISTS %1$I (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    data JSONB NOT NULL DEFAULT '{}'::jsonb,
+%2$s    CONSTRAINT %3$I CHECK (jsonb_typeof(data) = 'object'),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at)"""
+
+class SchemaGenerator(CollectionGenerator):
+    script_path = __file__
+
+    def __init__(self, diff_mode: bool = False, use_cache: bool = True,
+                 output: Optional[str] = None, stream_to_db: bool = False, typed_columns: bool = False,
+                 index_report: bool = False, search_index: bool = False, row_counters: bool = False,
+                 lock_timeout: str = DEFAULT_LOCK_TIMEOUT, statement_timeout: str = DEFAULT_STATEMENT_TIMEOUT,
+                 concurrent_indexes: bool = False, index_concurrency: int = DEFAULT_INDEX_CONCURRENCY,
+                 migration_units: bool = False, unit_concurrency: int = DEFAULT_UNIT_CONCURRENCY,
+                 ledger: bool = True, compact: bool = False, storage_profiles: bool = False,
+                 data_gin: Optional[str] = None, partition_logs: bool = False):
         self.collections_info = self.load_collections_info()
         self.schema_statements = []
         self.migration_statements = []
+        self.diff_mode = diff_mode
+        self.use_cache = use_cache
+        self.output = output
+        self.stream_to_db = stream_to_db
+        self.typed_columns = typed_columns
+        self.index_report = index_report
+        self.search_index = search_index
+        self.row_counters = row_counters
+        self.lock_timeout = lock_timeout
+        self.statement_timeout = statement_timeout
+        self.concurrent_indexes = concurrent_indexes
+        self.index_concurrency = index_concurrency
+        self.migration_units = migration_units
+        self.unit_concurrency = unit_concurrency
+        self.ledger = ledger
+        self.compact = compact
+        self.storage_profiles = storage_profiles
+        self.data_gin = data_gin
+        self.partition_logs = partition_logs
+        self.cache: Optional[GenerationCache] = None
         
     def load_collections_info(self) -> Dict[str, Any]:
         """Load collection information from JSON file"""
@@ -31,25 +647,79 @@ class SchemaGenerator:
             print("❌ collections-info.json not found. Run generate-all-types.js first.")
             return {"collections": []}
     
-    def pascale_to_snake(self, name: str) -> str:
-        """Convert PascalCase to snake_case"""
-        # Handle special cases first
-        name = re.sub('([a-z0-9])([A-Z])', r'\1_\2', name)
-        return name.lower()
+    def generation_options(self) -> Dict[str, Any]:
+        """Options that change the generated SQL"""
+        return {'typed_columns': self.typed_columns, 'search_index': self.search_index,
+                'row_counters': self.row_counters, 'concurrent_indexes': self.concurrent_indexes,
+                'compact': self.compact, 'storage_profiles': self.storage_profiles, 'data_gin': self.data_gin,
+                'partition_logs': self.partition_logs}
     
-    def generate_base_table_schema(self, table_name: str) -> str:
-        """Generate base table schema with common fields"""
-        return f"""
--- Table: {table_name}
-CREATE TABLE IF NOT EXISTS {table_name} (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    def schema_filename(self, inputs_hash: str) -> str:
+        """Deterministic migration filename for a set of inputs"""
+        return f"schema_migration_{inputs_hash[:12]}.sql"
     
-    -- JSON field for flexible data storage
-    data JSONB NOT NULL DEFAULT '{{}}'::jsonb,
+    def index_phase_filename(self, schema_file: str) -> str:
+        base = schema_file[:-len('.sql')] if schema_file.endswith('.sql') else schema_file
+        return base + '_indexes.sql'
+    
+    def units_directory(self, schema_file: str) -> str:
+        base = schema_file[:-len('.sql')] if schema_file.endswith('.sql') else schema_file
+        return base + '_units'
+    
+    def output_files(self, inputs_hash: str) -> List[str]:
+        schema_file = self.schema_filename(inputs_hash)
+        files = [schema_file]
+        if self.concurrent_indexes:
+            files.append(self.index_phase_filename(schema_file))
+        if self.migration_units:
+            files.append(os.path.join(self.units_directory(schema_file), UNIT_MANIFEST))
+        return files
+    
+    def plan_table_indexes(self, table_name: str, collection: Optional[str] = None) -> Dict[str, Any]:
+        """Fixed indexes plus field-driven ones, run through the index planner"""
+        specs = [
+            index_spec(table_name, table_name, 'created_at', ['created_at']),
+            index_spec(table_name, table_name, 'updated_at', ['updated_at']),
+            index_spec(table_name, table_name, 'data_gin', ['data'], method='gin'),
+        ]
+        if not self.search_index:
+            specs.insert(2, index_spec(table_name, table_name, 'search', ['search_vector'], method='gin'))
+        fields = load_collection_fields(collection) if collection else []
+        specs += field_index_specs(table_name, table_name, fields, self.typed_columns_for(collection))
+        partitioned = self.is_partitioned(table_name)
+        primary_key = ['id', 'created_at'] if partitioned else ['id']
+        implicit = [{'name': f"{table_name}_pkey", 'method': 'btree', 'keys': primary_key, 'unique': True,
+                     'where': None, 'implicit': True}]
+        return plan_indexes(table_name, specs, implicit, data_gin=self.data_gin, partitioned=partitioned)
+    
+    def print_index_report(self) -> None:
+        """Print the estimated index cost of every collection table"""
+        print("\n📐 Index plan (estimates)")
+        print(format_index_report(self.index_reports()))
     
-    -- Search optimization
+    def generate_base_table_schema(self, table_name: str, collection: Optional[str] = None) -> str:
+        """Generate base table schema with common fields"""
+        if self.compact:
+            return self.generate_compact_table_schema(table_name, collection)
+        typed = render_typed_columns(table_name, self.typed_columns_for(collection), table_name,
+                                     updated_at_trigger=f"trigger_update_{table_name}_updated_at")
+        index_plan = render_index_plan(self.plan_table_indexes(table_name, collection),
+                                       deferred=self.concurrent_indexes and self.can_index_concurrently(table_name))
+        search_sync = (render_search_document_sync(table_name, table_name)
+                       if self.search_index and not is_append_only(table_name) else '')
+        counters = render_row_counter_triggers(table_name, table_name) if self.row_counters else ''
+        partitioned = self.is_partitioned(table_name)
+        storage = render_storage_profile(table_name, table_name, partitioned) if self.storage_profiles else ''
+        search_upgrade = self.render_search_column_drop(table_name)
+        if partitioned:
+            # Range-partitioned by created_at: the primary key has to include the partition key
+            id_column = "id UUID NOT NULL DEFAULT gen_random_uuid(),"
+            search_column = ""
+            table_options = ",\n    PRIMARY KEY (id, created_at)\n) PARTITION BY RANGE (created_at);"
+            partitions = render_table_partitions(table_name)
+        else:
+            id_column = "id UUID PRIMARY KEY DEFAULT gen_random_uuid(),"
+            search_column = "" if self.search_index else """    -- Search optimization
     search_vector TSVECTOR GENERATED ALWAYS AS (
         to_tsvector('english', COALESCE(data->>'title', '') || ' ' || 
                                COALESCE(data->>'name', '') || ' ' ||
@@ -57,16 +727,24 @@ CREATE TABLE IF NOT EXISTS {table_name} (
                                COALESCE(data->>'content', ''))
     ) STORED,
     
-    -- Common indexes
-    CONSTRAINT {table_name}_data_check CHECK (jsonb_typeof(data) = 'object')
-);
-
+"""
+            table_options = "\n);"
+            partitions = ""
+        return f"""
+-- Table: {table_name}
+CREATE TABLE IF NOT EXISTS {table_name} (
+    {id_column}
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    
+    -- JSON field for flexible data storage
+    data JSONB NOT NULL DEFAULT '{{}}'::jsonb,
+{typed['columns']}    
+{search_column}    -- Common indexes
+    CONSTRAINT {table_name}_data_check CHECK (jsonb_typeof(data) = 'object'){table_options}
+{partitions}{storage}{typed['upgrade']}{search_upgrade}
 -- Indexes for {table_name}
-CREATE INDEX IF NOT EXISTS idx_{table_name}_created_at ON {table_name}(created_at);
-CREATE INDEX IF NOT EXISTS idx_{table_name}_updated_at ON {table_name}(updated_at);
-CREATE INDEX IF NOT EXISTS idx_{table_name}_search ON {table_name} USING gin(search_vector);
-CREATE INDEX IF NOT EXISTS idx_{table_name}_data_gin ON {table_name} USING gin(data);
-
+{index_plan}
 -- Update trigger for updated_at
 CREATE OR REPLACE FUNCTION update_updated_at_{table_name}()
 RETURNS TRIGGER AS $$
@@ -81,8 +759,38 @@ CREATE TRIGGER trigger_update_{table_name}_updated_at
     BEFORE UPDATE ON {table_name}
     FOR EACH ROW
     EXECUTE FUNCTION update_updated_at_{table_name}();
-"""
+{typed['trigger']}{search_sync}{counters}"""
 
+    def generate_compact_table_schema(self, table_name: str, collection: Optional[str] = None) -> str:
+        """What stays per table in compact mode: the table and its updated_at trigger come from the registry"""
+        typed = render_typed_columns(table_name, self.typed_columns_for(collection), table_name,
+                                     updated_at_trigger=f"trigger_update_{table_name}_updated_at")
+        index_plan = render_index_plan(self.plan_table_indexes(table_name, collection),
+                                       deferred=self.concurrent_indexes and self.can_index_concurrently(table_name))
+        search_sync = (render_search_document_sync(table_name, table_name)
+                       if self.search_index and not is_append_only(table_name) else '')
+        counters = render_row_counter_triggers(table_name, table_name) if self.row_counters else ''
+        storage = (render_storage_profile(table_name, table_name, self.is_partitioned(table_name))
+                   if self.storage_profiles else '')
+        return f"""
+-- Table: {table_name} (created from collection_registry)
+{storage}{typed['upgrade']}{self.render_search_column_drop(table_name)}
+-- Indexes for {table_name}
+{index_plan}{typed['trigger']}{search_sync}{counters}"""
+    
+    def generate_registry_tables(self) -> str:
+        """Compact mode: the collection registry and the DO block that creates every table from it"""
+        collections = {}
+        for collection in self.collections_info.get('collections', []):
+            collections.setdefault(self.pascale_to_snake(collection), collection)
+        rows = [{'table': table, 'collection': collection, 'append_only': is_append_only(table),
+                 'extra_columns': render_typed_columns(table, self.typed_columns_for(collection), table)['columns']}
+                for table, collection in collections.items()]
+        table_ddl = COMPACT_TABLE_DDL.replace(COMPACT_SEARCH_COLUMN, '') if self.search_index else COMPACT_TABLE_DDL
+        return render_collection_registry(rows) + render_registry_tables(
+            table_ddl, COMPACT_PARTITIONED_DDL if self.partition_logs else None,
+            'trigger_update_%s_updated_at', 'update_updated_at_%s')
+    
     def generate_relationship_tables(self) -> List[str]:
         """Generate tables for managing relationships between collections"""
         relationship_tables = []
@@ -113,35 +821,44 @@ CREATE INDEX IF NOT EXISTS idx_relationships_type ON collection_relationships(re
     
     def generate_collection_schemas(self) -> List[str]:
         """Generate schemas for all collections"""
-        schemas = []
+        return list(self.iter_collection_schemas())
+    
+    def iter_collection_schemas(self) -> Iterator[str]:
+        """Yield the schema of each collection as it is rendered"""
         collections = self.collections_info.get('collections', [])
         
         print(f"🔨 Generating schemas for {len(collections)} collections...")
         
         for collection in collections:
             table_name = self.pascale_to_snake(collection)
-            schema = self.generate_base_table_schema(table_name)
-            schemas.append(schema)
-            print(f"✅ Generated schema for {collection} -> {table_name}")
+            if self.cache is None:
+                schema = self.generate_base_table_schema(table_name, collection)
+                print(f"✅ Generated schema for {collection} -> {table_name}")
+            else:
+                key = f"{table_name}.sql"
+                schema = self.cache.render(key, self.collection_fingerprint(collection),
+                                           lambda: self.generate_base_table_schema(table_name, collection))
+                if key in self.cache.changed:
+                    print(f"✅ Generated schema for {collection} -> {table_name}")
+            yield schema
         
-        return schemas
+        if self.cache is not None:
+            print(f"♻️ Re-rendered {len(self.cache.changed)} collections, reused {len(collections) - len(self.cache.changed)} from cache")
     
-    def generate_utility_functions(self) -> str:
-        """Generate utility functions for database operations"""
+    def generate_indexed_search_function(self) -> str:
+        """Generate search_all_collections over the search_documents table (search-index mode)"""
         return """
--- Utility Functions
--- =================
+-- Cross-collection Search
+-- =======================
 
--- Function to safely get JSONB field with default
-CREATE OR REPLACE FUNCTION safe_jsonb_get(data JSONB, key TEXT, default_val TEXT DEFAULT NULL)
-RETURNS TEXT AS $$
-BEGIN
-    RETURN COALESCE(data->>key, default_val);
-END;
-$$ LANGUAGE plpgsql IMMUTABLE;
+-- Replaces the PL/pgSQL version that ran one dynamic query per table
+DROP FUNCTION IF EXISTS search_all_collections(TEXT, TEXT[]);
 
--- Function to search across all collections
-CREATE OR REPLACE FUNCTION search_all_collections(search_term TEXT, collection_filter TEXT[] DEFAULT NULL)
+CREATE OR REPLACE FUNCTION search_all_collections(
+    search_term TEXT,
+    collection_filter TEXT[] DEFAULT NULL,
+    limit_results INTEGER DEFAULT 50
+)
 RETURNS TABLE(
     collection_name TEXT,
     id UUID,
@@ -149,112 +866,107 @@ RETURNS TABLE(
     snippet TEXT,
     rank REAL
 ) AS $$
-DECLARE
-    table_name TEXT;
-    query TEXT;
-    collections TEXT[] := ARRAY[
-        'commerce', 'coupons', 'gift_cards', 'invoices', 'orders', 'payment_methods', 
-        'products', 'promotions', 'returns', 'shipping_methods', 'blog_posts', 'content',
-        'faq', 'gallery', 'media', 'media_folders', 'navigation', 'navigation_menus',
-        'pages_main', 'pages', 'redirects_main', 'redirects', 'seo_settings', 'tags',
-        'appointments_main', 'cancellations', 'chatbot', 'chat_conversations', 'chat_messages',
-        'contacts', 'customer_notes', 'customers_main', 'customers', 'customer_tags',
-        'email_campaigns', 'loyalty_program', 'reviews', 'subscriptions', 'testimonials',
-        'clock_records', 'commissions', 'staff_roles', 'staff_schedules', 'stylists',
-        'time_off_requests', 'appointments', 'audit_logs', 'business_documentation',
-        'chatbot_logs', 'documentation', 'documentation_templates', 'documentation_workflows',
-        'editor_plugins', 'editor_templates', 'editor_themes', 'email_logs', 'events',
-        'event_tracking', 'feature_flags', 'integrations', 'inventory', 'locations',
-        'maintenance_requests', 'notifications', 'page_views', 'push_notifications',
-        'recurring_appointments', 'resources', 'roles_permissions', 'service_packages',
-        'services', 'settings', 'site_sections', 'tenants', 'transactions', 'users',
-        'wait_list', 'webhook_logs'
-    ];
-BEGIN
-    FOR table_name IN SELECT unnest(collections) LOOP
-        IF collection_filter IS NULL OR table_name = ANY(collection_filter) THEN
-            query := format('
-                SELECT %L as collection_name, 
-                       id, 
-                       COALESCE(safe_jsonb_get(data, ''title''), safe_jsonb_get(data, ''name''), ''Untitled'') as title,
-                       ts_headline(''english'', COALESCE(safe_jsonb_get(data, ''description''), safe_jsonb_get(data, ''content''), ''''), plainto_tsquery(%L)) as snippet,
-                       ts_rank(search_vector, plainto_tsquery(%L)) as rank
-                FROM %I 
-                WHERE search_vector @@ plainto_tsquery(%L)
-                ORDER BY rank DESC
-                LIMIT 10
-            ', table_name, search_term, search_term, table_name, search_term);
-            
-            BEGIN
-                RETURN QUERY EXECUTE query;
-            EXCEPTION 
-                WHEN undefined_table THEN
-                    -- Skip tables that don't exist yet
-                    CONTINUE;
-            END;
-        END IF;
-    END LOOP;
-END;
-$$ LANGUAGE plpgsql;
+    WITH q AS (
+        SELECT plainto_tsquery('english', search_term) AS query
+    ),
+    top_hits AS (
+        SELECT d.collection AS hit_collection, d.id AS hit_id, d.title AS hit_title, d.excerpt AS hit_excerpt,
+               ts_rank(d.search_vector, q.query) AS hit_rank
+        FROM search_documents d, q
+        WHERE d.search_vector @@ q.query
+          AND (collection_filter IS NULL OR d.collection = ANY(collection_filter))
+        ORDER BY hit_rank DESC
+        LIMIT limit_results
+    )
+    SELECT top_hits.hit_collection,
+           top_hits.hit_id,
+           top_hits.hit_title,
+           ts_headline('english', COALESCE(top_hits.hit_excerpt, ''), q.query),
+           top_hits.hit_rank
+    FROM top_hits, q
+    ORDER BY top_hits.hit_rank DESC;
+$$ LANGUAGE sql STABLE;
+"""
+    
+    def generate_search_function(self) -> str:
+        """Generate a statically planned search over every collection table
+        
+        Each branch keeps its own top-N so the outer sort only sees a few rows per table, the
+        collection filter is a one-time filter per branch, and ts_headline runs on the final
+        rows only. The tables must exist before this is created, so it follows them.
+        """
+        if self.search_index:
+            return self.generate_indexed_search_function()
+        
+        branches = "\n        UNION ALL\n".join(
+            f"""        (SELECT '{table}'::text AS hit_collection, t.id AS hit_id, t.data AS hit_data,
+                ts_rank(t.search_vector, q.query) AS hit_rank
+         FROM {table} t, q
+         WHERE (collection_filter IS NULL OR '{table}' = ANY(collection_filter))
+           AND t.search_vector @@ q.query
+         ORDER BY hit_rank DESC
+         LIMIT limit_results)"""
+            for table in self.search_tables()
+        )
+        return f"""
+-- Cross-collection Search
+-- =======================
 
--- Function to get collection statistics
-CREATE OR REPLACE FUNCTION get_collection_stats()
+-- Replaces the PL/pgSQL version that ran one dynamic query per table
+DROP FUNCTION IF EXISTS search_all_collections(TEXT, TEXT[]);
+
+CREATE OR REPLACE FUNCTION search_all_collections(
+    search_term TEXT,
+    collection_filter TEXT[] DEFAULT NULL,
+    limit_results INTEGER DEFAULT 50
+)
 RETURNS TABLE(
     collection_name TEXT,
-    record_count BIGINT,
-    avg_data_size NUMERIC,
-    last_updated TIMESTAMPTZ
+    id UUID,
+    title TEXT,
+    snippet TEXT,
+    rank REAL
 ) AS $$
-DECLARE
-    table_name TEXT;
-    query TEXT;
-    collections TEXT[] := ARRAY[
-        'commerce', 'coupons', 'gift_cards', 'invoices', 'orders', 'payment_methods', 
-        'products', 'promotions', 'returns', 'shipping_methods', 'blog_posts', 'content',
-        'faq', 'gallery', 'media', 'media_folders', 'navigation', 'navigation_menus',
-        'pages_main', 'pages', 'redirects_main', 'redirects', 'seo_settings', 'tags',
-        'appointments_main', 'cancellations', 'chatbot', 'chat_conversations', 'chat_messages',
-        'contacts', 'customer_notes', 'customers_main', 'customers', 'customer_tags',
-        'email_campaigns', 'loyalty_program', 'reviews', 'subscriptions', 'testimonials',
-        'clock_records', 'commissions', 'staff_roles', 'staff_schedules', 'stylists',
-        'time_off_requests', 'appointments', 'audit_logs', 'business_documentation',
-        'chatbot_logs', 'documentation', 'documentation_templates', 'documentation_workflows',
-        'editor_plugins', 'editor_templates', 'editor_themes', 'email_logs', 'events',
-        'event_tracking', 'feature_flags', 'integrations', 'inventory', 'locations',
-        'maintenance_requests', 'notifications', 'page_views', 'push_notifications',
-        'recurring_appointments', 'resources', 'roles_permissions', 'service_packages',
-        'services', 'settings', 'site_sections', 'tenants', 'transactions', 'users',
-        'wait_list', 'webhook_logs'
-    ];
+    WITH q AS (
+        SELECT plainto_tsquery('english', search_term) AS query
+    ),
+    hits AS (
+{branches}
+    ),
+    top_hits AS (
+        SELECT * FROM hits ORDER BY hit_rank DESC LIMIT limit_results
+    )
+    SELECT top_hits.hit_collection,
+           top_hits.hit_id,
+           COALESCE(top_hits.hit_data->>'title', top_hits.hit_data->>'name', 'Untitled'),
+           ts_headline('english',
+                       COALESCE(top_hits.hit_data->>'description', top_hits.hit_data->>'content', ''),
+                       q.query),
+           top_hits.hit_rank
+    FROM top_hits, q
+    ORDER BY top_hits.hit_rank DESC;
+$$ LANGUAGE sql STABLE;
+"""
+    
+    def generate_utility_functions(self) -> str:
+        """Generate utility functions for database operations"""
+        return """
+-- Utility Functions
+-- =================
+
+-- Function to safely get JSONB field with default
+CREATE OR REPLACE FUNCTION safe_jsonb_get(data JSONB, key TEXT, default_val TEXT DEFAULT NULL)
+RETURNS TEXT AS $$
 BEGIN
-    FOR table_name IN SELECT unnest(collections) LOOP
-        query := format('
-            SELECT %L as collection_name,
-                   COUNT(*) as record_count,
-                   AVG(octet_length(data::text)) as avg_data_size,
-                   MAX(updated_at) as last_updated
-            FROM %I
-        ', table_name, table_name);
-        
-        BEGIN
-            RETURN QUERY EXECUTE query;
-        EXCEPTION 
-            WHEN undefined_table THEN
-                -- Return zero stats for missing tables
-                RETURN QUERY SELECT table_name, 0::BIGINT, 0::NUMERIC, NULL::TIMESTAMPTZ;
-        END;
-    END LOOP;
+    RETURN COALESCE(data->>key, default_val);
 END;
-$$ LANGUAGE plpgsql;
-"""
+$$ LANGUAGE plpgsql IMMUTABLE;
+""" + render_collection_stats(self.collection_tables(), counters=self.row_counters)
 
-    def save_schema_file(self, schemas: List[str], relationships: List[str], utilities: str) -> str:
-        """Save all schemas to a single migration file"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"schema_migration_{timestamp}.sql"
-        
-        content = f"""-- ModernMen Payload Collections Schema Migration
--- Generated at: {datetime.now().isoformat()}
+    def iter_prelude_chunks(self, utilities: str, inputs_hash: str) -> Iterator[str]:
+        """Yield what every table depends on: extensions, session settings and shared functions"""
+        yield f"""-- ModernMen Payload Collections Schema Migration
+-- Content hash: {inputs_hash}
 -- Collections: {len(self.collections_info.get('collections', []))}
 
 -- Enable UUID extension
@@ -264,24 +976,56 @@ CREATE EXTENSION IF NOT EXISTS "pg_trgm";
 -- Set timezone
 SET timezone = 'UTC';
 
-{utilities}
+"""
+        
+        yield utilities
+        
+        counter_status = "COALESCE(r.data->>'status', 'draft')" if self.row_counters else None
+        if self.partition_logs:
+            yield render_partition_functions(counter_status=counter_status)
+        
+        if self.typed_columns:
+            yield render_typed_casts()
+        
+        if self.search_index:
+            yield render_search_documents()
+        
+        if self.row_counters:
+            yield render_row_counters(counter_status, self.collection_tables())
+        
+        if self.compact:
+            yield render_set_updated_at()
+    
+    def iter_migration_chunks(self, schemas: Iterable[str], relationships: Iterable[str], utilities: str,
+                              inputs_hash: Optional[str] = None) -> Iterator[str]:
+        """Yield the migration piece by piece; every chunk holds complete statements"""
+        inputs_hash = inputs_hash or self.compute_inputs_hash()
+        
+        yield from self.iter_prelude_chunks(utilities, inputs_hash)
+        
+        yield """
 
 -- Collection Tables
 -- =================
 """
         
+        if self.compact:
+            yield self.generate_registry_tables()
+        
         for schema in schemas:
-            content += schema + "\n"
+            yield schema + "\n"
         
-        content += """
+        yield """
 -- Relationship Tables
 -- ===================
 """
         
         for relationship in relationships:
-            content += relationship + "\n"
+            yield relationship + "\n"
+        
+        yield self.generate_search_function()
         
-        content += """
+        yield """
 -- Final Setup
 -- ============
 
@@ -294,12 +1038,652 @@ SET timezone = 'UTC';
 
 COMMIT;
 """
+    
+    def migration_units_for(self, schemas: Iterable[str], relationships: Iterable[str], utilities: str,
+                            inputs_hash: str) -> List[Dict[str, Any]]:
+        """Split the migration into units that commit on their own
         
-        with open(filename, 'w') as f:
-            f.write(content)
+        Collection tables only depend on the prelude and collection_relationships, so they can be
+        applied side by side; the search function reads every table and goes last.
+        """
+        units = [migration_unit('prelude', ''.join(self.iter_prelude_chunks(utilities, inputs_hash))),
+                 migration_unit('relationships', '\n'.join(relationships), ['prelude'])]
+        table_dependencies = ['prelude', 'relationships']
+        if self.compact:
+            # The registry creates every table; what is left per table builds on it
+            units.append(migration_unit('registry', self.generate_registry_tables(), table_dependencies))
+            table_dependencies = ['registry']
+        tables = {}
+        for collection, schema in zip(self.collections_info.get('collections', []), schemas):
+            tables.setdefault(self.pascale_to_snake(collection), schema)
+        units += [migration_unit(f"table_{table}", schema, table_dependencies) for table, schema in tables.items()]
+        units.append(migration_unit('search', self.generate_search_function(),
+                                    [f"table_{table}" for table in tables]))
+        return units
+    
+    def iter_migration_statements(self, chunks: Iterable[str]) -> Iterator[str]:
+        """Yield individual statements from a stream of migration chunks"""
+        for chunk in chunks:
+            yield from self.split_sql_statements(chunk)
+    
+    def save_schema_file(self, schemas: Iterable[str], relationships: Iterable[str], utilities: str,
+                         inputs_hash: Optional[str] = None) -> str:
+        """Stream all schemas into a single migration file named after the content hash of its inputs"""
+        inputs_hash = inputs_hash or self.compute_inputs_hash()
+        filename = self.schema_filename(inputs_hash)
+        if self.migration_units:
+            schemas = list(schemas)
+            relationships = list(relationships)
+        
+        with open(filename, 'w', encoding='utf-8') as f:
+            for chunk in self.iter_migration_chunks(schemas, relationships, utilities, inputs_hash):
+                f.write(chunk)
+        if self.concurrent_indexes:
+            with open(self.index_phase_filename(filename), 'w', encoding='utf-8') as f:
+                f.write(render_index_phase(self.index_phase_tables(), inputs_hash))
+        if self.migration_units:
+            write_migration_units(self.units_directory(filename),
+                                  self.migration_units_for(schemas, relationships, utilities, inputs_hash),
+                                  inputs_hash, self.UNIT_SETTINGS)
         
         return filename
     
+    def write_migration_to_stdout(self) -> None:
+        """Stream the migration to stdout, moving progress output to stderr"""
+        out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            if not self.collections_info.get('collections'):
+                print("❌ No collections found. Run the type generation first.")
+                return
+            if self.use_cache:
+                self.cache = GenerationCache('schema-generator')
+            inputs_hash = self.compute_inputs_hash()
+            chunks = self.iter_migration_chunks(self.iter_collection_schemas(), self.generate_relationship_tables(),
+                                                self.generate_utility_functions(), inputs_hash)
+            for chunk in chunks:
+                out.write(chunk)
+            if self.concurrent_indexes:
+                # Follows the migration's COMMIT, so psql runs each build in its own transaction
+                out.write('\n' + render_index_phase(self.index_phase_tables(), inputs_hash))
+        out.flush()
+    
+    def stream_to_database(self, inputs_hash: str) -> bool:
+        """Execute statements against the database as they are generated, in one transaction"""
+        database_url = os.getenv('DATABASE_URL')
+        if not database_url:
+            print("⚠️ DATABASE_URL not found in environment. Nothing was applied.")
+            return False
+        if psycopg2 is None:
+            print("❌ Streaming to the database requires psycopg2.")
+            return False
+        
+        chunks = self.iter_migration_chunks(self.iter_collection_schemas(), self.generate_relationship_tables(),
+                                            self.generate_utility_functions(), inputs_hash)
+        index_statements = ([statement for _, statements in self.index_phase_tables() for statement in statements]
+                            if self.concurrent_indexes else None)
+        return self.apply_with_runner(database_url, self.iter_migration_statements(chunks),
+                                      self.timing_report_filename(self.schema_filename(inputs_hash)),
+                                      index_statements)
+    
+    def timing_report_filename(self, migration_file: str) -> str:
+        return os.path.splitext(migration_file)[0] + '_timings.json'
+    
+    def apply_with_runner(self, database_url: str, statements: Iterable[str], report_file: str,
+                          index_statements: Optional[List[str]] = None,
+                          manifest: Optional[Dict[str, Any]] = None) -> bool:
+        """Apply statements (or the units of a manifest) through a MigrationRunner, then the index
+        phase if one is given, and write and summarise the timing report"""
+        runner = MigrationRunner(database_url, self.lock_timeout, self.statement_timeout,
+                                 max_connections=max(1, self.index_concurrency, self.unit_concurrency),
+                                 settings=manifest['settings'] if manifest else None)
+        failed_units, failed = [], []
+        try:
+            applied = runner.apply(statement for statement in statements
+                                   if self.classify_statement(statement)[0] != 'transaction')
+            if manifest:
+                units = [{'name': unit['name'], 'depends_on': unit['depends_on'],
+                          'checksum': unit['checksum'] if self.ledger else None,
+                          'statements': [statement for statement in self.split_sql_statements(unit['sql'])
+                                         if self.classify_statement(statement)[0] != 'transaction']}
+                         for unit in manifest['units']]
+                recorded = runner.recorded_checksums() if self.ledger else {}
+                unchanged = sum(1 for unit in units if unit['checksum'] and recorded.get(unit['name']) == unit['checksum'])
+                if unchanged:
+                    print(f"⏭️ Skipping {unchanged} of {len(units)} units, already applied with the same checksum")
+                if len(units) - unchanged > 1:
+                    print(f"🧩 Applying {len(units) - unchanged} migration units, {self.unit_concurrency} at a time...")
+                failed_units = runner.apply_units(units, self.unit_concurrency, recorded)
+                applied = sum(1 for timing in runner.timings if 'error' not in timing)
+            if index_statements and not failed_units:
+                print(f"🏗️ Building {len(index_statements)} indexes concurrently, "
+                      f"{self.index_concurrency} at a time...")
+                failed = runner.build_indexes(index_statements, self.index_concurrency)
+        except Exception as e:
+            applied = sum(1 for timing in runner.timings if 'error' not in timing)
+            print(f"❌ Database sync failed after {applied} statements: {str(e).strip()}")
+            if getattr(e, 'pgcode', None) == '55P03':
+                print(f"💡 A lock wait exceeded lock_timeout={self.lock_timeout}; retry when the blocking "
+                      f"transaction has finished, or raise --lock-timeout")
+            return False
+        finally:
+            runner.write_report(report_file)
+            runner.close()
+        
+        runner.print_summary()
+        if failed_units:
+            for failure in failed_units:
+                print(f"❌ Migration {failure['statement']} failed: {failure['error']}")
+            if any(failure.get('pgcode') == '55P03' for failure in failed_units):
+                print(f"💡 A lock wait exceeded lock_timeout={self.lock_timeout}; retry when the blocking "
+                      f"transaction has finished, or raise --lock-timeout")
+            print("💡 Units that committed stay applied; their statements are idempotent, so rerun the manifest")
+            return False
+        for failure in failed:
+            print(f"❌ Index build failed: {failure['statement'][:100]}\n   {failure['error']}")
+        if failed:
+            print("💡 Rerun the index phase; invalid indexes from failed builds are dropped and rebuilt")
+            return False
+        print(f"✅ Applied {applied} statements; timing report: {report_file}")
+        return True
+    
+    def read_index_phase(self, path: str) -> List[str]:
+        with open(path, 'r', encoding='utf-8') as f:
+            return self.split_sql_statements(f.read())
+    
+    def build_index_file(self, path: str) -> bool:
+        """Run an index phase file (from either generator) with the parallel builder"""
+        database_url = os.getenv('DATABASE_URL')
+        if not database_url:
+            print("⚠️ DATABASE_URL not found in environment. Nothing was built.")
+            return False
+        if psycopg2 is None:
+            print(f"❌ The parallel index builder requires psycopg2; run psql $DATABASE_URL -f {path} instead.")
+            return False
+        return self.apply_with_runner(database_url, [], self.timing_report_filename(path), self.read_index_phase(path))
+    
+    def read_load_file(self, f: TextIO, path: str, table: Optional[str]) -> Iterator[Tuple[str, Iterable[Dict[str, Any]]]]:
+        """(table, records) pairs from an NDJSON file, a JSON list, or a JSON object mapping
+        collection names to lists, like seed-data.json; all three are streamed from f
+        
+        Each pair's records have to be consumed (or abandoned) before the next pair is read.
+        """
+        if path.endswith(('.ndjson', '.jsonl')):
+            if not table:
+                raise ValueError(f"{path} holds one collection; name its table with --load-table")
+            return iter([(table, (json.loads(line) for line in f if line.strip()))])
+        
+        stream = JsonStream(f)
+        if stream.peek() == '[':
+            if not table:
+                raise ValueError(f"{path} holds one collection; name its table with --load-table")
+            return iter([(table, stream.elements())])
+        return ((self.pascale_to_snake(name), records) for name, records in stream.members()
+                if not table or self.pascale_to_snake(name) == table)
+    
+    def load_relationships(self) -> Tuple[Dict[str, Dict[str, Optional[str]]], Dict[str, str]]:
+        """Relationship fields per table (field -> target slug) and the table of every slug"""
+        relationships = {}
+        relation_tables = {}
+        for collection in self.collections_info.get('collections', []):
+            table = self.pascale_to_snake(collection)
+            fields = {field['name']: field['relationTo'] for field in load_collection_fields(collection)
+                      if field['type'] == 'relationship'}
+            if fields:
+                relationships.setdefault(table, fields)
+            slug = load_collection_slug(collection)
+            # Several configs can share a slug (Pages and PagesMain); the table named after it wins
+            if slug and (slug not in relation_tables or table == slug.replace('-', '_')):
+                relation_tables[slug] = table
+        return relationships, relation_tables
+    
+    def defer_table_indexes(self, loader: BulkLoader, table: str) -> Optional[str]:
+        """Drop the table's secondary indexes, after writing an index phase file that rebuilds them
+        CONCURRENTLY; returns that file, or None when nothing was dropped"""
+        # Tables created before --partition-logs stay heap tables, so ask the catalog
+        if loader.is_partitioned(table):
+            print(f"⚠️ {table} is partitioned; loading it with its indexes in place")
+            return None
+        indexes = loader.deferrable_indexes(table)
+        if not indexes:
+            return None
+        statements = [re.sub(r'^CREATE (UNIQUE )?INDEX ', r'CREATE \1INDEX CONCURRENTLY IF NOT EXISTS ',
+                             definition) + ';' for _, definition in indexes]
+        index_file = f"bulk_load_{table}_indexes.sql"
+        with open(index_file, 'w', encoding='utf-8') as f:
+            f.write(render_index_phase([(table, statements)], content_hash(*statements)))
+        loader.drop_indexes([name for name, _ in indexes])
+        print(f"🗑️ Dropped {len(indexes)} indexes on {table}; {index_file} rebuilds them")
+        return index_file
+    
+    def load_data_file(self, path: str, table: Optional[str] = None,
+                       batch_size: int = DEFAULT_LOAD_BATCH_SIZE, defer_indexes: bool = False,
+                       skip_existing: bool = False, async_commit: bool = False) -> bool:
+        """COPY the documents of a JSON or NDJSON file into the collection tables on DATABASE_URL"""
+        database_url = os.getenv('DATABASE_URL')
+        if not database_url:
+            print("⚠️ DATABASE_URL not found in environment. Nothing was loaded.")
+            return False
+        if psycopg2 is None:
+            print("❌ The bulk loader requires psycopg2.")
+            return False
+        try:
+            f = open(path, 'r', encoding='utf-8')
+        except OSError as e:
+            print(f"❌ Could not read {path}: {e}")
+            return False
+        try:
+            collections = self.read_load_file(f, path, table)
+        except ValueError as e:
+            f.close()
+            print(f"❌ Could not read {path}: {e}")
+            return False
+        
+        relationships, relation_tables = self.load_relationships()
+        loader = BulkLoader(database_url, batch_size, skip_existing, async_commit, relationships, relation_tables)
+        ok = True
+        try:
+            for table_name, records in collections:
+                if not loader.resolve_table(table_name):
+                    print(f"⚠️ No table {table_name}; run the migration first. Skipping it.")
+                    ok = False
+                    continue
+                index_file = self.defer_table_indexes(loader, table_name) if defer_indexes else None
+                started = time.perf_counter()
+                try:
+                    read, written = loader.load(table_name, records)
+                except Exception as e:
+                    print(f"❌ Loading {table_name} failed: {str(e).strip()}")
+                    print("💡 Batches that committed stay loaded; rerun with --skip-existing to continue")
+                    ok = False
+                    read = None
+                finally:
+                    if index_file:
+                        if self.build_index_file(index_file):
+                            os.remove(index_file)
+                        else:
+                            print(f"💡 Rebuild the dropped indexes with --build-indexes {index_file}")
+                            ok = False
+                if read is None:
+                    continue
+                elapsed = time.perf_counter() - started
+                skipped = f", {read - written} already present" if read != written else ""
+                print(f"📥 Loaded {written} rows into {table_name} in {elapsed:.2f}s "
+                      f"({read / elapsed if elapsed else 0:.0f} rows/s){skipped}")
+        except ValueError as e:
+            # Malformed JSON between collections; the ones before it stay loaded
+            print(f"❌ Could not read {path}: {e}")
+            ok = False
+        finally:
+            loader.close()
+            f.close()
+        return ok
+    
+    def apply_unit_manifest(self, path: str) -> bool:
+        """Apply a unit manifest (from either generator) with dependency-ordered parallel transactions"""
+        database_url = os.getenv('DATABASE_URL')
+        if not database_url:
+            print("⚠️ DATABASE_URL not found in environment. Nothing was applied.")
+            return False
+        if psycopg2 is None:
+            print(f"❌ Applying migration units requires psycopg2; run the files in {os.path.dirname(path) or '.'} "
+                  f"with psql in name order instead.")
+            return False
+        return self.apply_with_runner(database_url, [], self.timing_report_filename(path),
+                                      manifest=load_migration_units(path))
+    
+    def split_sql_statements(self, sql: str) -> List[str]:
+        """Split a migration into statements, honouring quotes, comments and dollar-quoted bodies"""
+        statements = []
+        current = []
+        i = 0
+        length = len(sql)
+        dollar_tag = None
+        
+        while i < length:
+            if dollar_tag:
+                end = sql.find(dollar_tag, i)
+                end = length if end == -1 else end + len(dollar_tag)
+                current.append(sql[i:end])
+                i = end
+                dollar_tag = None
+                continue
+            
+            ch = sql[i]
+            if sql.startswith('--', i):
+                end = sql.find('\n', i)
+                end = length if end == -1 else end
+                current.append(sql[i:end])
+                i = end
+            elif ch in ("'", '"'):
+                end = i + 1
+                while end < length:
+                    if sql[end] == ch:
+                        if sql.startswith(ch * 2, end):
+                            end += 2
+                            continue
+                        break
+                    end += 1
+                current.append(sql[i:end + 1])
+                i = end + 1
+            elif ch == '$' and DOLLAR_QUOTE_RE.match(sql, i):
+                dollar_tag = DOLLAR_QUOTE_RE.match(sql, i).group(0)
+                current.append(dollar_tag)
+                i += len(dollar_tag)
+            elif ch == ';':
+                statement = ''.join(current).strip()
+                if self.strip_sql_comments(statement).strip():
+                    statements.append(statement)
+                current = []
+                i += 1
+            else:
+                current.append(ch)
+                i += 1
+        
+        statement = ''.join(current).strip()
+        if self.strip_sql_comments(statement).strip():
+            statements.append(statement)
+        
+        return statements
+    
+    def strip_sql_comments(self, sql: str) -> str:
+        """Remove -- comments (the templates never put -- inside string literals)"""
+        return re.sub(r'--[^\n]*', '', sql)
+    
+    def classify_statement(self, statement: str) -> Tuple[str, Any]:
+        """Identify the catalog object a generated statement creates, drops or works on
+        
+        'maintenance' covers the statements that act on objects created earlier in their table's
+        section (storage parameters, backfills, counter rebuilds, partition DO blocks).
+        """
+        sql = ' '.join(self.strip_sql_comments(statement).split())
+        upper = sql.upper()
+        
+        if upper in ('BEGIN', 'COMMIT'):
+            return 'transaction', None
+        
+        match = re.match(r'CREATE EXTENSION IF NOT EXISTS "?([\w-]+)"?', sql, re.IGNORECASE)
+        if match:
+            return 'extension', match.group(1)
+        
+        match = re.match(r'CREATE TABLE IF NOT EXISTS (?:\w+\.)?(\w+)', sql, re.IGNORECASE)
+        if match:
+            return 'table', match.group(1)
+        
+        match = re.match(r'CREATE (?:UNIQUE )?INDEX (?:CONCURRENTLY )?IF NOT EXISTS (\w+)', sql, re.IGNORECASE)
+        if match:
+            return 'index', match.group(1)
+        
+        match = re.match(r'CREATE OR REPLACE FUNCTION (?:\w+\.)?(\w+)\s*\(', sql, re.IGNORECASE)
+        if match:
+            return 'function', match.group(1)
+        
+        match = re.match(r'DROP TRIGGER IF EXISTS (\w+) ON (?:\w+\.)?(\w+)', sql, re.IGNORECASE)
+        if match:
+            return 'drop_trigger', (match.group(2), match.group(1))
+        
+        match = re.match(r'CREATE TRIGGER (\w+) .*? ON (?:\w+\.)?(\w+) ', sql, re.IGNORECASE)
+        if match:
+            return 'trigger', (match.group(2), match.group(1))
+        
+        match = re.match(r'DROP INDEX (?:CONCURRENTLY )?IF EXISTS (?:\w+\.)?(\w+)', sql, re.IGNORECASE)
+        if match:
+            return 'drop_index', match.group(1)
+        
+        match = re.match(r'DROP FUNCTION IF EXISTS (?:\w+\.)?(\w+)\s*\(([^)]*)\)', sql, re.IGNORECASE)
+        if match:
+            arguments = tuple(self.normalize_sql_type(argument.strip())
+                              for argument in match.group(2).split(',') if argument.strip())
+            return 'drop_function', (match.group(1), arguments)
+        
+        match = re.match(r'ALTER TABLE (?:\w+\.)?(\w+) DROP COLUMN IF EXISTS (\w+)$', sql, re.IGNORECASE)
+        if match:
+            return 'drop_column', (match.group(1), match.group(2))
+        
+        if re.match(r'SET\s', sql, re.IGNORECASE):
+            return 'setting', None
+        
+        match = re.match(r'(SELECT|INSERT|UPDATE|DELETE|DO|ALTER)\b', sql, re.IGNORECASE)
+        if match:
+            return 'maintenance', match.group(1).upper()
+        
+        return 'other', None
+    
+    def parse_function_body(self, statement: str) -> Optional[str]:
+        """Return the dollar-quoted body of a CREATE FUNCTION statement"""
+        match = re.search(r'(\$[A-Za-z_]*\$)(.*)\1', statement, re.DOTALL)
+        return match.group(2) if match else None
+    
+    def parse_trigger_function(self, statement: str) -> Optional[str]:
+        """Return the function a CREATE TRIGGER statement executes"""
+        match = re.search(r'EXECUTE (?:FUNCTION|PROCEDURE) (?:\w+\.)?(\w+)', statement, re.IGNORECASE)
+        return match.group(1) if match else None
+    
+    def parse_table_columns(self, statement: str) -> List[Tuple[str, str, str]]:
+        """Return (name, type, definition) for each column of a CREATE TABLE statement"""
+        sql = self.strip_sql_comments(statement)
+        start = sql.find('(')
+        if start == -1:
+            return []
+        
+        items = []
+        depth = 0
+        current = []
+        for ch in sql[start + 1:]:
+            if ch == '(':
+                depth += 1
+            elif ch == ')':
+                if depth == 0:
+                    break
+                depth -= 1
+            elif ch == ',' and depth == 0:
+                items.append(''.join(current))
+                current = []
+                continue
+            current.append(ch)
+        items.append(''.join(current))
+        
+        columns = []
+        stop_words = {'NOT', 'NULL', 'DEFAULT', 'PRIMARY', 'GENERATED', 'REFERENCES',
+                      'UNIQUE', 'CHECK', 'CONSTRAINT', 'COLLATE'}
+        for item in items:
+            definition = ' '.join(item.split())
+            if not definition:
+                continue
+            tokens = definition.split(' ')
+            if tokens[0].upper() in ('CONSTRAINT', 'UNIQUE', 'PRIMARY', 'CHECK', 'FOREIGN', 'EXCLUDE'):
+                continue
+            type_tokens = []
+            for token in tokens[1:]:
+                if token.upper() in stop_words:
+                    break
+                type_tokens.append(token)
+            columns.append((tokens[0].strip('"'), ' '.join(type_tokens), definition))
+        
+        return columns
+    
+    def normalize_sql_type(self, sql_type: str) -> str:
+        """Normalize a template column type to the catalog's format_type() spelling"""
+        sql_type = sql_type.strip().lower()
+        match = re.match(r'varchar\s*\((\d+)\)', sql_type)
+        if match:
+            return f"character varying({match.group(1)})"
+        return SQL_TYPE_ALIASES.get(sql_type, sql_type)
+    
+    def introspect_catalog(self, conn) -> Dict[str, Any]:
+        """Read the live tables, indexes, functions, triggers and extensions of the current schema"""
+        catalog = {
+            'tables': {},
+            'indexes': set(),
+            'functions': {},
+            'triggers': {},
+            'signatures': set(),
+            'extensions': set(),
+        }
+        
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT c.relname, a.attname, format_type(a.atttypid, a.atttypmod)
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+                WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p')
+            """)
+            for table, column, column_type in cur.fetchall():
+                catalog['tables'].setdefault(table, {})[column] = column_type
+            
+            cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema()")
+            catalog['indexes'] = {row[0] for row in cur.fetchall()}
+            
+            cur.execute("""
+                SELECT p.proname, p.prosrc
+                FROM pg_proc p
+                JOIN pg_namespace n ON n.oid = p.pronamespace
+                WHERE n.nspname = current_schema()
+            """)
+            for name, source in cur.fetchall():
+                catalog['functions'].setdefault(name, []).append(source)
+            
+            cur.execute("""
+                SELECT p.proname, oidvectortypes(p.proargtypes)
+                FROM pg_proc p
+                JOIN pg_namespace n ON n.oid = p.pronamespace
+                WHERE n.nspname = current_schema()
+            """)
+            catalog['signatures'] = {(name, tuple(argument.strip() for argument in arguments.split(',')
+                                                  if argument.strip()))
+                                     for name, arguments in cur.fetchall()}
+            
+            cur.execute("""
+                SELECT c.relname, t.tgname, p.proname
+                FROM pg_trigger t
+                JOIN pg_class c ON c.oid = t.tgrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                JOIN pg_proc p ON p.oid = t.tgfoid
+                WHERE NOT t.tgisinternal AND n.nspname = current_schema()
+            """)
+            catalog['triggers'] = {(table, name): function for table, name, function in cur.fetchall()}
+            
+            cur.execute("SELECT extname FROM pg_extension")
+            catalog['extensions'] = {row[0] for row in cur.fetchall()}
+        
+        return catalog
+    
+    def diff_against_catalog(self, statements: List[str], catalog: Dict[str, Any]) -> List[str]:
+        """Keep only the statements that create missing objects or change existing ones
+        
+        Maintenance statements (backfills, counter rebuilds, storage settings) belong to the table
+        whose section they follow and are kept only when that table or one of its triggers changed.
+        """
+        diff = []
+        pending_drops = {}
+        section = None
+        changed_tables = set()
+        
+        for statement in statements:
+            kind, key = self.classify_statement(statement)
+            
+            if kind == 'transaction':
+                continue
+            
+            if kind == 'extension':
+                if key not in catalog['extensions']:
+                    diff.append(statement)
+            
+            elif kind == 'table':
+                section = key
+                live_columns = catalog['tables'].get(key)
+                if live_columns is None:
+                    diff.append(statement)
+                    changed_tables.add(key)
+                    continue
+                for column, column_type, definition in self.parse_table_columns(statement):
+                    if column not in live_columns:
+                        diff.append(f"ALTER TABLE {key} ADD COLUMN IF NOT EXISTS {definition}")
+                        changed_tables.add(key)
+                    elif self.normalize_sql_type(column_type) != live_columns[column]:
+                        # Type changes can rewrite the table; surface them instead of applying blindly
+                        diff.append(f"-- WARNING: {key}.{column} is {live_columns[column]} in the database "
+                                    f"but {column_type} in the generated schema; review manually")
+            
+            elif kind == 'index':
+                if key not in catalog['indexes']:
+                    diff.append(statement)
+            
+            elif kind == 'function':
+                body = (self.parse_function_body(statement) or '').strip()
+                live_bodies = [source.strip() for source in catalog['functions'].get(key, [])]
+                if body not in live_bodies:
+                    diff.append(statement)
+            
+            elif kind == 'drop_trigger':
+                # Only emitted together with the CREATE TRIGGER that follows it
+                pending_drops[key] = statement
+            
+            elif kind == 'trigger':
+                if catalog['triggers'].get(key) != self.parse_trigger_function(statement):
+                    if key in pending_drops:
+                        diff.append(pending_drops[key])
+                    diff.append(statement)
+                    changed_tables.add(key[0])
+                pending_drops.pop(key, None)
+            
+            elif kind == 'drop_index':
+                if key in catalog['indexes']:
+                    diff.append(statement)
+            
+            elif kind == 'drop_function':
+                if key in catalog['signatures']:
+                    diff.append(statement)
+            
+            elif kind == 'drop_column':
+                if key[1] in catalog['tables'].get(key[0], {}):
+                    diff.append(statement)
+            
+            elif kind == 'maintenance':
+                # Before the first table nothing says what the statement belongs to, so keep it
+                if section is None or section in changed_tables:
+                    diff.append(statement)
+            
+            else:
+                # SET, GRANT and friends are cheap and idempotent
+                diff.append(statement)
+        
+        return diff
+    
+    def generate_diff_file(self, schema_file: str, database_url: str) -> Optional[str]:
+        """Write a migration containing only what differs from the live catalog; None when up to date"""
+        with open(schema_file, 'r', encoding='utf-8') as f:
+            statements = self.split_sql_statements(f.read())
+        
+        conn = psycopg2.connect(database_url)
+        try:
+            catalog = self.introspect_catalog(conn)
+        finally:
+            conn.close()
+        
+        diff = self.diff_against_catalog(statements, catalog)
+        changes = [statement for statement in diff if not statement.startswith('-- WARNING')
+                   and self.classify_statement(statement)[0] not in ('setting', 'other')]
+        for statement in diff:
+            if statement.startswith('-- WARNING'):
+                print(f"⚠️ {statement[len('-- WARNING: '):]}")
+        
+        print(f"🔍 Catalog diff: {len(changes)} of {len(statements)} statements need to be applied")
+        if not changes:
+            return None
+        
+        diff_file = schema_file[:-len('.sql')] + '_diff.sql' if schema_file.endswith('.sql') else schema_file + '_diff'
+        with open(diff_file, 'w', encoding='utf-8') as f:
+            f.write(f"-- Catalog diff for {schema_file}\n")
+            f.write(f"-- Generated at: {datetime.now().isoformat()}\n\n")
+            f.write("BEGIN;\n\n")
+            for statement in diff:
+                f.write(statement if statement.startswith('-- WARNING') else statement + ";")
+                f.write("\n\n")
+            f.write("COMMIT;\n")
+        
+        return diff_file
+    
     def sync_with_database(self, schema_file: str) -> bool:
         """Sync the generated schema with the database"""
         print("🔄 Attempting to sync with database...")
@@ -314,10 +1698,63 @@ COMMIT;
             # Parse connection details (basic implementation)
             print("📡 Connecting to database...")
             
-            # Execute the schema file
+            index_file = self.index_phase_filename(schema_file) if self.concurrent_indexes else None
+            if self.diff_mode:
+                if psycopg2 is None:
+                    print("⚠️ psycopg2 is not installed; falling back to applying the full migration.")
+                elif self.compact:
+                    # The registry DO block creates the tables, so there are no CREATE TABLEs to compare
+                    print("⚠️ The catalog diff cannot see the tables compact mode creates from its registry; "
+                          "applying the full migration.")
+                else:
+                    diff_file = self.generate_diff_file(schema_file, database_url)
+                    if diff_file is None:
+                        print("✅ Database schema already up to date, nothing to apply.")
+                        # The catalog diff does not see deferred indexes; the phase skips built ones
+                        return self.build_index_file(index_file) if index_file else True
+                    print(f"📄 Diff migration saved to: {diff_file}")
+                    schema_file = diff_file
+            
+            if psycopg2 is not None and self.migration_units and not self.diff_mode:
+                # Independent units commit side by side instead of one long serial transaction
+                manifest_file = os.path.join(self.units_directory(schema_file), UNIT_MANIFEST)
+                index_statements = self.read_index_phase(index_file) if index_file else None
+                if not self.apply_with_runner(database_url, [], self.timing_report_filename(schema_file),
+                                              index_statements, load_migration_units(manifest_file)):
+                    return False
+                print("✅ Database schema synced successfully!")
+                print(f"📄 Migration units applied: {manifest_file}")
+                return True
+            
+            if psycopg2 is not None:
+                with open(schema_file, 'r', encoding='utf-8') as f:
+                    sql = f.read()
+                index_statements = self.read_index_phase(index_file) if index_file else None
+                if self.ledger and not self.diff_mode:
+                    # The whole file is one unit: an unchanged migration is skipped entirely
+                    applied = self.apply_with_runner(database_url, [], self.timing_report_filename(schema_file),
+                                                     index_statements, {'settings': {}, 'units': [
+                                                         dict(migration_unit('full_migration', sql),
+                                                              checksum=unit_checksum(sql))]})
+                else:
+                    applied = self.apply_with_runner(database_url, self.split_sql_statements(sql),
+                                                     self.timing_report_filename(schema_file), index_statements)
+                if not applied:
+                    return False
+                print("✅ Database schema synced successfully!")
+                print(f"📄 Migration applied: {schema_file}")
+                return True
+            
+            # Without psycopg2, hand the file to psql (no per-statement timings)
+            print("⚠️ psycopg2 is not installed; applying the migration with psql.")
             cmd = f'psql "{database_url}" -f {schema_file}'
             result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
             
+            if result.returncode == 0 and index_file:
+                print(f"🏗️ Building indexes concurrently with psql, one at a time: {index_file}")
+                result = subprocess.run(f'psql "{database_url}" -v ON_ERROR_STOP=1 -f {index_file}',
+                                        shell=True, capture_output=True, text=True)
+            
             if result.returncode == 0:
                 print("✅ Database schema synced successfully!")
                 print(f"📄 Migration applied: {schema_file}")
@@ -333,24 +1770,52 @@ COMMIT;
     
     def run(self):
         """Main execution function"""
+        if self.output == '-':
+            self.write_migration_to_stdout()
+            return
+        
         print("🚀 Starting Schema Generation and Sync...")
         
         if not self.collections_info.get('collections'):
             print("❌ No collections found. Run the type generation first.")
             return
         
-        # Generate schemas
-        collection_schemas = self.generate_collection_schemas()
-        relationship_schemas = self.generate_relationship_tables()
-        utility_functions = self.generate_utility_functions()
+        inputs_hash = self.compute_inputs_hash()
+        if self.use_cache:
+            self.cache = GenerationCache('schema-generator')
         
-        # Save to file
-        schema_file = self.save_schema_file(collection_schemas, relationship_schemas, utility_functions)
-        print(f"📁 Schema saved to: {schema_file}")
+        if self.stream_to_db:
+            synced = self.stream_to_database(inputs_hash)
+            print(f"🔄 Database synced: {'Yes' if synced else 'No'}")
+            return
+        
+        if self.cache is not None and self.cache.is_current(inputs_hash, self.output_files(inputs_hash)):
+            # Nothing to re-render, but an earlier sync may have failed: the sync still runs
+            schema_file = self.schema_filename(inputs_hash)
+            print(f"✅ No collection changes since the last run; {schema_file} is up to date.")
+        else:
+            # Generate schemas
+            collection_schemas = self.iter_collection_schemas()
+            relationship_schemas = self.generate_relationship_tables()
+            utility_functions = self.generate_utility_functions()
+            
+            # Save to file
+            schema_file = self.save_schema_file(collection_schemas, relationship_schemas, utility_functions,
+                                                inputs_hash)
+            print(f"📁 Schema saved to: {schema_file}")
+            if self.concurrent_indexes:
+                print(f"📁 Index phase saved to: {self.index_phase_filename(schema_file)}")
+            if self.migration_units:
+                print(f"📁 Migration units saved to: {self.units_directory(schema_file)}")
+            if self.cache is not None:
+                self.cache.save(inputs_hash, self.output_files(inputs_hash))
         
         # Sync with database if possible
         synced = self.sync_with_database(schema_file)
         
+        if self.index_report:
+            self.print_index_report()
+        
         # Summary
         print("\n🎉 Schema Generation Complete!")
         print(f"📊 Generated schemas for {len(self.collections_info.get('collections', []))} collections")
@@ -360,7 +1825,88 @@ COMMIT;
         if not synced:
             print("\n💡 To manually sync:")
             print(f"   psql $DATABASE_URL -f {schema_file}")
+            if self.migration_units:
+                manifest_file = os.path.join(self.units_directory(schema_file), UNIT_MANIFEST)
+                print(f"   or, in parallel: python schema-generator.py --apply-units {manifest_file}")
+            if self.concurrent_indexes:
+                print(f"   python schema-generator.py --build-indexes {self.index_phase_filename(schema_file)}")
 
 if __name__ == "__main__":
-    generator = SchemaGenerator()
+    parser = argparse.ArgumentParser(description="Generate PostgreSQL schemas for Payload collections and sync them")
+    parser.add_argument('--diff', action='store_true',
+                        help="introspect the live catalog and apply only missing or changed objects")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="re-render every collection even when its inputs are unchanged")
+    parser.add_argument('--stdout', action='store_true',
+                        help="stream the migration to stdout instead of writing a file")
+    parser.add_argument('--stream-to-db', action='store_true',
+                        help="execute statements on DATABASE_URL as they are generated, without writing a file")
+    parser.add_argument('--typed-columns', action='store_true',
+                        help="emit typed columns for scalar Payload fields, keeping data for overflow fields")
+    parser.add_argument('--index-report', action='store_true',
+                        help="print the estimated index write amplification and size per table")
+    parser.add_argument('--search-index', action='store_true',
+                        help="maintain a trigger-fed search_documents table and search only that")
+    parser.add_argument('--row-counters', action='store_true',
+                        help="maintain per-collection, per-status row counts with statement-level triggers")
+    parser.add_argument('--compact', action='store_true',
+                        help="create the collection tables from a registry with one shared updated_at trigger function")
+    parser.add_argument('--storage-profiles', action='store_true',
+                        help="set fillfactor, autovacuum thresholds and lz4 data compression per collection class")
+    parser.add_argument('--data-gin', choices=DATA_GIN_CHOICES,
+                        help=f"operator class of the data GIN index on every table, or none "
+                             f"(default: {DEFAULT_DATA_GIN})")
+    parser.add_argument('--partition-logs', action='store_true',
+                        help="create append-only log tables partitioned by month (new tables only; "
+                             "existing heap tables are not converted)")
+    parser.add_argument('--lock-timeout', default=DEFAULT_LOCK_TIMEOUT,
+                        help="lock_timeout while applying the migration (default: %(default)s)")
+    parser.add_argument('--statement-timeout', default=DEFAULT_STATEMENT_TIMEOUT,
+                        help="statement_timeout while applying the migration, 0 for none (default: %(default)s)")
+    parser.add_argument('--concurrent-indexes', action='store_true',
+                        help="move collection indexes to a CREATE INDEX CONCURRENTLY phase after the migration")
+    parser.add_argument('--index-concurrency', type=int, default=DEFAULT_INDEX_CONCURRENCY,
+                        help="index builds to run at once in the index phase (default: %(default)s)")
+    parser.add_argument('--build-indexes', metavar='FILE',
+                        help="only run an index phase file on DATABASE_URL with the parallel builder")
+    parser.add_argument('--units', action='store_true',
+                        help="also write the migration as dependency-ordered units and apply them in parallel")
+    parser.add_argument('--unit-concurrency', type=int, default=DEFAULT_UNIT_CONCURRENCY,
+                        help="migration units to apply at once, one transaction each (default: %(default)s)")
+    parser.add_argument('--no-ledger', action='store_true',
+                        help="re-apply every unit instead of skipping the ones schema_migrations records as applied")
+    parser.add_argument('--apply-units', metavar='MANIFEST',
+                        help="only apply a unit manifest on DATABASE_URL, independent units in parallel")
+    parser.add_argument('--load', metavar='FILE',
+                        help="only COPY the documents of a JSON or NDJSON file into the collection tables")
+    parser.add_argument('--load-table',
+                        help="table to load a JSON list or NDJSON file into, or the one collection to load")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_LOAD_BATCH_SIZE,
+                        help="rows per COPY batch, each committed on its own (default: %(default)s)")
+    parser.add_argument('--defer-indexes', action='store_true',
+                        help="drop secondary indexes before loading and rebuild them concurrently after")
+    parser.add_argument('--skip-existing', action='store_true',
+                        help="load through a staging table, skipping rows whose id is already present")
+    parser.add_argument('--async-commit', action='store_true',
+                        help="load with synchronous_commit off: faster, but a crash can lose the last "
+                             "committed batches, which then have to be reloaded")
+    args = parser.parse_args()
+    
+    generator = SchemaGenerator(diff_mode=args.diff, use_cache=not args.no_cache,
+                                output='-' if args.stdout else None, stream_to_db=args.stream_to_db,
+                                typed_columns=args.typed_columns, index_report=args.index_report,
+                                search_index=args.search_index, row_counters=args.row_counters,
+                                lock_timeout=args.lock_timeout, statement_timeout=args.statement_timeout,
+                                concurrent_indexes=args.concurrent_indexes, index_concurrency=args.index_concurrency,
+                                migration_units=args.units, unit_concurrency=args.unit_concurrency,
+                                ledger=not args.no_ledger, compact=args.compact,
+                                storage_profiles=args.storage_profiles, data_gin=args.data_gin,
+                                partition_logs=args.partition_logs)
+    if args.apply_units:
+        sys.exit(0 if generator.apply_unit_manifest(args.apply_units) else 1)
+    if args.build_indexes:
+        sys.exit(0 if generator.build_index_file(args.build_indexes) else 1)
+    if args.load:
+        sys.exit(0 if generator.load_data_file(args.load, args.load_table, args.batch_size,
+                                               args.defer_indexes, args.skip_existing, args.async_commit) else 1)
     generator.run()
\ No newline at end of file
@@ -0,0 +1,2022 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the schema generators
+Used by schema-generator.py and supabase-schema-generator.py (run them from the repo root).
+"""
+
+import hashlib
+import json
+import re
+import textwrap
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+CACHE_DIR = '.schema-cache'
+
+
+def content_hash(*parts: Any) -> str:
+    """Stable SHA-256 over JSON-serialisable inputs"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            digest.update(part)
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def generator_fingerprint(script_path: str) -> str:
+    """Hash of the generator sources, so template changes invalidate every cached render"""
+    return content_hash(Path(script_path).read_bytes(), Path(__file__).read_bytes())
+
+
+class GenerationCache:
+    """Per-collection render cache keyed by content hashes of the generator inputs"""
+
+    def __init__(self, name: str, cache_dir: str = CACHE_DIR):
+        self.path = Path(cache_dir) / name
+        self.index_file = self.path / 'index.json'
+        self.index = self.load_index()
+        self.changed = []
+
+    def load_index(self) -> Dict[str, Any]:
+        """Load the cache index, starting fresh when it is missing or unreadable"""
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if isinstance(index, dict) and isinstance(index.get('entries'), dict):
+                return index
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        return {'inputs_hash': None, 'outputs': [], 'entries': {}}
+
+    def is_current(self, inputs_hash: str, outputs) -> bool:
+        """True when the last run used the same inputs and its outputs are still on disk"""
+        return (self.index.get('inputs_hash') == inputs_hash
+                and sorted(self.index.get('outputs', [])) == sorted(outputs)
+                and all(Path(output).exists() for output in outputs))
+
+    def entry_file(self, key: str) -> Path:
+        return self.path / key.replace('/', '__')
+
+    def get(self, key: str, digest: str) -> Optional[str]:
+        """Return the cached render for key when it was produced from the same digest"""
+        if self.index['entries'].get(key) != digest:
+            return None
+        try:
+            return self.entry_file(key).read_text(encoding='utf-8')
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, digest: str, content: str) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.entry_file(key).write_text(content, encoding='utf-8')
+        self.index['entries'][key] = digest
+        self.changed.append(key)
+
+    def render(self, key: str, digest: str, renderer) -> str:
+        """Return the cached render for key, calling renderer() only when its inputs changed"""
+        cached = self.get(key, digest)
+        if cached is not None:
+            return cached
+        content = renderer()
+        self.put(key, digest, content)
+        return content
+
+    def save(self, inputs_hash: str, outputs) -> None:
+        """Record the inputs hash and outputs of a completed run"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.index['inputs_hash'] = inputs_hash
+        self.index['outputs'] = sorted(outputs)
+        with open(self.index_file, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, indent=2, sort_keys=True)
+
+
+# =====================================================
+# PAYLOAD COLLECTION FIELD CONFIGS
+# =====================================================
+
+COLLECTIONS_DIR = 'src/payload/collections'
+
+# Directory precedence when a collection name exists in more than one group,
+# mirroring the import order of src/payload/collections/index.ts
+COLLECTION_GROUPS = ['commerce', 'content', 'crm', 'staff', 'system', 'builder']
+
+# Matches `Name: CollectionConfig = {` as well as wrapped configs like `= withDefaultHooks({`
+CONFIG_RE = re.compile(r':\s*CollectionConfig\s*=\s*(?:\w+\(\s*)*\{')
+STRING_VALUE_RE = re.compile(r'''^(['"`])(.*?)\1''', re.DOTALL)
+
+_fields_cache: Dict[str, List[Dict[str, Any]]] = {}
+
+
+def _skip_literal(src: str, i: int) -> int:
+    """Return the index just past a string or comment starting at i, or i when there is none"""
+    ch = src[i]
+    if ch in ('"', "'", '`'):
+        j = i + 1
+        while j < len(src):
+            if src[j] == '\\':
+                j += 2
+                continue
+            if src[j] == ch:
+                return j + 1
+            j += 1
+        return len(src)
+    if src.startswith('//', i):
+        end = src.find('\n', i)
+        return len(src) if end == -1 else end
+    if src.startswith('/*', i):
+        end = src.find('*/', i + 2)
+        return len(src) if end == -1 else end + 2
+    return i
+
+
+def _matching_bracket(src: str, start: int) -> int:
+    """Index of the bracket closing the one at start"""
+    depth = 0
+    i = start
+    while i < len(src):
+        skipped = _skip_literal(src, i)
+        if skipped != i:
+            i = skipped
+            continue
+        if src[i] in '{[(':
+            depth += 1
+        elif src[i] in '}])':
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return len(src) - 1
+
+
+def _top_level_entries(src: str, start: int, end: int) -> List[str]:
+    """Split src[start:end] on commas that are not nested in brackets, strings or comments"""
+    entries = []
+    depth = 0
+    current_start = start
+    i = start
+    while i < end:
+        skipped = _skip_literal(src, i)
+        if skipped != i:
+            i = skipped
+            continue
+        if src[i] in '{[(':
+            depth += 1
+        elif src[i] in '}])':
+            depth -= 1
+        elif src[i] == ',' and depth == 0:
+            entries.append(src[current_start:i])
+            current_start = i + 1
+        i += 1
+    entries.append(src[current_start:end])
+    return [entry for entry in (_strip_ts_comments(e).strip() for e in entries) if entry]
+
+
+def _strip_ts_comments(src: str) -> str:
+    out = []
+    i = 0
+    while i < len(src):
+        skipped = _skip_literal(src, i)
+        if skipped != i:
+            if src[i] in ('"', "'", '`'):
+                out.append(src[i:skipped])
+            i = skipped
+            continue
+        out.append(src[i])
+        i += 1
+    return ''.join(out)
+
+
+def _object_properties(entry: str) -> Dict[str, str]:
+    """Map the top-level keys of an object literal to their raw value text"""
+    properties = {}
+    if not entry.startswith('{'):
+        return properties
+    close = _matching_bracket(entry, 0)
+    for prop in _top_level_entries(entry, 1, close):
+        match = re.match(r'''^['"]?(\w+)['"]?\s*:\s*''', prop)
+        if match:
+            properties[match.group(1)] = prop[match.end():].strip()
+    return properties
+
+
+def _string_value(raw: Optional[str]) -> Optional[str]:
+    match = STRING_VALUE_RE.match(raw or '')
+    return match.group(2) if match else None
+
+
+def find_collection_config(collection: str, collections_dir: str = COLLECTIONS_DIR) -> Optional[Path]:
+    """Locate the Payload config file for a collection name from collections-info.json"""
+    root = Path(collections_dir)
+    if not root.is_dir():
+        return None
+    candidates = [path for path in root.rglob('*.ts')
+                  if re.sub(r'-main$', 'Main', path.stem) == collection]
+
+    def precedence(path: Path):
+        group = path.parent.name
+        return (COLLECTION_GROUPS.index(group) if group in COLLECTION_GROUPS else len(COLLECTION_GROUPS), str(path))
+
+    return min(candidates, key=precedence) if candidates else None
+
+
+def parse_collection_fields(source: str) -> List[Dict[str, Any]]:
+    """Extract the top-level field definitions of the first CollectionConfig in a TS source file"""
+    match = CONFIG_RE.search(source)
+    if not match:
+        return []
+    start = match.end() - 1
+    config = _object_properties(source[start:_matching_bracket(source, start) + 1])
+    fields_src = config.get('fields', '')
+    if not fields_src.startswith('['):
+        return []
+
+    fields = []
+    for entry in _top_level_entries(fields_src, 1, _matching_bracket(fields_src, 0)):
+        properties = _object_properties(entry)
+        name = _string_value(properties.get('name'))
+        field_type = _string_value(properties.get('type'))
+        if not name or not field_type:
+            continue
+        relation_to = properties.get('relationTo')
+        fields.append({
+            'name': name,
+            'type': field_type,
+            'required': properties.get('required') == 'true',
+            'index': properties.get('index') == 'true',
+            'unique': properties.get('unique') == 'true',
+            'hasMany': properties.get('hasMany') == 'true',
+            'relationTo': _string_value(relation_to) if relation_to and not relation_to.startswith('[') else None,
+            'polymorphic': bool(relation_to and relation_to.startswith('[')),
+        })
+    return fields
+
+
+def load_collection_fields(collection: str, collections_dir: str = COLLECTIONS_DIR) -> List[Dict[str, Any]]:
+    """Top-level field definitions for a collection, or [] when its config cannot be found"""
+    key = f"{collections_dir}:{collection}"
+    if key not in _fields_cache:
+        path = find_collection_config(collection, collections_dir)
+        _fields_cache[key] = parse_collection_fields(path.read_text(encoding='utf-8')) if path else []
+    return _fields_cache[key]
+
+
+def parse_collection_slug(source: str) -> Optional[str]:
+    """The slug of the first CollectionConfig in a TS source file"""
+    match = CONFIG_RE.search(source)
+    if not match:
+        return None
+    start = match.end() - 1
+    return _string_value(_object_properties(source[start:_matching_bracket(source, start) + 1]).get('slug'))
+
+
+def load_collection_slug(collection: str, collections_dir: str = COLLECTIONS_DIR) -> Optional[str]:
+    """The slug relationship fields name a collection by, or None when its config cannot be found"""
+    path = find_collection_config(collection, collections_dir)
+    return parse_collection_slug(path.read_text(encoding='utf-8')) if path else None
+
+
+# =====================================================
+# TYPED COLUMNS
+# =====================================================
+
+# Payload field type -> PostgreSQL column type
+FIELD_COLUMN_TYPES = {
+    'text': 'TEXT',
+    'email': 'TEXT',
+    'select': 'TEXT',
+    'number': 'NUMERIC',
+    'date': 'TIMESTAMPTZ',
+    'checkbox': 'BOOLEAN',
+    'relationship': 'UUID',
+}
+
+# Columns owned by the table templates (or feeding search_vector), kept in data
+RESERVED_FIELDS = {'id', 'createdAt', 'updatedAt', 'data', 'title', 'name', 'slug',
+                   'status', 'description', 'content', 'tags'}
+
+SQL_RESERVED_WORDS = {
+    'all', 'analyse', 'analyze', 'and', 'any', 'array', 'as', 'asc', 'asymmetric', 'both',
+    'case', 'cast', 'check', 'collate', 'column', 'constraint', 'create', 'current_date',
+    'current_role', 'current_time', 'current_timestamp', 'current_user', 'default',
+    'deferrable', 'desc', 'distinct', 'do', 'else', 'end', 'except', 'false', 'fetch', 'for',
+    'foreign', 'from', 'grant', 'group', 'having', 'in', 'initially', 'intersect', 'into',
+    'lateral', 'leading', 'limit', 'localtime', 'localtimestamp', 'not', 'null', 'offset',
+    'on', 'only', 'or', 'order', 'placing', 'primary', 'references', 'returning', 'select',
+    'session_user', 'some', 'symmetric', 'table', 'then', 'to', 'trailing', 'true', 'union',
+    'unique', 'user', 'using', 'variadic', 'when', 'where', 'window', 'with',
+}
+
+
+def camel_to_snake(name: str) -> str:
+    name = re.sub('([a-z0-9])([A-Z])', r'\1_\2', name)
+    return name.lower()
+
+
+def quote_ident(name: str) -> str:
+    return f'"{name}"' if name in SQL_RESERVED_WORDS else name
+
+
+def typed_columns(fields: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Scalar fields that get a real column; everything else stays in data"""
+    columns = []
+    seen = set()
+    for field in fields:
+        if field['name'] in RESERVED_FIELDS or field['type'] not in FIELD_COLUMN_TYPES:
+            continue
+        if field['type'] == 'relationship' and (field['hasMany'] or field['polymorphic']):
+            continue
+        if field['type'] == 'select' and field['hasMany']:
+            continue
+        column = camel_to_snake(field['name'])
+        if field['type'] == 'relationship' and not column.endswith('_id'):
+            column += '_id'
+        if not re.match(r'^[a-z_][a-z0-9_]*$', column) or column in seen:
+            continue
+        seen.add(column)
+        columns.append({
+            'field': field['name'],
+            'column': column,
+            'ident': quote_ident(column),
+            'sql_type': FIELD_COLUMN_TYPES[field['type']],
+            'type': field['type'],
+        })
+    return columns
+
+
+# Casts of promoted values that can fail; TEXT columns take the value as it is
+TYPED_CASTS = {
+    'UUID': 'typed_uuid',
+    'NUMERIC': 'typed_numeric',
+    'BOOLEAN': 'typed_boolean',
+    'TIMESTAMPTZ': 'typed_timestamptz',
+}
+
+
+def render_typed_casts(schema_prefix: str = '') -> str:
+    """Casts used by the promotion triggers: a value of the wrong shape gives NULL instead of failing the write"""
+    p = schema_prefix
+    return f"""
+-- Casts for typed columns: NULL for a value that does not parse, so one bad document
+-- cannot fail an INSERT or UPDATE (the promotion trigger keeps it in data and warns)
+CREATE OR REPLACE FUNCTION {p}typed_uuid(value TEXT)
+RETURNS UUID AS $$
+    SELECT CASE WHEN value ~* '^[0-9a-f]{{8}}-[0-9a-f]{{4}}-[0-9a-f]{{4}}-[0-9a-f]{{4}}-[0-9a-f]{{12}}$'
+                THEN value::UUID END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION {p}typed_numeric(value TEXT)
+RETURNS NUMERIC AS $$
+    SELECT CASE WHEN value ~ '^\\s*[-+]?([0-9]+(\\.[0-9]*)?|\\.[0-9]+)([eE][-+]?[0-9]{{1,4}})?\\s*$'
+                THEN value::NUMERIC END;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION {p}typed_boolean(value TEXT)
+RETURNS BOOLEAN AS $$
+    SELECT CASE WHEN lower(btrim(value)) IN ('true', 'false', 't', 'f', 'yes', 'no', 'on', 'off', '1', '0')
+                THEN btrim(value)::BOOLEAN END;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- No pattern rules out every invalid date, so this one traps the cast error instead
+CREATE OR REPLACE FUNCTION {p}typed_timestamptz(value TEXT)
+RETURNS TIMESTAMPTZ AS $$
+BEGIN
+    RETURN value::TIMESTAMPTZ;
+EXCEPTION WHEN invalid_datetime_format OR datetime_field_overflow
+             OR invalid_time_zone_displacement_value OR invalid_parameter_value THEN
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql STABLE;
+"""
+
+
+def typed_raw_value(column: Dict[str, Any], source: str = 'NEW.data') -> str:
+    """The text of a promoted field in data, NULL when absent or empty"""
+    if column['type'] == 'relationship':
+        # Populated relationships arrive as objects; stored ones as plain ids
+        raw = f"COALESCE({source}->'{column['field']}'->>'id', {source}->>'{column['field']}')"
+    else:
+        raw = f"{source}->>'{column['field']}'"
+    return f"NULLIF({raw}, '')"
+
+
+def typed_assignment(column: Dict[str, Any], schema_prefix: str = '') -> str:
+    """Trigger code moving one field into its column; a value that does not cast stays in data
+
+    The column is assigned on every write, NULL when the document has no such field, so a write
+    that leaves a field out clears it like it would in data.
+    """
+    field, ident, raw = column['field'], column['ident'], typed_raw_value(column)
+    cast = TYPED_CASTS.get(column['sql_type'])
+    if cast is None:
+        return f"""    NEW.{ident} := {raw};
+    IF NEW.data ? '{field}' THEN
+        promoted := promoted || '{field}'::TEXT;
+    END IF;"""
+    return f"""    NEW.{ident} := {schema_prefix}{cast}({raw});
+    IF NEW.{ident} IS NULL AND {raw} IS NOT NULL THEN
+        RAISE WARNING '%.%: % is not a valid {column['sql_type']}, kept in data',
+            TG_TABLE_NAME, '{field}', NEW.data->>'{field}';
+    ELSIF NEW.data ? '{field}' THEN
+        promoted := promoted || '{field}'::TEXT;
+    END IF;"""
+
+
+def typed_document_expression(columns: List[Dict[str, Any]], alias: str = 't') -> str:
+    """The whole document of a row: data with its promoted fields merged back under their field names"""
+    if not columns:
+        return f"{alias}.data"
+    # jsonb_build_object takes at most 100 arguments
+    objects = ' || '.join(
+        'jsonb_build_object(' + ', '.join(f"'{column['field']}', {alias}.{column['ident']}" for column in chunk) + ')'
+        for chunk in (columns[i:i + 50] for i in range(0, len(columns), 50))
+    )
+    return f"{alias}.data || jsonb_strip_nulls({objects})"
+
+
+def render_typed_columns(table_name: str, columns: List[Dict[str, Any]], qualified_table: str,
+                         schema_prefix: str = '', updated_at_trigger: Optional[str] = None) -> Dict[str, str]:
+    """Typed column definitions, the upgrade adding them to existing tables, and the promotion trigger
+
+    The trigger runs the casts from render_typed_casts(); indexes come from field_index_specs.
+    Every write has to carry the whole document (typed_document_expression() for one built from
+    a stored row), since a field missing from data clears its column.
+    """
+    if not columns:
+        return {'columns': '', 'upgrade': '', 'trigger': ''}
+
+    definitions = ''.join(f"    {column['ident']} {column['sql_type']},\n" for column in columns)
+    additions = ',\n'.join(f"    ADD COLUMN IF NOT EXISTS {column['ident']} {column['sql_type']}" for column in columns)
+    assignments = '\n'.join(typed_assignment(column, schema_prefix) for column in columns)
+    keys = ', '.join(f"'{column['field']}'" for column in columns)
+    # The whole document goes back through the trigger, so fields promoted earlier keep their values
+    backfill = f"""UPDATE {qualified_table} t
+SET data = {typed_document_expression(columns)}
+WHERE t.data ?| ARRAY[{keys}];"""
+    if updated_at_trigger:
+        backfill = f"""ALTER TABLE {qualified_table} DISABLE TRIGGER {updated_at_trigger};
+{backfill}
+ALTER TABLE {qualified_table} ENABLE TRIGGER {updated_at_trigger};"""
+    upgrade = f"""
+-- Typed columns for a table created before they existed (CREATE TABLE IF NOT EXISTS skips it)
+ALTER TABLE {qualified_table}
+{additions};
+"""
+    trigger = f"""
+-- Promote typed fields out of data so data only holds overflow fields
+CREATE OR REPLACE FUNCTION promote_typed_columns_{table_name}()
+RETURNS TRIGGER AS $$
+DECLARE
+    promoted TEXT[] := '{{}}';
+BEGIN
+{assignments}
+    NEW.data := NEW.data - promoted;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trigger_promote_typed_columns_{table_name} ON {qualified_table};
+CREATE TRIGGER trigger_promote_typed_columns_{table_name}
+    BEFORE INSERT OR UPDATE ON {qualified_table}
+    FOR EACH ROW
+    EXECUTE FUNCTION promote_typed_columns_{table_name}();
+
+-- Backfill: promote the fields of rows written before the trigger existed, without touching
+-- updated_at. Promoted rows no longer carry these keys, so later runs only revisit values
+-- that did not cast.
+{backfill}
+"""
+    return {
+        'columns': f"\n    -- Typed columns promoted from Payload field definitions\n{definitions}",
+        'upgrade': upgrade,
+        'trigger': trigger,
+    }
+
+
+# =====================================================
+# PROJECTIONS
+# =====================================================
+
+# Columns every projection selects; search_vector is never shipped to clients
+PROJECTION_BASE_COLUMNS = ['id', 'created_at', 'updated_at', 'title', 'slug', 'status']
+
+# Field types small enough for list rows; long text, rich text, uploads, arrays and groups stay in data
+LIST_FIELD_TYPES = {'text', 'email', 'select', 'number', 'date', 'checkbox', 'relationship'}
+
+# Fields the base columns already carry
+PROJECTED_FIELDS = {'id', 'createdAt', 'updatedAt', 'title', 'slug', 'status'}
+
+
+def list_projection(fields: List[Dict[str, Any]], typed: bool = False) -> str:
+    """PostgREST select list for list views: the base columns plus the collection's short scalar fields
+
+    Fields are read from their typed column when typed-column mode promoted them, otherwise
+    from data; either way they come back under their Payload field name.
+    """
+    columns = {column['field']: column['column'] for column in typed_columns(fields)} if typed else {}
+    selected = list(PROJECTION_BASE_COLUMNS)
+    seen = set(PROJECTED_FIELDS)
+    for field in fields:
+        name = field['name']
+        if name in seen or field['type'] not in LIST_FIELD_TYPES:
+            continue
+        if field['hasMany'] or field['polymorphic'] or not re.match(r'^[A-Za-z_][A-Za-z0-9_]*$', name):
+            continue
+        seen.add(name)
+        selected.append(f"{name}:{columns.get(name, f'data->{name}')}")
+    return ','.join(selected)
+
+
+def detail_projection(fields: List[Dict[str, Any]], typed: bool = False) -> str:
+    """PostgREST select list for single records: every column except search_vector"""
+    promoted = [column['column'] for column in typed_columns(fields)] if typed else []
+    return ','.join(PROJECTION_BASE_COLUMNS[:3] + ['data'] + PROJECTION_BASE_COLUMNS[3:] + promoted)
+
+
+# =====================================================
+# INDEXES
+# =====================================================
+
+MAX_IDENTIFIER_LENGTH = 63
+
+
+def index_name(table_name: str, *parts: str) -> str:
+    """idx_<table>_<parts>, shortened with a hash suffix when PostgreSQL would truncate it"""
+    name = '_'.join(['idx', table_name, *parts])
+    if len(name) <= MAX_IDENTIFIER_LENGTH:
+        return name
+    return f"{name[:MAX_IDENTIFIER_LENGTH - 9]}_{content_hash(name)[:8]}"
+
+
+def render_index(spec: Dict[str, Any], concurrently: bool = False) -> str:
+    """CREATE INDEX statement for an index spec"""
+    unique = 'UNIQUE ' if spec.get('unique') else ''
+    concurrent = 'CONCURRENTLY ' if concurrently else ''
+    method = spec.get('method', 'btree')
+    using = f" USING {method}" if method != 'btree' else ''
+    storage = f" WITH ({spec['with']})" if spec.get('with') else ''
+    where = f" WHERE {spec['where']}" if spec.get('where') else ''
+    return (f"CREATE {unique}INDEX {concurrent}IF NOT EXISTS {spec['name']} ON {spec['table']}{using}"
+            f"({', '.join(spec['keys'])}){storage}{where};")
+
+
+def is_indexable_field(field: Dict[str, Any]) -> bool:
+    """Scalar fields whose value can back a btree lookup"""
+    return (field['type'] in FIELD_COLUMN_TYPES
+            and not field['hasMany'] and not field['polymorphic'])
+
+
+def jsonb_key_expression(field: Dict[str, Any]) -> str:
+    """Index key reading a field out of data"""
+    if field['type'] == 'number':
+        return f"((data->>'{field['name']}')::numeric)"
+    return f"(data->>'{field['name']}')"
+
+
+def field_index_specs(table_name: str, qualified_table: str, fields: List[Dict[str, Any]],
+                      columns: List[Dict[str, Any]], skip_fields=()) -> List[Dict[str, Any]]:
+    """Indexes driven by Payload `index` / `unique` flags and relationship fields
+
+    Typed columns are indexed on the column, everything else with an expression on data; a
+    typed column without one of those flags gets no index, as every index taxes every write.
+    Relationships are paired with the collection's first indexed date field, so lookups
+    such as "appointments for a stylist on a day" are a single range scan.
+    """
+    typed = {column['field']: column for column in columns}
+    candidates = [field for field in fields
+                  if field['name'] not in skip_fields and is_indexable_field(field)]
+    date_field = next((field for field in candidates if field['type'] == 'date' and field['index']), None)
+
+    def key(field):
+        return typed[field['name']]['ident'] if field['name'] in typed else jsonb_key_expression(field)
+
+    def label(field):
+        return typed[field['name']]['column'] if field['name'] in typed else camel_to_snake(field['name'])
+
+    specs = []
+    for field in candidates:
+        spec = {'table': qualified_table, 'method': 'btree', 'keys': [key(field)], 'unique': False, 'where': None,
+                'group': 'Field indexes (Payload index/unique flags and relationship lookups)'}
+        if field['unique']:
+            spec.update(name=index_name(table_name, label(field), 'unique'), unique=True)
+        elif field['type'] == 'relationship' and date_field is not None:
+            spec.update(name=index_name(table_name, label(field), label(date_field)),
+                        keys=[key(field), key(date_field)])
+        elif field['index'] or field['type'] == 'relationship':
+            spec['name'] = index_name(table_name, label(field))
+            if field['name'] not in typed and not field['required']:
+                # Sparse keys: equality lookups imply IS NOT NULL, so the planner can still use it
+                spec['where'] = f"{key(field)} IS NOT NULL"
+        else:
+            continue
+        specs.append(spec)
+    return specs
+
+
+def index_spec(table_name: str, qualified_table: str, suffix: str, keys: List[str], method: str = 'btree',
+               where: Optional[str] = None, unique: bool = False, group: str = '') -> Dict[str, Any]:
+    return {'name': index_name(table_name, suffix), 'table': qualified_table, 'method': method,
+            'keys': keys, 'where': where, 'unique': unique, 'group': group}
+
+
+# =====================================================
+# INDEX PLANNING
+# =====================================================
+
+# Append-heavy collections: mostly inserts, documents read whole by id or time range
+WRITE_HEAVY_TABLES = {'chat_messages', 'page_views', 'event_tracking', 'audit_logs',
+                      'webhook_logs', 'email_logs', 'chatbot_logs'}
+
+# Log collections that are only ever appended to and read by time range. They are indexed with BRIN
+# instead of btree timestamps and left out of cross-collection search; with --partition-logs they are
+# also range-partitioned by created_at. That only applies to tables the migration creates: CREATE
+# TABLE IF NOT EXISTS keeps an existing heap table, so partitioning is opt-in.
+APPEND_ONLY_TABLES = {'audit_logs', 'page_views', 'event_tracking', 'webhook_logs', 'email_logs', 'chatbot_logs'}
+
+# Heap pages summarised per BRIN range; rows arrive in created_at order, so ranges stay narrow
+BRIN_PAGES_PER_RANGE = 32
+
+# The data GIN index serves only hand-written queries: the generated clients never filter on data
+# (applyFilters compares columns with eq, in and like). jsonb_ops answers containment (@>) and key
+# existence (?, ?|, ?&); jsonb_path_ops is smaller and cheaper to update but only answers @>. The
+# default keeps jsonb_ops, which existing deployments have; a GIN insert adds an entry per key and
+# value of the document, so tables nothing queries by content can opt out with --data-gin none.
+DATA_GIN_CHOICES = ('jsonb_ops', 'jsonb_path_ops', 'none')
+DEFAULT_DATA_GIN = 'jsonb_ops'
+
+# Rough per-row sizing used for the index report (uncompressed, excluding page overhead)
+BTREE_TUPLE_OVERHEAD = 16
+BTREE_KEY_BYTES = 16
+DOC_LEAF_VALUES = 20
+TSVECTOR_LEXEMES = 30
+GIN_ENTRY_BYTES = 8
+
+
+def _key_root(key: str) -> str:
+    return re.sub(r'\s+(ASC|DESC)$', '', key.strip(), flags=re.IGNORECASE)
+
+
+def _is_prefix(spec: Dict[str, Any], other: Dict[str, Any]) -> bool:
+    """True when other can answer every lookup spec can"""
+    if spec['method'] != 'btree' or other['method'] != 'btree':
+        return False
+    if len(spec['keys']) > len(other['keys']):
+        return False
+    if other.get('where') != spec.get('where'):
+        # A full index covers a partial one only when the predicate just skips NULLs
+        if other.get('where') or not spec['where'].endswith('IS NOT NULL'):
+            return False
+    if len(spec['keys']) == 1:
+        # A single-column btree can be scanned in either direction
+        return _key_root(spec['keys'][0]) == _key_root(other['keys'][0])
+    return spec['keys'] == other['keys'][:len(spec['keys'])]
+
+
+def is_append_only(table_name: str) -> bool:
+    return table_name in APPEND_ONLY_TABLES
+
+
+def index_entries_per_row(spec: Dict[str, Any]) -> int:
+    if spec['method'] == 'brin':
+        # One summary tuple per range of pages, not per row
+        return 0
+    if spec['method'] != 'gin':
+        return 1
+    if spec['keys'][0].startswith('search_vector'):
+        return TSVECTOR_LEXEMES
+    # jsonb_ops indexes every key and every value, jsonb_path_ops one hash per leaf value
+    return DOC_LEAF_VALUES if 'jsonb_path_ops' in spec['keys'][0] else DOC_LEAF_VALUES * 2
+
+
+def index_bytes_per_row(spec: Dict[str, Any]) -> int:
+    if spec['method'] == 'brin':
+        return 0
+    if spec['method'] == 'gin':
+        return index_entries_per_row(spec) * GIN_ENTRY_BYTES
+    return BTREE_TUPLE_OVERHEAD + BTREE_KEY_BYTES * len(spec['keys'])
+
+
+def plan_indexes(table_name: str, specs: List[Dict[str, Any]], implicit: List[Dict[str, Any]] = (),
+                 generated_columns: Optional[Dict[str, str]] = None,
+                 data_gin: Optional[str] = None, partitioned: bool = False) -> Dict[str, Any]:
+    """Drop redundant indexes, pick the GIN operator class and estimate the write cost
+
+    implicit: indexes created by constraints (primary key, UNIQUE), which are never dropped.
+    generated_columns: expression -> generated column, for expression indexes the column makes redundant.
+    data_gin: data GIN operator class ('none' for no index), DEFAULT_DATA_GIN when not given.
+    partitioned: the table is partitioned by created_at (append-only tables with --partition-logs).
+    """
+    generated_columns = generated_columns or {}
+    kept = []
+    dropped = []
+
+    for spec in specs:
+        spec = dict(spec)
+        if is_append_only(table_name) and not spec.get('where'):
+            root = _key_root(spec['keys'][0]) if len(spec['keys']) == 1 else None
+            if spec['method'] == 'btree' and root == 'created_at':
+                dropped.append((spec['name'], 'replaced by a BRIN index (append-only, rows arrive in created_at order)'))
+                spec.update(name=index_name(table_name, 'created_at_brin'), method='brin', keys=['created_at'],
+                            **{'with': f"pages_per_range = {BRIN_PAGES_PER_RANGE}"})
+            elif spec['method'] == 'btree' and root == 'updated_at':
+                dropped.append((spec['name'], 'append-only rows are never updated'))
+                continue
+            elif spec['method'] == 'gin' and root == 'search_vector':
+                dropped.append((spec['name'], 'append-only table, not part of cross-collection search'))
+                continue
+            elif spec['unique'] and partitioned:
+                # A unique index on a partitioned table has to include the partition key
+                spec.update(unique=False, name=spec['name'][:-len('_unique')] if spec['name'].endswith('_unique')
+                            else spec['name'])
+        if spec['method'] == 'gin' and spec['keys'] == ['data']:
+            opclass = data_gin or DEFAULT_DATA_GIN
+            if opclass == 'none':
+                dropped.append((spec['name'], 'no data GIN index (--data-gin none)'))
+                continue
+            if opclass == 'jsonb_path_ops':
+                dropped.append((spec['name'], 'replaced by a jsonb_path_ops index (containment queries only)'))
+                spec.update(name=index_name(table_name, 'data_path_ops'), keys=['data jsonb_path_ops'])
+        if len(spec['keys']) == 1 and spec['keys'][0] in generated_columns and not spec['unique']:
+            dropped.append((spec['name'], f"duplicates the index on generated column {generated_columns[spec['keys'][0]]}"))
+            continue
+        kept.append(spec)
+
+    planned = []
+    for position, spec in enumerate(kept):
+        # Constraint indexes and longer indexes cover spec; of two equivalent ones the first wins
+        others = list(implicit) + [other for other_position, other in enumerate(kept)
+                                   if len(other['keys']) > len(spec['keys'])
+                                   or (len(other['keys']) == len(spec['keys']) and other_position < position)]
+        covering = next((other for other in others
+                         if not spec['unique'] and _is_prefix(spec, other)), None)
+        if covering is not None:
+            dropped.append((spec['name'], f"covered by {covering['name']}"))
+        else:
+            planned.append(spec)
+
+    entries = 1 + sum(index_entries_per_row(spec) for spec in list(implicit) + planned)
+    index_bytes = sum(index_bytes_per_row(spec) for spec in list(implicit) + planned)
+    hot_blocked = any(_key_root(key) == 'updated_at' for spec in planned for key in spec['keys'])
+    return {
+        'indexes': planned,
+        'dropped': dropped,
+        'report': {
+            'table': table_name,
+            'indexes': len(planned) + len(implicit),
+            'dropped': len(dropped),
+            'writes_per_row': entries,
+            'index_bytes_per_row': index_bytes,
+            'hot_updates': not hot_blocked,
+        },
+    }
+
+
+def render_index_plan(plan: Dict[str, Any], schema_prefix: str = '', deferred: bool = False) -> str:
+    """CREATE INDEX statements grouped by purpose, DROPs for superseded indexes and a cost summary
+
+    A deferred plan only keeps the summary; its statements go to the index phase instead.
+    """
+    report = plan['report']
+    lines = [
+        f"-- Index plan: {report['indexes']} indexes, ~{report['writes_per_row']} heap/index entries "
+        f"and ~{report['index_bytes_per_row']} bytes of index written per row (estimate)",
+    ]
+    if not report['hot_updates']:
+        lines.append("-- updated_at is indexed and changes on every update, so updates are never HOT")
+    if deferred:
+        lines.append("-- Built with CREATE INDEX CONCURRENTLY in the index phase, after this migration commits")
+        return '\n'.join(lines) + '\n'
+    group = None
+    for spec in plan['indexes']:
+        if spec.get('group') != group:
+            group = spec.get('group')
+            lines.append('')
+            if group:
+                lines.append(f"-- {group}")
+        lines.append(render_index(spec))
+    if plan['dropped']:
+        lines.append('')
+        lines.append('-- Redundant indexes')
+        for name, reason in plan['dropped']:
+            lines.append(f"DROP INDEX IF EXISTS {schema_prefix}{name}; -- {reason}")
+    return '\n'.join(lines) + '\n'
+
+
+def index_phase_statements(plan: Dict[str, Any], schema_prefix: str = '') -> List[str]:
+    """CONCURRENTLY statements for a deferred index plan: builds, then drops of the indexes they supersede"""
+    builds = [render_index(spec, concurrently=True) for spec in plan['indexes']]
+    return builds + [f"DROP INDEX CONCURRENTLY IF EXISTS {schema_prefix}{name};" for name, _ in plan['dropped']]
+
+
+def render_index_phase(tables: List[Tuple[str, List[str]]], inputs_hash: str) -> str:
+    """Index phase file: one group of CONCURRENTLY statements per table, with no transaction block"""
+    blocks = [f"-- {table_name}\n" + '\n'.join(statements) for table_name, statements in tables if statements]
+    return f"""-- =====================================================
+-- INDEX PHASE
+-- Content hash: {inputs_hash}
+-- =====================================================
+-- Run after the migration has committed. CONCURRENTLY builds do not block writes, but they
+-- cannot run inside a transaction block: apply this file statement by statement (psql -f does)
+-- or with the parallel builder in schema-generator.py (--build-indexes). A failed build leaves
+-- an INVALID index that IF NOT EXISTS would skip; the builder drops and rebuilds those.
+
+""" + '\n\n'.join(blocks) + '\n'
+
+
+def format_index_report(reports: List[Dict[str, Any]]) -> str:
+    """Per-table summary of the index plans for the console"""
+    lines = [f"{'table':<28}{'indexes':>8}{'dropped':>9}{'writes/row':>12}{'idx bytes/row':>15}"]
+    for report in reports:
+        lines.append(f"{report['table']:<28}{report['indexes']:>8}{report['dropped']:>9}"
+                     f"{report['writes_per_row']:>12}{report['index_bytes_per_row']:>15}")
+    return '\n'.join(lines)
+
+
+# =====================================================
+# RLS POLICY ANALYSIS
+# =====================================================
+
+POLICY_PATTERN = re.compile(r'^CREATE POLICY "(?P<name>[^"]+)" ON (?:\w+\.)?(?P<table>\w+)\s+'
+                            r'FOR (?P<command>\w+)(?: TO (?P<roles>\w+(?:, \w+)*))?\s+USING\s*\(', re.MULTILINE)
+INDEX_PATTERN = re.compile(r'^CREATE (?:UNIQUE )?INDEX (?:CONCURRENTLY )?(?:IF NOT EXISTS )?(?P<name>\w+) '
+                           r'ON (?:\w+\.)?(?P<table>\w+)(?: USING (?P<method>\w+))?\s*\(', re.MULTILINE)
+DROP_INDEX_PATTERN = re.compile(r'^DROP INDEX (?:CONCURRENTLY )?(?:IF EXISTS )?(?:\w+\.)?(?P<name>\w+)',
+                                re.MULTILINE)
+# An auth.*() call outside a sub-select is a volatile-looking function call evaluated for every row
+AUTH_CALL_PATTERN = re.compile(r'\bauth\.\w+\s*\(')
+PREDICATE_KEYWORDS = {'and', 'or', 'not', 'is', 'null', 'true', 'false', 'in', 'exists', 'like', 'ilike',
+                      'any', 'all', 'between', 'select'}
+POLICY_COSTS = {
+    'initplan': 'once per statement',
+    'index': 'index',
+    'seq_scan': 'SEQUENTIAL SCAN',
+    'per_row': 'ONCE PER ROW',
+}
+
+
+def _normalize_predicate(expr: str) -> str:
+    expr = ' '.join(expr.split()).lower()
+    while expr.startswith('(') and _matching_bracket(expr, 0) == len(expr) - 1:
+        expr = expr[1:-1].strip()
+    return expr
+
+
+def _split_top_level(expr: str, keyword: str) -> List[str]:
+    """Split expr on a boolean keyword that is not nested in parentheses or strings"""
+    parts = []
+    depth = 0
+    start = 0
+    i = 0
+    separator = re.compile(rf'\s+{keyword}\s+', re.IGNORECASE)
+    while i < len(expr):
+        skipped = _skip_literal(expr, i)
+        if skipped != i:
+            i = skipped
+            continue
+        if expr[i] == '(':
+            depth += 1
+        elif expr[i] == ')':
+            depth -= 1
+        elif depth == 0:
+            match = separator.match(expr, i)
+            if match:
+                parts.append(expr[start:i])
+                start = i = match.end()
+                continue
+        i += 1
+    parts.append(expr[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _without_sub_selects(predicate: str) -> Tuple[str, List[str]]:
+    """The predicate with every (SELECT ...) replaced by ?, and the sub-selects that were removed"""
+    sub_selects = []
+    while True:
+        match = re.search(r'\(\s*SELECT\b', predicate, re.IGNORECASE)
+        if not match:
+            return predicate, sub_selects
+        close = _matching_bracket(predicate, match.start())
+        sub_selects.append(predicate[match.start() + 1:close].strip())
+        predicate = predicate[:match.start()] + '?' + predicate[close + 1:]
+
+
+def _column_refs(expr: str) -> List[str]:
+    """Row columns an expression reads (function names, keywords and qualified names excluded)"""
+    expr = re.sub(r"'(?:[^']|'')*'", "''", expr)
+    return [match.group(1) for match in re.finditer(r'(?<![.:\w])([A-Za-z_]\w*)\b(?!\s*[(.])', expr)
+            if match.group(1).lower() not in PREDICATE_KEYWORDS]
+
+
+def parse_policies(sql: str) -> List[Dict[str, Any]]:
+    """CREATE POLICY statements of a migration: name, table, command, roles and the USING predicate"""
+    policies = []
+    for match in POLICY_PATTERN.finditer(sql):
+        open_paren = match.end() - 1
+        policies.append({
+            'name': match.group('name'),
+            'table': match.group('table'),
+            'command': match.group('command'),
+            'roles': match.group('roles'),
+            'using': sql[open_paren + 1:_matching_bracket(sql, open_paren)].strip(),
+        })
+    return policies
+
+
+def parse_indexes(sql: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Indexes a migration leaves behind, per table (created and not dropped again later)"""
+    statements = sorted([(match.start(), 'create', match) for match in INDEX_PATTERN.finditer(sql)] +
+                        [(match.start(), 'drop', match) for match in DROP_INDEX_PATTERN.finditer(sql)],
+                        key=lambda statement: statement[0])
+    indexes = {}
+    for _, kind, match in statements:
+        if kind == 'drop':
+            indexes.pop(match.group('name'), None)
+            continue
+        open_paren = match.end() - 1
+        close = _matching_bracket(sql, open_paren)
+        rest = sql[close + 1:sql.find(';', close)]
+        where = re.search(r'\bWHERE\b(.*)$', rest, re.IGNORECASE | re.DOTALL)
+        # IF NOT EXISTS keeps the first definition of a name
+        indexes.setdefault(match.group('name'), {
+            'name': match.group('name'),
+            'table': match.group('table'),
+            'method': (match.group('method') or 'btree').lower(),
+            'keys': _top_level_entries(sql, open_paren + 1, close),
+            'where': where.group(1).strip() if where else None,
+        })
+    by_table = {}
+    for spec in indexes.values():
+        by_table.setdefault(spec['table'], []).append(spec)
+    return by_table
+
+
+def _branch_index(branch: str, indexes: List[Dict[str, Any]]) -> Optional[str]:
+    """Name of a btree index one AND-ed comparison of branch can be answered from, if any"""
+    for condition in _split_top_level(branch, 'AND'):
+        operand = re.split(r'\s+(?:=|<>|!=|<=|>=|<|>|IN|IS|LIKE)\s+', condition, maxsplit=1,
+                           flags=re.IGNORECASE)[0]
+        operand = _normalize_predicate(operand)
+        if operand == 'id':
+            return 'primary key'
+        for spec in indexes:
+            if spec['method'] != 'btree' or not spec['keys']:
+                continue
+            where = spec['where'] and _normalize_predicate(spec['where'])
+            if where and where != f"{operand} is not null":
+                continue
+            if _normalize_predicate(_key_root(spec['keys'][0])) == operand:
+                return spec['name']
+    return None
+
+
+def policy_evaluation(predicate: str, indexes: List[Dict[str, Any]], table: str = '') -> Dict[str, Any]:
+    """How Postgres evaluates a USING predicate on table against the table's indexes
+    
+    `cost` is 'per_row' when an auth function is called outside a sub-select or a sub-select
+    refers to the outer row, 'initplan' when the predicate reads no row column (sub-selects
+    without outer references run once per statement), 'index' when a partial index has the same predicate or every OR branch compares
+    an indexed column, and 'seq_scan' otherwise. id is taken to be the primary key.
+    """
+    outer, sub_selects = _without_sub_selects(predicate)
+    notes = [f"sub-select filters on data->>'{key}' (promote it to a typed column)"
+             for sub_select in sub_selects for key in re.findall(r"data->>'(\w+)'", sub_select)]
+    if AUTH_CALL_PATTERN.search(outer):
+        notes.append('wrap auth calls as (select auth.uid()) so they run once per statement')
+        return {'cost': 'per_row', 'index': None, 'notes': notes}
+    correlated = re.compile(rf'(?<![.\w]){re.escape(table)}\.\w') if table else None
+    if correlated and any(correlated.search(sub_select) for sub_select in sub_selects):
+        notes.append(f'a sub-select refers to {table}, so it runs again for every row')
+        return {'cost': 'per_row', 'index': None, 'notes': notes}
+    if not _column_refs(outer):
+        return {'cost': 'initplan', 'index': None, 'notes': notes}
+    normalized = _normalize_predicate(predicate)
+    for spec in indexes:
+        if spec['where'] and _normalize_predicate(spec['where']) == normalized:
+            return {'cost': 'index', 'index': spec['name'], 'notes': notes}
+    used = []
+    for branch in _split_top_level(outer, 'OR'):
+        name = _branch_index(branch, indexes)
+        if name is None:
+            return {'cost': 'seq_scan', 'index': None, 'notes': notes}
+        used.append(name)
+    return {'cost': 'index', 'index': ', '.join(dict.fromkeys(used)), 'notes': notes}
+
+
+def analyze_policies(sql: str, index_sql: str = '') -> List[Dict[str, Any]]:
+    """Evaluate every policy in a migration against the indexes it (and an index phase) creates"""
+    indexes = parse_indexes(sql + '\n' + index_sql)
+    return [{**policy, **policy_evaluation(policy['using'], indexes.get(policy['table'], []), policy['table'])}
+            for policy in parse_policies(sql)]
+
+
+def format_policy_report(reports: List[Dict[str, Any]]) -> str:
+    """Per-policy evaluation for the console, ending with the policies that need attention"""
+    lines = [f"{'table':<28}{'policy':<50}evaluation"]
+    for report in reports:
+        detail = POLICY_COSTS[report['cost']]
+        if report['index']:
+            detail += f" ({report['index']})"
+        lines.append(f"{report['table']:<28}{report['name']:<50}{detail}")
+        lines.extend(f"{'':<28}  note: {note}" for note in report['notes'])
+    seq_scans = sum(report['cost'] == 'seq_scan' for report in reports)
+    per_row = sum(report['cost'] == 'per_row' for report in reports)
+    lines.append(f"{seq_scans} policies force sequential scans, {per_row} run once per row")
+    return '\n'.join(lines)
+
+
+# =====================================================
+# SEARCH DOCUMENTS
+# =====================================================
+
+def render_search_documents(schema_prefix: str = '', secured: bool = False) -> str:
+    """Shared search_documents table, its GIN index and the trigger function that keeps it in sync
+
+    With `secured` the table gets RLS with no policies (it is only read through the search RPC)
+    and the trigger function runs as its owner so writes from any role reach it.
+    """
+    p = schema_prefix
+    security = ' SECURITY DEFINER' if secured else ''
+    rls = f"""
+-- Read only through the search function, which applies collection permissions
+ALTER TABLE {p}search_documents ENABLE ROW LEVEL SECURITY;
+""" if secured else ''
+    return f"""
+-- Global search index: one row per document of every collection
+CREATE TABLE IF NOT EXISTS {p}search_documents (
+    collection TEXT NOT NULL,
+    id UUID NOT NULL,
+    title TEXT,
+    slug TEXT,
+    excerpt TEXT,
+    search_vector TSVECTOR NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (collection, id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_search_documents_search ON {p}search_documents USING gin(search_vector);
+{rls}
+-- Weighted search vector of a collection document
+CREATE OR REPLACE FUNCTION {p}search_document_vector(doc JSONB)
+RETURNS TSVECTOR AS $$
+    SELECT setweight(to_tsvector('english', COALESCE(doc->>'title', '')), 'A') ||
+           setweight(to_tsvector('english', COALESCE(doc->>'name', '')), 'A') ||
+           setweight(to_tsvector('english', COALESCE(doc->>'description', '')), 'B') ||
+           setweight(to_tsvector('english', COALESCE(doc->>'content', '')), 'C') ||
+           setweight(to_tsvector('english', COALESCE(doc->>'tags', '')), 'D');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Keeps search_documents in sync with the collection table the trigger is attached to
+CREATE OR REPLACE FUNCTION {p}sync_search_document()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM {p}search_documents WHERE collection = TG_TABLE_NAME AND id = OLD.id;
+        RETURN OLD;
+    END IF;
+    
+    INSERT INTO {p}search_documents (collection, id, title, slug, excerpt, search_vector, updated_at)
+    VALUES (
+        TG_TABLE_NAME,
+        NEW.id,
+        COALESCE(NEW.data->>'title', NEW.data->>'name', 'Untitled'),
+        NEW.data->>'slug',
+        LEFT(COALESCE(NEW.data->>'description', NEW.data->>'content', ''), 200),
+        {p}search_document_vector(NEW.data),
+        NOW()
+    )
+    ON CONFLICT (collection, id) DO UPDATE SET
+        title = EXCLUDED.title,
+        slug = EXCLUDED.slug,
+        excerpt = EXCLUDED.excerpt,
+        search_vector = EXCLUDED.search_vector,
+        updated_at = EXCLUDED.updated_at;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql{security};
+"""
+
+
+def render_search_document_sync(table_name: str, qualified_table: str, schema_prefix: str = '') -> str:
+    """Per-collection trigger feeding search_documents, plus a backfill of existing rows"""
+    p = schema_prefix
+    return f"""
+-- Keep the global search index in sync
+DROP TRIGGER IF EXISTS trigger_{table_name}_search_document ON {qualified_table};
+CREATE TRIGGER trigger_{table_name}_search_document
+    AFTER INSERT OR UPDATE OF data OR DELETE ON {qualified_table}
+    FOR EACH ROW
+    EXECUTE FUNCTION {p}sync_search_document();
+
+INSERT INTO {p}search_documents (collection, id, title, slug, excerpt, search_vector)
+SELECT '{table_name}',
+       id,
+       COALESCE(data->>'title', data->>'name', 'Untitled'),
+       data->>'slug',
+       LEFT(COALESCE(data->>'description', data->>'content', ''), 200),
+       {p}search_document_vector(data)
+FROM {qualified_table}
+ON CONFLICT (collection, id) DO NOTHING;
+"""
+
+
+# =====================================================
+# COLLECTION STATISTICS
+# =====================================================
+
+STATS_MODES = ('estimated', 'snapshot', 'exact')
+
+
+def sql_text_array(names: List[str], indent: int = 8) -> str:
+    """Names as the wrapped body of a SQL text array literal"""
+    return textwrap.fill(", ".join(f"'{name}'" for name in names), width=96,
+                         initial_indent=' ' * indent, subsequent_indent=' ' * indent)
+
+
+def render_collection_stats(tables: List[str], schema_prefix: str = '', counters: bool = False) -> str:
+    """get_collection_stats(mode) plus the snapshot materialized view behind its 'snapshot' mode
+
+    'estimated' reads planner statistics and relation sizes and touches no table data apart from
+    one probe of each updated_at index; 'snapshot' reads the materialized view; 'exact' scans
+    every table and is meant for explicit, occasional use. With `counters` the estimated row
+    counts come from collection_counters and are exact.
+    """
+    p = schema_prefix
+    # Without a prefix the functions resolve tables through the search path, so qualify with
+    # whatever schema that resolves to at call time
+    schema = f"'{p.rstrip('.')}'" if p else 'current_schema()'
+    modes = ', '.join(f"'{mode}'" for mode in STATS_MODES)
+    if counters:
+        record_count = f"{p}collection_row_count(%L)"
+        record_count_args = "tbl, "
+    else:
+        record_count = """COALESCE(SUM(CASE WHEN c.reltuples >= 0 THEN c.reltuples::BIGINT
+                                     ELSE COALESCE(s.n_live_tup, 0) END), 0)::BIGINT"""
+        record_count_args = ""
+
+    return f"""
+-- Function to get collection statistics
+DROP FUNCTION IF EXISTS {p}get_collection_stats();
+
+CREATE OR REPLACE FUNCTION {p}get_collection_stats(mode TEXT DEFAULT 'estimated')
+RETURNS TABLE(
+    collection_name TEXT,
+    record_count BIGINT,
+    avg_data_size NUMERIC,
+    last_updated TIMESTAMPTZ,
+    total_size BIGINT
+) AS $$
+DECLARE
+    tbl TEXT;
+    qualified TEXT;
+    schema_name TEXT := {schema};
+    collections TEXT[] := ARRAY[
+{sql_text_array(tables)}
+    ];
+    append_only TEXT[] := ARRAY[
+{sql_text_array(sorted(t for t in tables if is_append_only(t)))}
+    ]::TEXT[];
+BEGIN
+    IF mode NOT IN ({modes}) THEN
+        RAISE EXCEPTION 'unknown stats mode %, expected one of estimated, snapshot, exact', mode;
+    END IF;
+    
+    IF mode = 'snapshot' THEN
+        IF (SELECT relispopulated FROM pg_class WHERE oid = '{p}collection_stats_snapshot'::regclass) THEN
+            RETURN QUERY SELECT * FROM {p}collection_stats_snapshot;
+            RETURN;
+        END IF;
+        -- Never refreshed yet: fall back to the estimate
+        mode := 'estimated';
+    END IF;
+    
+    IF mode = 'exact' THEN
+        -- Full scans that detoast every document; use sparingly
+        FOREACH tbl IN ARRAY collections LOOP
+            qualified := format('%I.%I', schema_name, tbl);
+            IF to_regclass(qualified) IS NULL THEN
+                RETURN QUERY SELECT tbl, 0::BIGINT, 0::NUMERIC, NULL::TIMESTAMPTZ, 0::BIGINT;
+                CONTINUE;
+            END IF;
+            RETURN QUERY EXECUTE format('
+                SELECT %L::TEXT,
+                       COUNT(*),
+                       AVG(octet_length(data::text)),
+                       MAX(updated_at),
+                       (SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0)::BIGINT
+                        FROM pg_partition_tree(%L))
+                FROM %s
+            ', tbl, qualified, qualified);
+        END LOOP;
+        RETURN;
+    END IF;
+    
+    -- Planner statistics summed over the partitions (a plain table is its own single leaf):
+    -- reltuples (falling back to live tuples before the first ANALYZE), the average stored
+    -- width of data, and the newest updated_at read from its index. Append-only tables have
+    -- no updated_at index, so their last_updated is only reported by the other modes.
+    FOREACH tbl IN ARRAY collections LOOP
+        qualified := format('%I.%I', schema_name, tbl);
+        IF to_regclass(qualified) IS NULL THEN
+            RETURN QUERY SELECT tbl, 0::BIGINT, 0::NUMERIC, NULL::TIMESTAMPTZ, 0::BIGINT;
+            CONTINUE;
+        END IF;
+        RETURN QUERY EXECUTE format('
+            SELECT %L::TEXT,
+                   {record_count},
+                   COALESCE((SELECT st.avg_width FROM pg_stats st
+                             WHERE st.schemaname = %L AND st.tablename = %L AND st.attname = ''data''
+                             ORDER BY st.inherited DESC LIMIT 1), 0)::NUMERIC,
+                   %s,
+                   COALESCE(SUM(pg_total_relation_size(c.oid)), 0)::BIGINT
+            FROM pg_partition_tree(%L) pt
+            JOIN pg_class c ON c.oid = pt.relid
+            LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+            WHERE pt.isleaf
+        ', tbl, {record_count_args}schema_name, tbl,
+           CASE WHEN tbl = ANY(append_only) THEN 'NULL::TIMESTAMPTZ'
+                ELSE format('(SELECT MAX(updated_at) FROM %s)', qualified) END,
+           qualified);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+-- Exact statistics captured on a schedule; read them with get_collection_stats('snapshot')
+CREATE MATERIALIZED VIEW IF NOT EXISTS {p}collection_stats_snapshot AS
+    SELECT * FROM {p}get_collection_stats('exact')
+WITH NO DATA;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_collection_stats_snapshot_name
+    ON {p}collection_stats_snapshot(collection_name);
+
+CREATE OR REPLACE FUNCTION {p}refresh_collection_stats()
+RETURNS VOID AS $$
+BEGIN
+    IF (SELECT relispopulated FROM pg_class WHERE oid = '{p}collection_stats_snapshot'::regclass) THEN
+        REFRESH MATERIALIZED VIEW CONCURRENTLY {p}collection_stats_snapshot;
+    ELSE
+        REFRESH MATERIALIZED VIEW {p}collection_stats_snapshot;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Schedule the refresh, e.g. with pg_cron:
+-- SELECT cron.schedule('refresh-collection-stats', '*/15 * * * *', 'SELECT {p}refresh_collection_stats()');
+"""
+
+
+# =====================================================
+# PARTITIONED APPEND-ONLY TABLES
+# =====================================================
+
+PARTITION_MONTHS_AHEAD = 3
+DEFAULT_RETENTION = '12 months'
+
+
+def render_partition_functions(schema_prefix: str = '', secured: bool = False,
+                               counter_status: Optional[str] = None) -> str:
+    """Partition maintenance shared by every append-only collection
+
+    create_monthly_partitions() is idempotent and meant to run on a schedule ahead of time;
+    drop_expired_partitions() implements retention by dropping whole months, which is a
+    catalog operation instead of a DELETE that rewrites and vacuums millions of rows. Only
+    rows that reached the default partition (a month created late) are deleted row by row.
+
+    With `secured`, secure_partitions() gives every partition the row level security of its
+    parent and takes the anon and authenticated grants back, and create_monthly_partitions()
+    runs it on the partitions it creates.
+
+    DROP TABLE fires no DELETE triggers, so with row counters (counter_status is their status
+    expression over a row aliased `r`) a partition's rows are taken off the counters before it
+    is dropped.
+    """
+    p = schema_prefix
+    uncount = f"""
+            IF counted THEN
+                -- The same lock DROP TABLE takes, so no write slips in between
+                EXECUTE format('LOCK TABLE %s IN ACCESS EXCLUSIVE MODE', part.partition);
+                EXECUTE format('INSERT INTO {p}collection_counters AS c (collection, status, shard, row_count) '
+                               'SELECT %L, {counter_status.replace("'", "''")}, 0, -COUNT(*) '
+                               'FROM %s r WHERE tableoid = %L::regclass GROUP BY 2 '
+                               'ON CONFLICT (collection, status, shard) '
+                               'DO UPDATE SET row_count = c.row_count + EXCLUDED.row_count',
+                               parent_name, parent, part.partition);
+            END IF;""" if counter_status else ''
+    counted = f"""
+    parent_name TEXT;
+    counted BOOLEAN;""" if counter_status else ''
+    count_check = f"""
+    -- Collection tables have counter triggers; the counters hold their rows under the table name
+    SELECT c.relname INTO parent_name FROM pg_class c WHERE c.oid = parent;
+    counted := EXISTS (SELECT 1 FROM pg_trigger
+                       WHERE tgrelid = parent AND tgfoid = to_regproc('{p}count_collection_rows'));""" if counter_status else ''
+
+    secure = f"""
+-- A partition is a table of its own: selecting from it directly skips the parent's policies, and
+-- schema-wide grants (and Supabase's default privileges) reach it too. Force row level security
+-- on every partition with the parent's policies and revoke the client roles' grants; rows stay
+-- readable through the parent, which applies its policies.
+CREATE OR REPLACE FUNCTION {p}secure_partitions(parent REGCLASS)
+RETURNS VOID AS $$
+DECLARE
+    part REGCLASS;
+    pol RECORD;
+BEGIN
+    FOR part IN SELECT inhrelid::regclass FROM pg_inherits WHERE inhparent = parent LOOP
+        EXECUTE format('ALTER TABLE %s ENABLE ROW LEVEL SECURITY', part);
+        EXECUTE format('ALTER TABLE %s FORCE ROW LEVEL SECURITY', part);
+        FOR pol IN SELECT polname FROM pg_policy WHERE polrelid = part LOOP
+            EXECUTE format('DROP POLICY %I ON %s', pol.polname, part);
+        END LOOP;
+        FOR pol IN
+            SELECT pp.* FROM pg_policies pp
+            JOIN pg_namespace n ON n.nspname = pp.schemaname
+            JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = pp.tablename
+            WHERE c.oid = parent
+        LOOP
+            EXECUTE format('CREATE POLICY %I ON %s AS %s FOR %s TO %s%s%s',
+                           pol.policyname, part, pol.permissive, pol.cmd,
+                           (SELECT string_agg(CASE WHEN r = 'public' THEN 'PUBLIC' ELSE quote_ident(r) END, ', ')
+                            FROM unnest(pol.roles) AS r),
+                           CASE WHEN pol.qual IS NULL THEN '' ELSE format(' USING (%s)', pol.qual) END,
+                           CASE WHEN pol.with_check IS NULL THEN '' ELSE format(' WITH CHECK (%s)', pol.with_check) END);
+        END LOOP;
+        EXECUTE format('REVOKE ALL ON %s FROM anon, authenticated', part);
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+""" if secured else ''
+    secure_new = f"""
+    
+    PERFORM {p}secure_partitions(parent);""" if secured else ''
+    revoke = f"""
+-- Maintenance for the migration and scheduled jobs, not for API clients
+REVOKE EXECUTE ON FUNCTION {p}create_monthly_partitions(REGCLASS, INTEGER),
+    {p}drop_expired_partitions(REGCLASS, INTERVAL), {p}secure_partitions(REGCLASS)
+    FROM PUBLIC, anon, authenticated;
+""" if secured else ''
+    return f"""
+-- Partition maintenance for append-only collections
+-- Schedule both, e.g. with pg_cron:
+-- SELECT cron.schedule('create-partitions', '0 3 * * *', 'SELECT {p}create_monthly_partitions(''{p}page_views'')');
+-- SELECT cron.schedule('drop-partitions', '30 3 * * *', 'SELECT {p}drop_expired_partitions(''{p}page_views'')');
+{secure}
+-- Create the partitions for this month and the next months_ahead months, plus a default partition.
+-- Rows the default partition already holds for a new month are moved into that month's partition.
+CREATE OR REPLACE FUNCTION {p}create_monthly_partitions(
+    parent REGCLASS,
+    months_ahead INTEGER DEFAULT {PARTITION_MONTHS_AHEAD}
+)
+RETURNS INTEGER AS $$
+DECLARE
+    parent_schema TEXT;
+    parent_name TEXT;
+    month_start TIMESTAMPTZ := date_trunc('month', NOW());
+    range_start TIMESTAMPTZ;
+    partition_name TEXT;
+    default_partition REGCLASS;
+    key_column TEXT;
+    insert_columns TEXT;
+    pending BOOLEAN;
+    storage TEXT;
+    created INTEGER := 0;
+BEGIN
+    SELECT n.nspname, c.relname INTO parent_schema, parent_name
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.oid = parent AND c.relkind = 'p';
+    
+    IF parent_name IS NULL THEN
+        RAISE EXCEPTION '% is not a partitioned table', parent
+            USING HINT = format('CREATE TABLE IF NOT EXISTS kept an existing table. Rename it, rerun the '
+                                'migration and copy the rows back with INSERT INTO %s SELECT ... FROM the '
+                                'renamed table.', parent);
+    END IF;
+    
+    SELECT a.attname INTO key_column
+    FROM pg_partitioned_table pt
+    JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+    WHERE pt.partrelid = parent;
+    
+    -- Generated columns are recomputed when moved rows are inserted again
+    SELECT string_agg(quote_ident(a.attname), ', ' ORDER BY a.attnum) INTO insert_columns
+    FROM pg_attribute a
+    WHERE a.attrelid = parent AND a.attnum > 0 AND NOT a.attisdropped AND a.attgenerated = '';
+    
+    -- Rows outside every monthly range land here instead of failing the insert
+    EXECUTE format('CREATE TABLE IF NOT EXISTS %I.%I PARTITION OF %s DEFAULT',
+                   parent_schema, parent_name || '_default', parent);
+    default_partition := to_regclass(format('%I.%I', parent_schema, parent_name || '_default'));
+    
+    -- Partitioned tables take no storage parameters; new partitions copy the default partition's
+    SELECT array_to_string(c.reloptions, ', ') INTO storage
+    FROM pg_class c
+    WHERE c.oid = default_partition;
+    
+    FOR i IN 0..months_ahead LOOP
+        range_start := month_start + make_interval(months => i);
+        partition_name := parent_name || '_p' || to_char(range_start, 'YYYYMM');
+        IF to_regclass(format('%I.%I', parent_schema, partition_name)) IS NULL THEN
+            -- A new range fails its partition constraint while the default holds rows for it, so
+            -- park them, delete them through the parent (statement triggers see both sides) and
+            -- insert them again once the partition exists. The default partition is read through
+            -- the parent as well: its owner is exempt from the parent's row level security only.
+            EXECUTE format('SELECT EXISTS (SELECT 1 FROM %s WHERE tableoid = %L::regclass AND %I >= %L AND %I < %L)',
+                           parent, default_partition, key_column, range_start,
+                           key_column, range_start + INTERVAL '1 month') INTO pending;
+            IF pending THEN
+                EXECUTE format('CREATE TEMP TABLE partition_pending_rows ON COMMIT DROP AS '
+                               'SELECT * FROM %s WHERE tableoid = %L::regclass AND %I >= %L AND %I < %L',
+                               parent, default_partition, key_column, range_start,
+                               key_column, range_start + INTERVAL '1 month');
+                EXECUTE format('DELETE FROM %s WHERE tableoid = %L::regclass AND %I >= %L AND %I < %L',
+                               parent, default_partition, key_column, range_start,
+                               key_column, range_start + INTERVAL '1 month');
+            END IF;
+            EXECUTE format('CREATE TABLE %I.%I PARTITION OF %s FOR VALUES FROM (%L) TO (%L)%s',
+                           parent_schema, partition_name, parent,
+                           range_start, range_start + INTERVAL '1 month',
+                           CASE WHEN storage IS NULL THEN '' ELSE format(' WITH (%s)', storage) END);
+            IF pending THEN
+                EXECUTE format('INSERT INTO %s (%s) SELECT %s FROM partition_pending_rows',
+                               parent, insert_columns, insert_columns);
+                DROP TABLE partition_pending_rows;
+            END IF;
+            created := created + 1;
+        END IF;
+    END LOOP;{secure_new}
+    
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drop the monthly partitions that end before NOW() - retention, and delete the default
+-- partition's rows from before then
+CREATE OR REPLACE FUNCTION {p}drop_expired_partitions(
+    parent REGCLASS,
+    retention INTERVAL DEFAULT INTERVAL '{DEFAULT_RETENTION}'
+)
+RETURNS INTEGER AS $$
+DECLARE
+    part RECORD;
+    range_end TIMESTAMPTZ;
+    key_column TEXT;
+    trimmed BIGINT;
+    dropped INTEGER := 0;{counted}
+BEGIN
+    SELECT a.attname INTO key_column
+    FROM pg_partitioned_table pt
+    JOIN pg_attribute a ON a.attrelid = pt.partrelid AND a.attnum = pt.partattrs[0]
+    WHERE pt.partrelid = parent;
+    {count_check}
+
+    FOR part IN
+        SELECT c.oid::regclass AS partition, pg_get_expr(c.relpartbound, c.oid) AS bound
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = parent
+    LOOP
+        -- FOR VALUES FROM ('...') TO ('...'); the default partition has no upper bound
+        range_end := substring(part.bound FROM 'TO \\(''([^'']+)''\\)')::TIMESTAMPTZ;
+        IF range_end IS NOT NULL AND range_end <= NOW() - retention THEN{uncount}
+            EXECUTE format('DROP TABLE %s', part.partition);
+            dropped := dropped + 1;
+        ELSIF part.bound = 'DEFAULT' THEN
+            EXECUTE format('DELETE FROM %s WHERE tableoid = %L::regclass AND %I < %L',
+                           parent, part.partition, key_column, NOW() - retention);
+            GET DIAGNOSTICS trimmed = ROW_COUNT;
+            IF trimmed > 0 THEN
+                RAISE NOTICE 'Deleted % expired rows from %', trimmed, part.partition;
+            END IF;
+        END IF;
+    END LOOP;
+    
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+{revoke}"""
+
+
+def render_table_partitions(qualified_table: str, schema_prefix: str = '') -> str:
+    """Initial partitions of one append-only collection"""
+    return f"""
+-- Monthly partitions (current month plus {PARTITION_MONTHS_AHEAD} ahead); keep creating them on a schedule
+SELECT {schema_prefix}create_monthly_partitions('{qualified_table}');
+"""
+
+
+# =====================================================
+# ROW COUNTERS
+# =====================================================
+
+# Counter rows per (collection, status). Every write statement upserts its status row until
+# COMMIT, so with a single row concurrent writers to one collection queue behind each other;
+# spreading each backend over its own shard lets them commit side by side.
+COUNTER_SHARDS = 8
+
+
+def render_row_counters(status_expression: str, tables: List[str], schema_prefix: str = '',
+                        secured: bool = False) -> str:
+    """collection_counters table, the statement-level trigger function and the rebuild function
+
+    status_expression reads the status of a row aliased `r`. The trigger function is shared by
+    the INSERT, UPDATE and DELETE triggers of every table; each passes its rows in through the
+    old_rows / new_rows transition tables, so a bulk statement costs one upsert per status.
+    Counts are split over COUNTER_SHARDS rows picked by backend; readers sum them. The rebuild
+    function only accepts the collection tables in `tables`; with `secured` it runs as its owner
+    and clients may not call it.
+    """
+    p = schema_prefix
+    security = ' SECURITY DEFINER' if secured else ''
+    revoke = f"""
+-- A rebuild locks the table against writes; it is for the migration and maintenance jobs only
+REVOKE EXECUTE ON FUNCTION {p}rebuild_collection_counters(TEXT) FROM PUBLIC, anon, authenticated;
+""" if secured else ''
+    rls = f"""
+ALTER TABLE {p}collection_counters ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Allow authenticated users to read counters" ON {p}collection_counters;
+CREATE POLICY "Allow authenticated users to read counters" ON {p}collection_counters
+    FOR SELECT TO authenticated USING (true);
+""" if secured else ''
+    return f"""
+-- Row counters: per collection and status, maintained by statement-level triggers. Each
+-- backend writes to one of {COUNTER_SHARDS} shards, so concurrent writers to a collection do not
+-- serialize on one row lock; a single shard can go negative, only the sum is meaningful.
+CREATE TABLE IF NOT EXISTS {p}collection_counters (
+    collection TEXT NOT NULL,
+    status TEXT NOT NULL,
+    shard SMALLINT NOT NULL DEFAULT 0,
+    row_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (collection, status, shard)
+);
+{rls}
+CREATE OR REPLACE FUNCTION {p}count_collection_rows()
+RETURNS TRIGGER AS $$
+DECLARE
+    writer_shard SMALLINT := pg_backend_pid() % {COUNTER_SHARDS};
+BEGIN
+    IF TG_OP = 'TRUNCATE' THEN
+        DELETE FROM {p}collection_counters WHERE collection = TG_TABLE_NAME;
+    ELSIF TG_OP = 'INSERT' THEN
+        INSERT INTO {p}collection_counters AS c (collection, status, shard, row_count)
+        SELECT TG_TABLE_NAME, {status_expression}, writer_shard, COUNT(*) FROM new_rows r GROUP BY 2
+        ON CONFLICT (collection, status, shard) DO UPDATE SET row_count = c.row_count + EXCLUDED.row_count;
+    ELSIF TG_OP = 'DELETE' THEN
+        INSERT INTO {p}collection_counters AS c (collection, status, shard, row_count)
+        SELECT TG_TABLE_NAME, {status_expression}, writer_shard, -COUNT(*) FROM old_rows r GROUP BY 2
+        ON CONFLICT (collection, status, shard) DO UPDATE SET row_count = c.row_count + EXCLUDED.row_count;
+    ELSE
+        -- Only status changes move rows between counters
+        INSERT INTO {p}collection_counters AS c (collection, status, shard, row_count)
+        SELECT TG_TABLE_NAME, changes.status, writer_shard, SUM(changes.delta)
+        FROM (
+            SELECT {status_expression} AS status, -1 AS delta FROM old_rows r
+            UNION ALL
+            SELECT {status_expression} AS status, 1 AS delta FROM new_rows r
+        ) changes
+        GROUP BY changes.status
+        HAVING SUM(changes.delta) <> 0
+        ON CONFLICT (collection, status, shard) DO UPDATE SET row_count = c.row_count + EXCLUDED.row_count;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql{security};
+
+-- Recount one collection exactly into shard 0; writers wait until the calling transaction ends
+CREATE OR REPLACE FUNCTION {p}rebuild_collection_counters(collection_table TEXT)
+RETURNS VOID AS $$
+BEGIN
+    IF collection_table <> ALL(ARRAY[
+{sql_text_array(tables)}
+    ]::TEXT[]) THEN
+        RAISE EXCEPTION '% is not a collection table', collection_table;
+    END IF;
+    EXECUTE format('LOCK TABLE {p}%I IN SHARE MODE', collection_table);
+    DELETE FROM {p}collection_counters WHERE collection = collection_table;
+    EXECUTE format(
+        'INSERT INTO {p}collection_counters (collection, status, shard, row_count)
+         SELECT %L, {status_expression.replace("'", "''")}, 0, COUNT(*) FROM {p}%I r GROUP BY 2',
+        collection_table, collection_table);
+END;
+$$ LANGUAGE plpgsql{security};
+{revoke}
+-- Rows of a collection, optionally for one status, without scanning it
+CREATE OR REPLACE FUNCTION {p}collection_row_count(collection_table TEXT, row_status TEXT DEFAULT NULL)
+RETURNS BIGINT AS $$
+    SELECT COALESCE(SUM(row_count), 0)::BIGINT
+    FROM {p}collection_counters
+    WHERE collection = collection_table
+      AND (row_status IS NULL OR status = row_status);
+$$ LANGUAGE sql STABLE;
+"""
+
+
+def render_row_counter_triggers(table_name: str, qualified_table: str, schema_prefix: str = '') -> str:
+    """Counter triggers of one collection, plus the initial count when the counters are first installed"""
+    p = schema_prefix
+    return f"""
+-- Row counters (one trigger per event: transition tables allow a single event per trigger)
+DROP TRIGGER IF EXISTS trigger_{table_name}_count_insert ON {qualified_table};
+CREATE TRIGGER trigger_{table_name}_count_insert
+    AFTER INSERT ON {qualified_table}
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION {p}count_collection_rows();
+
+DROP TRIGGER IF EXISTS trigger_{table_name}_count_update ON {qualified_table};
+CREATE TRIGGER trigger_{table_name}_count_update
+    AFTER UPDATE ON {qualified_table}
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION {p}count_collection_rows();
+
+DROP TRIGGER IF EXISTS trigger_{table_name}_count_delete ON {qualified_table};
+CREATE TRIGGER trigger_{table_name}_count_delete
+    AFTER DELETE ON {qualified_table}
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION {p}count_collection_rows();
+
+DROP TRIGGER IF EXISTS trigger_{table_name}_count_truncate ON {qualified_table};
+CREATE TRIGGER trigger_{table_name}_count_truncate
+    AFTER TRUNCATE ON {qualified_table}
+    FOR EACH STATEMENT EXECUTE FUNCTION {p}count_collection_rows();
+
+-- Initial count, only for rows written before the triggers existed: once a collection has counter
+-- rows the triggers keep them current, and an empty table needs none. Re-enabling counters after
+-- running without them leaves stale counts; call rebuild_collection_counters() by hand then.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM {p}collection_counters WHERE collection = '{table_name}')
+       AND EXISTS (SELECT 1 FROM {qualified_table}) THEN
+        PERFORM {p}rebuild_collection_counters('{table_name}');
+    END IF;
+END $$;
+"""
+
+
+# =====================================================
+# MIGRATION UNITS
+# =====================================================
+
+# Written next to the unit files; lists them with their dependencies
+UNIT_MANIFEST = 'manifest.json'
+
+CONTENT_HASH_LINE_RE = re.compile(r'^-- Content hash: .*$', re.MULTILINE)
+
+
+def migration_unit(name: str, sql: str, depends_on: List[str] = ()) -> Dict[str, Any]:
+    """One independently committable piece of a migration"""
+    return {'name': name, 'depends_on': list(depends_on), 'sql': sql}
+
+
+def unit_checksum(sql: str) -> str:
+    """Checksum of a unit's SQL as applied; the content hash comment changes with every run of
+    the generator and is left out, so an unchanged unit keeps its checksum"""
+    return content_hash(CONTENT_HASH_LINE_RE.sub('', sql))
+
+
+def write_migration_units(directory: str, units: List[Dict[str, Any]], inputs_hash: str,
+                          settings: Optional[Dict[str, str]] = None) -> str:
+    """Write one transaction-wrapped SQL file per unit plus the manifest; returns the manifest path
+
+    Files are numbered in a valid serial order, so `psql -f` over them in name order also works.
+    Session settings (SET statements) do not carry across units; the manifest lists the ones
+    every unit's connection needs.
+    """
+    path = Path(directory)
+    path.mkdir(parents=True, exist_ok=True)
+    entries = []
+    for number, unit in enumerate(units, 1):
+        filename = f"{number:03d}_{unit['name']}.sql"
+        sql = (f"-- Migration unit: {unit['name']}\n-- Content hash: {inputs_hash}\n"
+               f"BEGIN;\n{unit['sql']}\nCOMMIT;\n")
+        (path / filename).write_text(sql, encoding='utf-8')
+        entries.append({'name': unit['name'], 'file': filename, 'depends_on': unit['depends_on'],
+                        'checksum': unit_checksum(sql)})
+    manifest = path / UNIT_MANIFEST
+    manifest.write_text(json.dumps({'content_hash': inputs_hash, 'settings': settings or {}, 'units': entries},
+                                   indent=2) + '\n', encoding='utf-8')
+    return str(manifest)
+
+
+def load_migration_units(manifest_file: str) -> Dict[str, Any]:
+    """Read a unit manifest, attaching each unit's SQL and its checksum (recomputed, so edited
+    files are not mistaken for applied ones); rejects unknown or cyclic dependencies"""
+    path = Path(manifest_file)
+    manifest = json.loads(path.read_text(encoding='utf-8'))
+    resolved = set()
+    for unit in manifest['units']:
+        missing = [name for name in unit['depends_on'] if name not in resolved]
+        if missing:
+            raise ValueError(f"unit {unit['name']} depends on {', '.join(missing)}, "
+                             f"which is not listed before it in {manifest_file}")
+        resolved.add(unit['name'])
+        unit['sql'] = (path.parent / unit['file']).read_text(encoding='utf-8')
+        unit['checksum'] = unit_checksum(unit['sql'])
+    return manifest
+
+
+# =====================================================
+# COMPACT OUTPUT
+# =====================================================
+
+def sql_literal(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def render_set_updated_at(schema_prefix: str = '') -> str:
+    """One updated_at trigger function for every collection table"""
+    p = schema_prefix
+    return f"""
+-- Shared by every collection table, instead of one identical function per table
+CREATE OR REPLACE FUNCTION {p}set_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def render_collection_registry(rows: List[Dict[str, Any]], schema_prefix: str = '', secured: bool = False) -> str:
+    """Registry of the collection tables the compact migration creates, synced to this migration
+
+    Each row carries what differs between tables: the collection, whether it is append-only and
+    the typed column definitions.
+    """
+    p = schema_prefix
+    rls = f"""
+-- Only read by the migration
+ALTER TABLE {p}collection_registry ENABLE ROW LEVEL SECURITY;
+""" if secured else ''
+    values = ',\n'.join(
+        f"    ({sql_literal(row['table'])}, {sql_literal(row['collection'])}, "
+        f"{'TRUE' if row['append_only'] else 'FALSE'}, {sql_literal(row['extra_columns'])})"
+        for row in rows
+    )
+    return f"""
+-- Collection registry: drives the table DDL below
+CREATE TABLE IF NOT EXISTS {p}collection_registry (
+    table_name TEXT PRIMARY KEY,
+    collection_name TEXT NOT NULL,
+    append_only BOOLEAN NOT NULL DEFAULT FALSE,
+    extra_columns TEXT NOT NULL DEFAULT ''
+);
+{rls}
+DELETE FROM {p}collection_registry WHERE table_name <> ALL(ARRAY[
+{sql_text_array([row['table'] for row in rows], 4)}
+]);
+
+INSERT INTO {p}collection_registry (table_name, collection_name, append_only, extra_columns) VALUES
+{values}
+ON CONFLICT (table_name) DO UPDATE SET
+    collection_name = EXCLUDED.collection_name,
+    append_only = EXCLUDED.append_only,
+    extra_columns = EXCLUDED.extra_columns;
+"""
+
+
+def render_registry_tables(table_ddl: str, partitioned_ddl: Optional[str], trigger_name: str,
+                           legacy_function: str, schema_prefix: str = '', extra: str = '') -> str:
+    """One DO block creating every registered table with its updated_at trigger
+
+    The DDL templates are format() strings over (table, extra columns, data check name, slug
+    constraint name); append-only tables use partitioned_ddl unless it is None. The trigger moves
+    to set_updated_at() and the per-table function it used to call is dropped. `extra` is more
+    PL/pgSQL run for each registry row `r`.
+    """
+    p = schema_prefix
+    if partitioned_ddl is None:
+        create = f"""
+        EXECUTE format($ddl${table_ddl}$ddl$,
+                       r.table_name, r.extra_columns, r.table_name || '_data_check',
+                       r.table_name || '_slug_unique');"""
+    else:
+        create = f"""
+        IF r.append_only THEN
+            EXECUTE format($ddl${partitioned_ddl}$ddl$,
+                           r.table_name, r.extra_columns, r.table_name || '_data_check');
+            PERFORM {p}create_monthly_partitions(format('{p}%I', r.table_name)::regclass);
+        ELSE
+            EXECUTE format($ddl${table_ddl}$ddl$,
+                           r.table_name, r.extra_columns, r.table_name || '_data_check',
+                           r.table_name || '_slug_unique');
+        END IF;"""
+    return f"""
+DO $registry$
+DECLARE
+    r RECORD;
+BEGIN
+    FOR r IN SELECT * FROM {p}collection_registry ORDER BY table_name LOOP{create}
+        
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON {p}%I', format('{trigger_name}', r.table_name), r.table_name);
+        EXECUTE format('CREATE TRIGGER %I BEFORE UPDATE ON {p}%I FOR EACH ROW EXECUTE FUNCTION {p}set_updated_at()',
+                       format('{trigger_name}', r.table_name), r.table_name);
+        EXECUTE format('DROP FUNCTION IF EXISTS %I()', format('{legacy_function}', r.table_name));
+{textwrap.indent(extra.strip(chr(10)), ' ' * 8) + chr(10) if extra else ''}    END LOOP;
+END $registry$;
+"""
+
+
+# =====================================================
+# STORAGE PROFILES
+# =====================================================
+
+# Storage parameters per collection class, each with the reason it was chosen. Partitioned tables
+# take no storage parameters, so append-only profiles are set on their partitions.
+STORAGE_PROFILES = {
+    'content': {
+        'options': {
+            'fillfactor': (90, "every edit writes a new version of the whole row. updated_at is indexed and "
+                               "changes on every update, so these are never HOT updates and each one still "
+                               "inserts into every index; the free space only lets the new version stay on "
+                               "the same page, saving a second dirty heap page per update"),
+            'autovacuum_vacuum_scale_factor': (0.05, "constant small updates; vacuum at 5% dead rows instead "
+                                                     "of 20%, before the free space is gone"),
+            'autovacuum_analyze_scale_factor': (0.02, "keep status and slug statistics current for the planner"),
+        },
+    },
+    'write_heavy': {
+        'options': {
+            'fillfactor': (90, "mostly inserts with occasional status updates; a little room for those"),
+            'autovacuum_vacuum_scale_factor': (0.02, "high churn; vacuum early and in small batches"),
+            'autovacuum_vacuum_insert_scale_factor': (0.05, "vacuum after inserts as well, keeping the visibility "
+                                                            "map current for index-only scans"),
+            'autovacuum_analyze_scale_factor': (0.02, "new rows shift the created_at distribution quickly"),
+        },
+    },
+    'append_only': {
+        'options': {
+            'fillfactor': (100, "rows are never updated; pack pages full"),
+            'autovacuum_vacuum_insert_scale_factor': (0.05, "insert-only tables are otherwise only vacuumed for "
+                                                            "wraparound; frequent vacuums freeze rows in small "
+                                                            "batches and keep the visibility map current"),
+            'autovacuum_analyze_scale_factor': (0.05, "time-range queries need current created_at statistics"),
+        },
+    },
+}
+
+# TOAST compression for data (PostgreSQL 14+; servers built without lz4 keep the default)
+DATA_COMPRESSION = 'lz4'
+
+
+def storage_profile(table_name: str) -> str:
+    if is_append_only(table_name):
+        return 'append_only'
+    if table_name in WRITE_HEAVY_TABLES:
+        return 'write_heavy'
+    return 'content'
+
+
+def render_storage_profile(table_name: str, qualified_table: str, partitioned: bool = False) -> str:
+    """Storage parameters and data compression for one collection table, with their rationale"""
+    name = storage_profile(table_name)
+    options = STORAGE_PROFILES[name]['options']
+    reasons = [(f"{option} = {value}", reason) for option, (value, reason) in options.items()]
+    reasons.append((f"data compression = {DATA_COMPRESSION}", "decompresses several times faster than pglz, and "
+                    "data is detoasted on every read; applies to values written from now on"))
+    rationale = '\n'.join(textwrap.fill(f"{setting}: {reason}", width=100, initial_indent='--   ',
+                                         subsequent_indent='--     ') for setting, reason in reasons)
+    settings = ', '.join(f"{option} = {value}" for option, (value, _) in options.items())
+    if partitioned:
+        parameters = f"""DO $$
+DECLARE
+    part REGCLASS;
+BEGIN
+    FOR part IN SELECT inhrelid::regclass FROM pg_inherits WHERE inhparent = '{qualified_table}'::regclass LOOP
+        EXECUTE format('ALTER TABLE %s SET ({settings})', part);
+    END LOOP;
+END $$;"""
+    else:
+        parameters = f"ALTER TABLE {qualified_table} SET ({settings});"
+    return f"""
+-- Storage profile: {name}
+{rationale}
+{parameters}
+
+DO $$
+BEGIN
+    ALTER TABLE {qualified_table} ALTER COLUMN data SET COMPRESSION {DATA_COMPRESSION};
+EXCEPTION WHEN feature_not_supported THEN
+    RAISE NOTICE '{DATA_COMPRESSION} is not available on this server; {qualified_table}.data keeps the default compression';
+END $$;
+"""
+
+
+# =====================================================
+# GENERATOR BASE
+# =====================================================
+
+class CollectionGenerator:
+    """What both generators derive from the collection list: table names, content hashes, typed columns
+
+    Subclasses set script_path (hashed into every fingerprint) and schema_prefix, and provide
+    collections_info, generation_options() and plan_table_indexes().
+    """
+
+    script_path: str
+    schema_prefix = ''
+
+    # What the monolithic migration SETs once; each migration unit runs on its own connection and needs it too
+    UNIT_SETTINGS = {'timezone': 'UTC'}
+
+    collections_info: Dict[str, Any]
+    typed_columns: bool
+    search_index: bool
+    partition_logs: bool
+    _fingerprint: Optional[str] = None
+
+    def pascale_to_snake(self, name: str) -> str:
+        """Convert PascalCase to snake_case"""
+        name = re.sub('([a-z0-9])([A-Z])', r'\1_\2', name)
+        return name.lower()
+
+    def fingerprint(self) -> str:
+        """Hash of the generator sources"""
+        if self._fingerprint is None:
+            self._fingerprint = generator_fingerprint(self.script_path)
+        return self._fingerprint
+
+    def collection_fingerprint(self, collection: str) -> str:
+        """Hash of everything that determines the rendered output of one collection"""
+        return content_hash(self.fingerprint(), self.generation_options(), collection,
+                            load_collection_fields(collection))
+
+    def compute_inputs_hash(self) -> str:
+        """Hash of everything that determines the generated files"""
+        collections = self.collections_info.get('collections', [])
+        return content_hash(self.fingerprint(), self.generation_options(), collections,
+                            [self.collection_fingerprint(collection) for collection in collections])
+
+    def typed_columns_for(self, collection: Optional[str]) -> List[Dict[str, Any]]:
+        """Typed columns for a collection when typed-column mode is enabled"""
+        if not self.typed_columns or not collection:
+            return []
+        return typed_columns(load_collection_fields(collection))
+
+    def field_expression(self, collection: str, field: str, alias: str = '') -> str:
+        """Text value of a Payload field: its typed column once promoted (the key is gone from data)"""
+        for column in self.typed_columns_for(collection):
+            if column['field'] == field:
+                ident = f"{alias}{column['ident']}"
+                return ident if column['sql_type'] == 'TEXT' else f"{ident}::TEXT"
+        return f"{alias}data->>'{field}'"
+
+    def typed_documents(self, alias: str = 't') -> Dict[str, str]:
+        """Whole-document expressions of the tables that have promoted fields"""
+        documents = {}
+        for collection in self.collections_info.get('collections', []):
+            columns = self.typed_columns_for(collection)
+            if columns:
+                documents[self.pascale_to_snake(collection)] = typed_document_expression(columns, alias)
+        return documents
+
+    def is_partitioned(self, table_name: str) -> bool:
+        """Append-only tables are range-partitioned by created_at with --partition-logs"""
+        return self.partition_logs and is_append_only(table_name)
+
+    def can_index_concurrently(self, table_name: str) -> bool:
+        """CREATE INDEX CONCURRENTLY is not supported on partitioned tables"""
+        return not self.is_partitioned(table_name)
+
+    def render_search_column_drop(self, table_name: str) -> str:
+        """With search_documents, drop the per-table search column (and its GIN) tables created before"""
+        if not self.search_index or is_append_only(table_name):
+            return ''
+        return f"""
+-- search_documents holds the search vectors; dropping the column drops its index too
+ALTER TABLE {self.schema_prefix}{table_name} DROP COLUMN IF EXISTS search_vector;
+"""
+
+    def collection_tables(self) -> List[str]:
+        """Table names for the collections in collections-info.json, in order and without duplicates"""
+        return list(dict.fromkeys(self.pascale_to_snake(c) for c in self.collections_info.get('collections', [])))
+
+    def search_tables(self) -> List[str]:
+        """Collection tables that take part in cross-collection search (append-only logs do not)"""
+        return [table for table in self.collection_tables() if not is_append_only(table)]
+
+    def index_reports(self) -> List[Dict[str, Any]]:
+        """The index plan report of every collection table"""
+        reports = {}
+        for collection in self.collections_info.get('collections', []):
+            table_name = self.pascale_to_snake(collection)
+            reports[table_name] = self.plan_table_indexes(table_name, collection)['report']
+        return list(reports.values())
+
+    def index_phase_tables(self) -> List[Tuple[str, List[str]]]:
+        """Index phase statements per collection table, for tables whose indexes are deferred"""
+        tables = []
+        for collection in dict.fromkeys(self.collections_info.get('collections', [])):
+            table_name = self.pascale_to_snake(collection)
+            if self.can_index_concurrently(table_name):
+                plan = self.plan_table_indexes(table_name, collection)
+                tables.append((table_name, index_phase_statements(plan, self.schema_prefix)))
+        return tables
+
+    def generation_options(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def plan_table_indexes(self, table_name: str, collection: Optional[str] = None) -> Dict[str, Any]:
+        raise NotImplementedError
@@ -4,18 +4,113 @@ Supabase Schema and Query Generator
 Generates Supabase-specific schemas, migrations, and TypeScript queries from collection types.
 """
 
+import argparse
+import contextlib
 import json
 import os
 import re
+import sys
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Iterator, Optional, Tuple
 from datetime import datetime
 
-class SupabaseSchemaGenerator:
-    def __init__(self):
+from schema_common import (
+    APPEND_ONLY_TABLES, DATA_GIN_CHOICES, DEFAULT_DATA_GIN, UNIT_MANIFEST, CollectionGenerator,
+    GenerationCache, analyze_policies, detail_projection, field_index_specs, format_index_report,
+    format_policy_report, index_spec, is_append_only, list_projection, load_collection_fields, migration_unit,
+    plan_indexes, render_collection_registry, render_collection_stats, render_index_phase, render_index_plan,
+    render_partition_functions, render_registry_tables, render_row_counter_triggers, render_row_counters,
+    render_search_document_sync, render_search_documents, render_set_updated_at, render_storage_profile,
+    render_table_partitions, render_typed_casts, render_typed_columns, sql_literal, sql_text_array,
+    typed_columns, typed_document_expression, write_migration_units,
+)
+
+# Expressions the generated title/slug/status columns already materialise
+GENERATED_COLUMNS = {
+    "(data->>'title')": 'title',
+    "(data->>'slug')": 'slug',
+    "(data->>'status')": 'status',
+}
+
+# Row filter of the public read policy; status is the generated column, so this matches
+# data->>'status' = 'published' and a partial index on it can back the policy. {visibility}
+# is the visibility field, read from its typed column when it was promoted.
+PUBLIC_READ_PREDICATE = "status = 'published' OR {visibility} = 'public'"
+
+# Records per bulk request and bulk requests in flight in the generated TypeScript helpers
+BULK_CHUNK_SIZE = 500
+BULK_CONCURRENCY = 4
+
+# Entries per collection and time to live of the optional TypeScript read cache. The time to live
+# also bounds how long a change that realtime does not deliver stays hidden (see cacheFor)
+CACHE_MAX_ENTRIES = 500
+CACHE_TTL_MS = 60000
+
+# Compact mode: the collection table templates, as format() strings over the registry columns.
+# The search column is left out when search_documents holds the search vectors.
+COMPACT_SEARCH_COLUMN = """    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', COALESCE(data->>'title', '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(data->>'name', '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(data->>'description', '')), 'B') ||
+        setweight(to_tsvector('english', COALESCE(data->>'content', '')), 'C') ||
+        setweight(to_tsvector('english', COALESCE(data->>'tags', '')), 'D')
+    ) STORED,
+"""
+
+COMPACT_TABLE_DDL = f"""
+CREATE TABLE IF NOT EXISTS public.%1$I (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    data JSONB NOT NULL DEFAULT '{{}}'::jsonb,
+%2$s    title TEXT GENERATED ALWAYS AS (data->>'title') STORED,
+    slug TEXT GENERATED ALWAYS AS (data->>'slug') STORED,
+    status TEXT GENERATED ALWAYS AS (COALESCE(data->>'status', 'draft')) STORED,
+{COMPACT_SEARCH_COLUMN}    CONSTRAINT %3$I CHECK (jsonb_typeof(data) = 'object'),
+    CONSTRAINT %4$I UNIQUE (slug) DEFERRABLE INITIALLY DEFERRED
+)"""
+
+COMPACT_PARTITIONED_DDL = """
+CREATE TABLE IF NOT EXISTS public.%1$I (
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    data JSONB NOT NULL DEFAULT '{}'::jsonb,
+%2$s    title TEXT GENERATED ALWAYS AS (data->>'title') STORED,
+    slug TEXT GENERATED ALWAYS AS (data->>'slug') STORED,
+    status TEXT GENERATED ALWAYS AS (COALESCE(data->>'status', 'draft')) STORED,
+    CONSTRAINT %3$I CHECK (jsonb_typeof(data) = 'object'),
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at)"""
+
+class SupabaseSchemaGenerator(CollectionGenerator):
+    script_path = __file__
+    schema_prefix = 'public.'
+
+    def __init__(self, use_cache: bool = True, output: Optional[str] = None, typed_columns: bool = False,
+                 index_report: bool = False, search_index: bool = False, rls_report: bool = False,
+                 row_counters: bool = False, read_cache: bool = False, split_queries: bool = False,
+                 concurrent_indexes: bool = False, migration_units: bool = False, compact: bool = False,
+                 storage_profiles: bool = False, data_gin: Optional[str] = None, partition_logs: bool = False):
         self.collections_info = self.load_collections_info()
         self.migrations = []
         self.queries = []
+        self.use_cache = use_cache
+        self.output = output
+        self.typed_columns = typed_columns
+        self.index_report = index_report
+        self.search_index = search_index
+        self.rls_report = rls_report
+        self.row_counters = row_counters
+        self.read_cache = read_cache
+        self.split_queries = split_queries
+        self.concurrent_indexes = concurrent_indexes
+        self.migration_units = migration_units
+        self.compact = compact
+        self.storage_profiles = storage_profiles
+        self.data_gin = data_gin
+        self.partition_logs = partition_logs
+        self.cache: Optional[GenerationCache] = None
         
     def load_collections_info(self) -> Dict[str, Any]:
         """Load collection information from JSON file"""
@@ -26,13 +121,222 @@ class SupabaseSchemaGenerator:
             print("ERROR: collections-info.json not found. Run generate-all-types.js first.")
             return {"collections": []}
     
-    def pascale_to_snake(self, name: str) -> str:
-        """Convert PascalCase to snake_case"""
-        name = re.sub('([a-z0-9])([A-Z])', r'\1_\2', name)
-        return name.lower()
+    def generation_options(self) -> Dict[str, Any]:
+        """Options that change the generated SQL or TypeScript"""
+        return {'typed_columns': self.typed_columns, 'search_index': self.search_index,
+                'row_counters': self.row_counters, 'read_cache': self.read_cache,
+                'concurrent_indexes': self.concurrent_indexes, 'compact': self.compact,
+                'storage_profiles': self.storage_profiles, 'data_gin': self.data_gin,
+                'partition_logs': self.partition_logs}
+    
+    def output_filenames(self, inputs_hash: str):
+        """Deterministic migration and query filenames (a directory in split mode) for a set of inputs"""
+        queries = "supabase-queries" if self.split_queries else "supabase-queries.ts"
+        return f"supabase_migration_{inputs_hash[:12]}.sql", queries
+    
+    def index_phase_filename(self, inputs_hash: str) -> str:
+        """Kept apart from the migrations: supabase db push runs each migration in a transaction"""
+        return f"supabase_indexes_{inputs_hash[:12]}.sql"
+    
+    def units_directory(self, inputs_hash: str) -> str:
+        return f"supabase_migration_{inputs_hash[:12]}_units"
+    
+    def render_collection(self, key: str, collection: str, renderer) -> str:
+        """Render one collection block, reusing the cached render when its inputs are unchanged"""
+        if self.cache is None:
+            return renderer()
+        return self.cache.render(key, self.collection_fingerprint(collection), renderer)
+    
+    def plan_table_indexes(self, table_name: str, collection_name: str) -> Dict[str, Any]:
+        """Fixed indexes plus field-driven ones, run through the index planner"""
+        table = f"public.{table_name}"
+        specs = [
+            index_spec(table_name, table, 'created_at', ['created_at DESC'], group='Performance indexes'),
+            index_spec(table_name, table, 'updated_at', ['updated_at DESC'], group='Performance indexes'),
+            index_spec(table_name, table, 'status', ['status'], where='status IS NOT NULL', group='Performance indexes'),
+            index_spec(table_name, table, 'slug', ['slug'], where='slug IS NOT NULL', group='Performance indexes'),
+            index_spec(table_name, table, 'data_gin', ['data'], method='gin',
+                       group='JSONB indexes for common query patterns'),
+            index_spec(table_name, table, 'data_title', ["(data->>'title')"],
+                       group='JSONB indexes for common query patterns'),
+            index_spec(table_name, table, 'data_status', ["(data->>'status')"],
+                       group='JSONB indexes for common query patterns'),
+            index_spec(table_name, table, 'public_read', ['created_at DESC', 'id DESC'], where=self.public_read_predicate(collection_name),
+                       group='Backs the public read policy (anonymous listings, newest first)'),
+        ]
+        if not self.search_index:
+            specs.insert(-1, index_spec(table_name, table, 'search', ['search_vector'], method='gin',
+                                        group='Full-text search index'))
+        if not is_append_only(table_name):
+            # Keyset pagination order of findPage; also serves every plain created_at ordering
+            specs.insert(1, index_spec(table_name, table, 'created_at_id', ['created_at DESC', 'id DESC'],
+                                       group='Performance indexes'))
+        # title, slug and status already have generated columns with their own indexes
+        specs += field_index_specs(table_name, table, load_collection_fields(collection_name),
+                                   self.typed_columns_for(collection_name), skip_fields=('title', 'slug', 'status'))
+        partitioned = self.is_partitioned(table_name)
+        if partitioned:
+            implicit = [{'name': f"{table_name}_pkey", 'method': 'btree', 'keys': ['id', 'created_at'],
+                         'unique': True, 'where': None, 'implicit': True}]
+        else:
+            implicit = [
+                {'name': f"{table_name}_pkey", 'method': 'btree', 'keys': ['id'], 'unique': True,
+                 'where': None, 'implicit': True},
+                {'name': f"{table_name}_slug_unique", 'method': 'btree', 'keys': ['slug'], 'unique': True,
+                 'where': None, 'implicit': True},
+            ]
+        return plan_indexes(table_name, specs, implicit, GENERATED_COLUMNS, self.data_gin, partitioned)
+    
+    def print_index_report(self) -> None:
+        """Print the estimated index cost of every collection table"""
+        print("")
+        print("Index plan (estimates)")
+        print(format_index_report(self.index_reports()))
+    
+    def public_read_predicate(self, collection: str) -> str:
+        return PUBLIC_READ_PREDICATE.format(visibility=self.field_expression(collection, 'visibility'))
+    
+    def table_policies(self, table_name: str, collection: str) -> List[Dict[str, Any]]:
+        """RLS policies of a collection table
+        
+        Scoping the full-access policy to the authenticated role keeps it out of anonymous
+        queries, whose only row filter is then the public read predicate the partial index is
+        built on.
+        """
+        return [
+            {
+                'name': 'Allow authenticated users full access',
+                'comment': 'Allow all operations for authenticated users (modify as needed)',
+                'table': table_name,
+                'command': 'ALL',
+                'roles': 'authenticated',
+                'using': "(select auth.role()) = 'authenticated'",
+            },
+            {
+                'name': 'Allow public read access',
+                'comment': 'Allow public read access for published content',
+                'table': table_name,
+                'command': 'SELECT',
+                'roles': None,
+                'using': self.public_read_predicate(collection),
+            },
+        ]
+    
+    def render_policies(self, policies: List[Dict[str, Any]]) -> str:
+        """DROP/CREATE POLICY statements, so changed predicates replace the deployed ones"""
+        blocks = []
+        for policy in policies:
+            roles = f" TO {policy['roles']}" if policy['roles'] else ''
+            blocks.append(f"""-- Policy: {policy['comment']}
+DROP POLICY IF EXISTS "{policy['name']}" ON public.{policy['table']};
+CREATE POLICY "{policy['name']}" ON public.{policy['table']}
+    FOR {policy['command']}{roles} USING ({policy['using']});
+""")
+        return '\n'.join(blocks)
+    
+    def print_policy_report(self, migration_file: str, index_file: Optional[str] = None) -> None:
+        """Print how each policy of the written migration is evaluated against its indexes"""
+        with open(migration_file, encoding='utf-8') as f:
+            sql = f.read()
+        index_sql = ''
+        if index_file:
+            with open(index_file, encoding='utf-8') as f:
+                index_sql = f.read()
+        print("")
+        print("RLS policy evaluation")
+        print(format_policy_report(analyze_policies(sql, index_sql)))
+    
+    def generate_bulk_upsert_function(self, table_name: str, document: str = 't.data') -> str:
+        """Set-based bulk write RPC for one collection (not generated for append-only tables)
+        
+        document is the stored row's whole document (alias t), which merge_data merges into.
+        """
+        if is_append_only(table_name):
+            return ""
+        return f"""
+-- Set-based bulk write: one statement per batch instead of one request per record.
+-- merge_data merges into the stored document instead of replacing it; with insert_missing
+-- off, unknown ids are skipped (a plain bulk update). Runs as the caller, so RLS applies.
+CREATE OR REPLACE FUNCTION public.bulk_upsert_{table_name}(
+    records JSONB,
+    merge_data BOOLEAN DEFAULT FALSE,
+    insert_missing BOOLEAN DEFAULT TRUE
+)
+RETURNS SETOF public.{table_name} AS $$
+BEGIN
+    IF insert_missing THEN
+        RETURN QUERY
+        WITH written AS (
+            INSERT INTO public.{table_name} AS t (id, data)
+            SELECT COALESCE(r.id, gen_random_uuid()), COALESCE(r.data, '{{}}'::jsonb)
+            FROM jsonb_to_recordset(records) AS r(id UUID, data JSONB)
+            ON CONFLICT (id) DO UPDATE
+                SET data = CASE WHEN merge_data THEN {document} || EXCLUDED.data ELSE EXCLUDED.data END
+            RETURNING t.*
+        )
+        SELECT * FROM written;
+    ELSE
+        RETURN QUERY
+        WITH written AS (
+            UPDATE public.{table_name} AS t
+            SET data = CASE WHEN merge_data THEN {document} || r.data ELSE r.data END
+            FROM jsonb_to_recordset(records) AS r(id UUID, data JSONB)
+            WHERE t.id = r.id AND r.data IS NOT NULL
+            RETURNING t.*
+        )
+        SELECT * FROM written;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+"""
     
     def generate_supabase_table_schema(self, table_name: str, collection_name: str) -> str:
         """Generate Supabase-specific table schema"""
+        if self.compact:
+            return self.generate_compact_table_schema(table_name, collection_name)
+        typed = render_typed_columns(table_name, self.typed_columns_for(collection_name), f"public.{table_name}",
+                                     'public.', f"trigger_{table_name}_updated_at")
+        index_plan = render_index_plan(self.plan_table_indexes(table_name, collection_name), 'public.',
+                                       deferred=self.concurrent_indexes and self.can_index_concurrently(table_name))
+        policies = self.render_policies(self.table_policies(table_name, collection_name))
+        search_sync = (render_search_document_sync(table_name, f"public.{table_name}", 'public.')
+                       if self.search_index and not is_append_only(table_name) else '')
+        counters = (render_row_counter_triggers(table_name, f"public.{table_name}", 'public.')
+                    if self.row_counters else '')
+        partitioned = self.is_partitioned(table_name)
+        storage = (render_storage_profile(table_name, f"public.{table_name}", partitioned)
+                   if self.storage_profiles else '')
+        search_upgrade = self.render_search_column_drop(table_name)
+        document = typed_document_expression(self.typed_columns_for(collection_name))
+        if partitioned:
+            # Range-partitioned by created_at: primary and unique keys have to include the partition key,
+            # so the slug constraint is left out, and logs are not searched
+            id_column = "id UUID NOT NULL DEFAULT gen_random_uuid(),"
+            search_column = ""
+            table_options = """,
+    
+    -- Primary key including the partition key
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);"""
+            partitions = render_table_partitions(f"public.{table_name}", 'public.')
+        else:
+            id_column = "id UUID PRIMARY KEY DEFAULT gen_random_uuid(),"
+            search_column = "" if self.search_index else """    -- Full-text search vector
+    search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', COALESCE(data->>'title', '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(data->>'name', '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(data->>'description', '')), 'B') ||
+        setweight(to_tsvector('english', COALESCE(data->>'content', '')), 'C') ||
+        setweight(to_tsvector('english', COALESCE(data->>'tags', '')), 'D')
+    ) STORED,
+    
+"""
+            table_options = f""",
+    
+    -- Unique slug constraint (if slug exists)
+    CONSTRAINT {table_name}_slug_unique UNIQUE (slug) DEFERRABLE INITIALLY DEFERRED
+);"""
+            partitions = ""
         return f"""
 -- =====================================================
 -- Table: {table_name} ({collection_name})
@@ -40,7 +344,7 @@ class SupabaseSchemaGenerator:
 
 CREATE TABLE IF NOT EXISTS public.{table_name} (
     -- Primary key with UUID
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    {id_column}
     
     -- Timestamps with timezone
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
@@ -48,46 +352,20 @@ CREATE TABLE IF NOT EXISTS public.{table_name} (
     
     -- Flexible JSONB data storage for Payload CMS compatibility
     data JSONB NOT NULL DEFAULT '{{}}'::jsonb,
-    
+{typed['columns']}    
     -- Common fields that might be extracted from data for performance
     title TEXT GENERATED ALWAYS AS (data->>'title') STORED,
     slug TEXT GENERATED ALWAYS AS (data->>'slug') STORED,
     status TEXT GENERATED ALWAYS AS (COALESCE(data->>'status', 'draft')) STORED,
     
-    -- Full-text search vector
-    search_vector TSVECTOR GENERATED ALWAYS AS (
-        setweight(to_tsvector('english', COALESCE(data->>'title', '')), 'A') ||
-        setweight(to_tsvector('english', COALESCE(data->>'name', '')), 'A') ||
-        setweight(to_tsvector('english', COALESCE(data->>'description', '')), 'B') ||
-        setweight(to_tsvector('english', COALESCE(data->>'content', '')), 'C') ||
-        setweight(to_tsvector('english', COALESCE(data->>'tags', '')), 'D')
-    ) STORED,
-    
-    -- Data validation constraint
-    CONSTRAINT {table_name}_data_check CHECK (jsonb_typeof(data) = 'object'),
-    
-    -- Unique slug constraint (if slug exists)
-    CONSTRAINT {table_name}_slug_unique UNIQUE (slug) DEFERRABLE INITIALLY DEFERRED
-);
-
+{search_column}    -- Data validation constraint
+    CONSTRAINT {table_name}_data_check CHECK (jsonb_typeof(data) = 'object'){table_options}
+{partitions}{storage}{typed['upgrade']}{search_upgrade}
 -- =====================================================
 -- Indexes for {table_name}
 -- =====================================================
 
--- Performance indexes
-CREATE INDEX IF NOT EXISTS idx_{table_name}_created_at ON public.{table_name}(created_at DESC);
-CREATE INDEX IF NOT EXISTS idx_{table_name}_updated_at ON public.{table_name}(updated_at DESC);
-CREATE INDEX IF NOT EXISTS idx_{table_name}_status ON public.{table_name}(status) WHERE status IS NOT NULL;
-CREATE INDEX IF NOT EXISTS idx_{table_name}_slug ON public.{table_name}(slug) WHERE slug IS NOT NULL;
-
--- JSONB indexes for common query patterns
-CREATE INDEX IF NOT EXISTS idx_{table_name}_data_gin ON public.{table_name} USING gin(data);
-CREATE INDEX IF NOT EXISTS idx_{table_name}_data_title ON public.{table_name} USING btree((data->>'title'));
-CREATE INDEX IF NOT EXISTS idx_{table_name}_data_status ON public.{table_name} USING btree((data->>'status'));
-
--- Full-text search index
-CREATE INDEX IF NOT EXISTS idx_{table_name}_search ON public.{table_name} USING gin(search_vector);
-
+{index_plan}
 -- =====================================================
 -- RLS Policies for {table_name}
 -- =====================================================
@@ -95,17 +373,7 @@ CREATE INDEX IF NOT EXISTS idx_{table_name}_search ON public.{table_name} USING
 -- Enable Row Level Security
 ALTER TABLE public.{table_name} ENABLE ROW LEVEL SECURITY;
 
--- Policy: Allow all operations for authenticated users (modify as needed)
-CREATE POLICY "Allow authenticated users full access" ON public.{table_name}
-    FOR ALL USING (auth.role() = 'authenticated');
-
--- Policy: Allow public read access for published content
-CREATE POLICY "Allow public read access" ON public.{table_name}
-    FOR SELECT USING (
-        data->>'status' = 'published' OR 
-        data->>'visibility' = 'public'
-    );
-
+{policies}
 -- =====================================================
 -- Triggers for {table_name}
 -- =====================================================
@@ -125,7 +393,7 @@ CREATE TRIGGER trigger_{table_name}_updated_at
     BEFORE UPDATE ON public.{table_name}
     FOR EACH ROW
     EXECUTE FUNCTION update_{table_name}_updated_at();
-
+{typed['trigger']}{search_sync}{counters}
 -- Function for audit logging (optional)
 CREATE OR REPLACE FUNCTION {table_name}_audit_log()
 RETURNS TRIGGER AS $$
@@ -157,11 +425,109 @@ $$ LANGUAGE plpgsql;
 --     AFTER INSERT OR UPDATE OR DELETE ON public.{table_name}
 --     FOR EACH ROW
 --     EXECUTE FUNCTION {table_name}_audit_log();
+{self.generate_realtime_publication(table_name)}{self.generate_bulk_upsert_function(table_name, document)}"""
+
+    def generate_compact_table_schema(self, table_name: str, collection_name: str) -> str:
+        """What stays per table in compact mode: the table, its updated_at trigger, RLS and the bulk
+        upsert RPC come from the registry"""
+        typed = render_typed_columns(table_name, self.typed_columns_for(collection_name), f"public.{table_name}",
+                                     'public.', f"trigger_{table_name}_updated_at")
+        index_plan = render_index_plan(self.plan_table_indexes(table_name, collection_name), 'public.',
+                                       deferred=self.concurrent_indexes and self.can_index_concurrently(table_name))
+        policies = self.render_policies(self.table_policies(table_name, collection_name))
+        search_sync = (render_search_document_sync(table_name, f"public.{table_name}", 'public.')
+                       if self.search_index and not is_append_only(table_name) else '')
+        counters = (render_row_counter_triggers(table_name, f"public.{table_name}", 'public.')
+                    if self.row_counters else '')
+        storage = (render_storage_profile(table_name, f"public.{table_name}", self.is_partitioned(table_name))
+                   if self.storage_profiles else '')
+        return f"""
+-- =====================================================
+-- Table: {table_name} ({collection_name}), created from collection_registry
+-- =====================================================
+{storage}{typed['upgrade']}{self.render_search_column_drop(table_name)}
+{index_plan}
+-- RLS Policies for {table_name}
+{policies}{typed['trigger']}{search_sync}{counters}{self.generate_realtime_publication(table_name)}"""
+    
+    def generate_registry_tables(self) -> str:
+        """Compact mode: the collection registry and the DO block that creates every table from it"""
+        collections = {}
+        for collection in self.collections_info.get('collections', []):
+            collections.setdefault(self.pascale_to_snake(collection), collection)
+        rows = [{'table': table, 'collection': collection, 'append_only': is_append_only(table),
+                 'extra_columns': render_typed_columns(table, self.typed_columns_for(collection),
+                                                       f"public.{table}")['columns']}
+                for table, collection in collections.items()]
+        # Table names are snake_case identifiers, so the RPC template can splice them in unquoted
+        documents = self.typed_documents()
+        if documents:
+            arms = ''.join(f"\n        WHEN '{table}' THEN {sql_literal(document)}"
+                           for table, document in documents.items())
+            rpc = f"""format($rpc${self.generate_bulk_upsert_function('%1$s', '%2$s')}$rpc$, r.table_name,
+    CASE r.table_name{arms}
+        ELSE 't.data' END)"""
+        else:
+            rpc = f"format($rpc${self.generate_bulk_upsert_function('%1$s')}$rpc$, r.table_name)"
+        extra = f"""
+EXECUTE format('ALTER TABLE public.%I ENABLE ROW LEVEL SECURITY', r.table_name);
+IF NOT r.append_only THEN
+    EXECUTE {rpc};
+END IF;
 """
-
+        table_ddl = COMPACT_TABLE_DDL.replace(COMPACT_SEARCH_COLUMN, '') if self.search_index else COMPACT_TABLE_DDL
+        return render_collection_registry(rows, 'public.', secured=True) + render_registry_tables(
+            table_ddl, COMPACT_PARTITIONED_DDL if self.partition_logs else None, 'trigger_%s_updated_at',
+            'update_%s_updated_at', 'public.', extra)
+    
+    def generate_audit_function(self) -> str:
+        """Compact mode: one audit trigger function for every table, instead of one per table"""
+        return """
+-- Audit logging shared by every collection table (optional). Attach it to a table with:
+--   CREATE TRIGGER trigger_<table>_audit AFTER INSERT OR UPDATE OR DELETE ON public.<table>
+--       FOR EACH ROW EXECUTE FUNCTION public.audit_row_change();
+CREATE OR REPLACE FUNCTION public.audit_row_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    INSERT INTO public.audit_logs (
+        table_name,
+        record_id,
+        operation,
+        old_data,
+        new_data,
+        user_id,
+        created_at
+    ) VALUES (
+        TG_TABLE_NAME,
+        COALESCE(NEW.id, OLD.id),
+        TG_OP,
+        CASE WHEN TG_OP = 'DELETE' THEN to_jsonb(OLD) ELSE NULL END,
+        CASE WHEN TG_OP != 'DELETE' THEN to_jsonb(NEW) ELSE NULL END,
+        auth.uid(),
+        NOW()
+    );
+    RETURN COALESCE(NEW, OLD);
+END;
+$$ LANGUAGE plpgsql;
+"""
+    
     def generate_relationship_tables(self) -> str:
         """Generate relationship and system tables"""
-        return """
+        role = self.field_expression('Users', 'role')
+        if self.partition_logs:
+            audit_id = "id UUID NOT NULL DEFAULT gen_random_uuid(),"
+            audit_key = """    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    
+    -- Append-only: partitioned by month, the primary key includes the partition key
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+SELECT public.create_monthly_partitions('public.audit_logs');"""
+        else:
+            audit_id = "id UUID PRIMARY KEY DEFAULT gen_random_uuid(),"
+            audit_key = """    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);"""
+        return f"""
 -- =====================================================
 -- SYSTEM TABLES FOR RELATIONSHIPS AND MANAGEMENT
 -- =====================================================
@@ -174,7 +540,7 @@ CREATE TABLE IF NOT EXISTS public.collection_relationships (
     to_collection TEXT NOT NULL,
     to_id UUID NOT NULL,
     relationship_type TEXT NOT NULL DEFAULT 'related',
-    relationship_data JSONB DEFAULT '{}'::jsonb,
+    relationship_data JSONB DEFAULT '{{}}'::jsonb,
     created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
     created_by UUID REFERENCES auth.users(id),
     
@@ -191,15 +557,16 @@ CREATE INDEX IF NOT EXISTS idx_relationships_data ON public.collection_relations
 -- RLS for relationships
 ALTER TABLE public.collection_relationships ENABLE ROW LEVEL SECURITY;
 
+DROP POLICY IF EXISTS "Allow authenticated users to manage relationships" ON public.collection_relationships;
 CREATE POLICY "Allow authenticated users to manage relationships" ON public.collection_relationships
-    FOR ALL USING (auth.role() = 'authenticated');
+    FOR ALL TO authenticated USING ((select auth.role()) = 'authenticated');
 
 -- =====================================================
 -- AUDIT LOGS TABLE (Optional)
 -- =====================================================
 
 CREATE TABLE IF NOT EXISTS public.audit_logs (
-    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    {audit_id}
     table_name TEXT NOT NULL,
     record_id UUID NOT NULL,
     operation TEXT NOT NULL CHECK (operation IN ('INSERT', 'UPDATE', 'DELETE')),
@@ -208,26 +575,28 @@ CREATE TABLE IF NOT EXISTS public.audit_logs (
     user_id UUID REFERENCES auth.users(id),
     ip_address INET,
     user_agent TEXT,
-    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-);
+{audit_key}
 
 -- Indexes for audit logs
 CREATE INDEX IF NOT EXISTS idx_audit_logs_table_record ON public.audit_logs(table_name, record_id);
 CREATE INDEX IF NOT EXISTS idx_audit_logs_user ON public.audit_logs(user_id);
-CREATE INDEX IF NOT EXISTS idx_audit_logs_created_at ON public.audit_logs(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_audit_logs_created_at_brin ON public.audit_logs USING brin(created_at) WITH (pages_per_range = 32);
+DROP INDEX IF EXISTS public.idx_audit_logs_created_at;
 
 -- RLS for audit logs
 ALTER TABLE public.audit_logs ENABLE ROW LEVEL SECURITY;
 
+DROP POLICY IF EXISTS "Allow users to read their own audit logs" ON public.audit_logs;
 CREATE POLICY "Allow users to read their own audit logs" ON public.audit_logs
-    FOR SELECT USING (user_id = auth.uid());
+    FOR SELECT USING (user_id = (select auth.uid()));
 
+DROP POLICY IF EXISTS "Allow admins to read all audit logs" ON public.audit_logs;
 CREATE POLICY "Allow admins to read all audit logs" ON public.audit_logs
     FOR SELECT USING (
         EXISTS (
             SELECT 1 FROM public.users 
-            WHERE id = auth.uid() 
-            AND (data->>'role' = 'admin' OR data->>'role' = 'super_admin')
+            WHERE id = (select auth.uid()) 
+            AND ({role} = 'admin' OR {role} = 'super_admin')
         )
     );
 
@@ -243,38 +612,84 @@ BEGIN
 END;
 $$ LANGUAGE plpgsql IMMUTABLE;
 
--- Function to check if user has permission for collection
-CREATE OR REPLACE FUNCTION user_can_access_collection(
-    collection_name TEXT,
+-- Collections the current user may access, resolved with a single role lookup
+CREATE OR REPLACE FUNCTION accessible_collections(
+    candidates TEXT[],
     operation TEXT DEFAULT 'read'
 )
-RETURNS BOOLEAN AS $$
+RETURNS TEXT[] AS $$
 DECLARE
     user_role TEXT;
 BEGIN
     -- Get current user's role
-    SELECT data->>'role' INTO user_role 
+    SELECT {role} INTO user_role 
     FROM public.users 
     WHERE id = auth.uid();
     
     -- Admin can do everything
     IF user_role IN ('admin', 'super_admin') THEN
-        RETURN TRUE;
+        RETURN candidates;
     END IF;
     
     -- Staff can read most collections
     IF user_role = 'staff' AND operation = 'read' THEN
-        RETURN TRUE;
+        RETURN candidates;
     END IF;
     
     -- Customer can only read public collections
     IF user_role = 'customer' AND operation = 'read' THEN
-        RETURN collection_name IN ('services', 'products', 'blog_posts', 'gallery');
+        RETURN ARRAY(
+            SELECT c FROM unnest(candidates) WITH ORDINALITY AS u(c, n)
+            WHERE c IN ('services', 'products', 'blog_posts', 'gallery')
+            ORDER BY n
+        );
     END IF;
     
-    RETURN FALSE;
+    RETURN ARRAY[]::TEXT[];
 END;
-$$ LANGUAGE plpgsql SECURITY DEFINER;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER;
+
+-- Function to check if user has permission for collection
+CREATE OR REPLACE FUNCTION user_can_access_collection(
+    collection_name TEXT,
+    operation TEXT DEFAULT 'read'
+)
+RETURNS BOOLEAN AS $$
+    SELECT collection_name = ANY(accessible_collections(ARRAY[collection_name], operation));
+$$ LANGUAGE sql STABLE SECURITY DEFINER;
+"""
+
+    def document_assignment(self, variable: str, table_variable: str) -> str:
+        """PL/pgSQL assigning the document expression of the table named by table_variable
+        
+        Typed columns take their fields out of data, so search results put them back.
+        """
+        arms = ''.join(f"\n        WHEN '{table}' THEN {sql_literal(document)}"
+                       for table, document in self.typed_documents().items())
+        return f"""
+    {variable} := CASE {table_variable}{arms}
+        ELSE 't.data'
+    END;"""
+    
+    def generate_indexed_search_function(self) -> str:
+        """Generate search_collections over the search_documents table (search-index mode)
+        
+        Documents are fetched inside the function, so they only ever come from collections
+        accessible_collections let through.
+        """
+        if self.typed_columns:
+            declare = "\n    document TEXT;"
+            fetch = self.document_assignment('document', 'hit.collection').replace('\n', '\n    ') + """
+        EXECUTE format('SELECT %s FROM public.%I t WHERE t.id = $1', document, hit.collection)
+            INTO data USING hit.doc_id;"""
+        else:
+            declare = ""
+            fetch = """
+        EXECUTE format('SELECT t.data FROM public.%I t WHERE t.id = $1', hit.collection)
+            INTO data USING hit.doc_id;"""
+        return f"""
+-- Superseded by the fetch inside search_collections
+DROP FUNCTION IF EXISTS search_document_data(TEXT, UUID);
 
 -- Function for full-text search across all collections
 CREATE OR REPLACE FUNCTION search_collections(
@@ -292,67 +707,130 @@ RETURNS TABLE(
     data JSONB
 ) AS $$
 DECLARE
-    table_name TEXT;
-    query TEXT := '';
     collections TEXT[] := ARRAY[
-        'commerce', 'coupons', 'gift_cards', 'invoices', 'orders', 'payment_methods',
-        'products', 'promotions', 'returns', 'shipping_methods', 'blog_posts', 'content',
-        'faq', 'gallery', 'media', 'media_folders', 'navigation', 'navigation_menus',
-        'pages_main', 'pages', 'redirects_main', 'redirects', 'seosettings', 'tags',
-        'appointments_main', 'cancellations', 'chatbot', 'chat_conversations', 'chat_messages',
-        'contacts', 'customer_notes', 'customers_main', 'customers', 'customer_tags',
-        'email_campaigns', 'loyalty_program', 'reviews', 'subscriptions', 'testimonials',
-        'clock_records', 'commissions', 'staff_roles', 'staff_schedules', 'stylists',
-        'time_off_requests', 'appointments', 'audit_logs', 'business_documentation',
-        'chatbot_logs', 'documentation', 'documentation_templates', 'documentation_workflows',
-        'editor_plugins', 'editor_templates', 'editor_themes', 'email_logs', 'events',
-        'event_tracking', 'feature_flags', 'integrations', 'inventory', 'locations',
-        'maintenance_requests', 'notifications', 'page_views', 'push_notifications',
-        'recurring_appointments', 'resources', 'roles_permissions', 'service_packages',
-        'services', 'settings', 'site_sections', 'tenants', 'transactions', 'users',
-        'wait_list', 'webhook_logs'
+{sql_text_array(self.search_tables())}
     ];
+    hit RECORD;{declare}
 BEGIN
-    FOR table_name IN SELECT unnest(collections) LOOP
-        -- Skip if collection filter is specified and this table is not in it
-        IF collection_filter IS NOT NULL AND NOT (table_name = ANY(collection_filter)) THEN
-            CONTINUE;
-        END IF;
+    -- Skip collections outside the filter
+    IF collection_filter IS NOT NULL THEN
+        collections := ARRAY(SELECT c FROM unnest(collections) AS c WHERE c = ANY(collection_filter));
+    END IF;
+    
+    -- One permission lookup per call instead of one per matching row
+    collections := accessible_collections(collections, 'read');
+    
+    -- A single GIN probe on search_documents, whatever the number of collections;
+    -- documents are fetched by primary key for the final rows only
+    FOR hit IN
+        SELECT d.collection, d.id AS doc_id, d.title, d.slug, d.excerpt,
+               ts_rank_cd(d.search_vector, q.query) AS hit_rank
+        FROM public.search_documents d,
+             plainto_tsquery('english', search_term) AS q(query)
+        WHERE d.search_vector @@ q.query
+          AND d.collection = ANY(collections)
+        ORDER BY hit_rank DESC
+        LIMIT limit_results
+    LOOP
+        collection_name := hit.collection;
+        id := hit.doc_id;
+        title := hit.title;
+        slug := hit.slug;
+        excerpt := hit.excerpt;
+        rank := hit.hit_rank;{fetch}
+        RETURN NEXT;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER;
+"""
+    
+    def generate_search_function(self) -> str:
+        """Generate the cross-collection search RPC
         
-        -- Build UNION query for each table
+        The caller's role is resolved once and inaccessible collections never reach the query;
+        each branch keeps its own top rows so the final merge sorts at most limit_results per table.
+        """
+        if self.search_index:
+            return self.generate_indexed_search_function()
+        
+        if self.typed_columns:
+            declare = "\n    document TEXT;"
+            document = self.document_assignment('document', 'table_name').replace('\n', '\n    ') + '\n        '
+            data_column, data_argument = '%s', 'document, '
+        else:
+            declare = document = data_argument = ''
+            data_column = 't.data'
+        return f"""
+-- Function for full-text search across all collections
+CREATE OR REPLACE FUNCTION search_collections(
+    search_term TEXT,
+    collection_filter TEXT[] DEFAULT NULL,
+    limit_results INTEGER DEFAULT 50
+)
+RETURNS TABLE(
+    collection_name TEXT,
+    id UUID,
+    title TEXT,
+    slug TEXT,
+    excerpt TEXT,
+    rank REAL,
+    data JSONB
+) AS $$
+DECLARE
+    table_name TEXT;
+    query TEXT := '';{declare}
+    collections TEXT[] := ARRAY[
+{sql_text_array(self.search_tables())}
+    ];
+BEGIN
+    -- Skip collections outside the filter
+    IF collection_filter IS NOT NULL THEN
+        collections := ARRAY(SELECT c FROM unnest(collections) AS c WHERE c = ANY(collection_filter));
+    END IF;
+    
+    -- One permission lookup per call instead of one per matching row
+    collections := accessible_collections(collections, 'read');
+    
+    FOREACH table_name IN ARRAY collections LOOP
+        -- Build UNION query for each table, keeping only its best matches
         IF query != '' THEN
             query := query || ' UNION ALL ';
         END IF;
-        
+        {document}
         query := query || format('
-            SELECT %L::TEXT as collection_name,
-                   t.id,
-                   COALESCE(t.title, t.data->>''name'', ''Untitled'') as title,
-                   t.slug,
-                   LEFT(COALESCE(t.data->>''description'', t.data->>''content'', ''''), 200) as excerpt,
-                   ts_rank_cd(t.search_vector, plainto_tsquery(%L)) as rank,
-                   t.data
-            FROM public.%I t
-            WHERE t.search_vector @@ plainto_tsquery(%L)
-              AND user_can_access_collection(%L, ''read'')
-        ', table_name, search_term, table_name, search_term, table_name);
+            (SELECT %L::TEXT as collection_name,
+                    t.id,
+                    COALESCE(t.title, t.data->>''name'', ''Untitled'') as title,
+                    t.slug,
+                    LEFT(COALESCE(t.data->>''description'', t.data->>''content'', ''''), 200) as excerpt,
+                    ts_rank_cd(t.search_vector, $1) as rank,
+                    {data_column}
+             FROM public.%I t
+             WHERE t.search_vector @@ $1
+             ORDER BY rank DESC
+             LIMIT $2)
+        ', table_name, {data_argument}table_name);
     END LOOP;
     
     -- Execute the complete query
     IF query != '' THEN
-        query := query || format(' ORDER BY rank DESC LIMIT %s', limit_results);
-        RETURN QUERY EXECUTE query;
+        query := query || ' ORDER BY rank DESC LIMIT $2';
+        RETURN QUERY EXECUTE query USING plainto_tsquery('english', search_term), limit_results;
     END IF;
 END;
-$$ LANGUAGE plpgsql SECURITY DEFINER;
+$$ LANGUAGE plpgsql STABLE SECURITY DEFINER;
 """
-
+    
     def generate_supabase_migration(self) -> str:
         """Generate complete Supabase migration file"""
+        return ''.join(self.iter_supabase_migration())
+    
+    def iter_supabase_prelude(self) -> Iterator[str]:
+        """Yield what every collection table depends on: extensions, shared tables and functions"""
         collections = self.collections_info.get('collections', [])
-        migration_content = f"""-- =====================================================
+        yield f"""-- =====================================================
 -- SUPABASE MIGRATION: ModernMen Collections Schema
--- Generated at: {datetime.now().isoformat()}
+-- Content hash: {self.compute_inputs_hash()}
 -- Collections: {len(collections)}
 -- =====================================================
 
@@ -364,26 +842,67 @@ CREATE EXTENSION IF NOT EXISTS "btree_gin";
 -- Set timezone
 SET timezone = 'UTC';
 
-{self.generate_relationship_tables()}
+"""
+        
+        if self.partition_logs:
+            yield render_partition_functions('public.', secured=True,
+                                             counter_status='r.status' if self.row_counters else None)
+        if self.typed_columns:
+            yield render_typed_casts('public.')
+        yield self.generate_relationship_tables()
+        if self.search_index:
+            yield render_search_documents('public.', secured=True)
+        if self.row_counters:
+            yield render_row_counters('r.status', self.collection_tables(), 'public.', secured=True)
+        yield self.generate_search_function()
+        yield render_collection_stats(self.collection_tables(), 'public.', counters=self.row_counters)
+        if self.compact:
+            yield render_set_updated_at('public.') + self.generate_audit_function()
+    
+    def iter_supabase_migration(self) -> Iterator[str]:
+        """Yield the Supabase migration piece by piece; every chunk holds complete statements"""
+        collections = self.collections_info.get('collections', [])
+        yield from self.iter_supabase_prelude()
+        
+        yield """
 
 -- =====================================================
 -- COLLECTION TABLES
 -- =====================================================
 """
         
+        if self.compact:
+            yield self.generate_registry_tables()
+        
         print(f"Generating Supabase schemas for {len(collections)} collections...")
         
         for collection in collections:
             table_name = self.pascale_to_snake(collection)
-            schema = self.generate_supabase_table_schema(table_name, collection)
-            migration_content += schema + "\n"
+            yield self.render_table(table_name, collection) + "\n"
             print(f"Generated Supabase schema for {collection} -> {table_name}")
         
-        migration_content += """
+        yield """
 -- =====================================================
 -- FINAL SETUP
 -- =====================================================
-
+""" + self.generate_grants() + """
+-- Commit the transaction
+COMMIT;
+"""
+    
+    def render_table(self, table_name: str, collection: str) -> str:
+        return self.render_collection(f"{table_name}.sql", collection,
+                                      lambda: self.generate_supabase_table_schema(table_name, collection))
+    
+    def partitioned_tables(self) -> List[str]:
+        """audit_logs and the collection tables partitioned with --partition-logs"""
+        if not self.partition_logs:
+            return []
+        return list(dict.fromkeys(['audit_logs'] + [table for table in self.collection_tables()
+                                                    if self.is_partitioned(table)]))
+    
+    def generate_grants(self) -> str:
+        grants = """
 -- Grant necessary permissions to authenticated users
 GRANT USAGE ON SCHEMA public TO authenticated;
 GRANT ALL ON ALL TABLES IN SCHEMA public TO authenticated;
@@ -392,20 +911,212 @@ GRANT ALL ON ALL FUNCTIONS IN SCHEMA public TO authenticated;
 
 -- Grant read permissions to anon users for public data
 GRANT SELECT ON ALL TABLES IN SCHEMA public TO anon;
-
--- Commit the transaction
-COMMIT;
 """
+        maintenance = ['public.rebuild_collection_counters(TEXT)'] if self.row_counters else []
+        partitioned = self.partitioned_tables()
+        if partitioned:
+            maintenance += ['public.create_monthly_partitions(REGCLASS, INTEGER)',
+                            'public.drop_expired_partitions(REGCLASS, INTERVAL)', 'public.secure_partitions(REGCLASS)']
+        if maintenance:
+            functions = ',\n    '.join(maintenance)
+            grants += f"""
+-- The grants above reach the maintenance functions too; they stay with the migration role
+REVOKE EXECUTE ON FUNCTION {functions}
+    FROM PUBLIC, anon, authenticated;
+"""
+        if partitioned:
+            grants += """
+-- ...and every partition: partitions get their parent's policies and lose the grants again
+""" + ''.join(f"SELECT public.secure_partitions('public.{table}');\n" for table in partitioned)
+        return grants
+    
+    def generate_migration_units(self) -> List[Dict[str, Any]]:
+        """Split the migration into units that commit on their own
         
-        return migration_content
+        Collection tables only depend on the prelude (extensions, relationship tables and shared
+        functions), so they can be applied side by side; the grants cover every table and go last.
+        """
+        tables = {}
+        for collection in self.collections_info.get('collections', []):
+            table_name = self.pascale_to_snake(collection)
+            if table_name not in tables:
+                tables[table_name] = self.render_table(table_name, collection)
+        units = [migration_unit('prelude', ''.join(self.iter_supabase_prelude()))]
+        table_dependencies = ['prelude']
+        if self.compact:
+            # The registry creates every table; what is left per table builds on it
+            units.append(migration_unit('registry', self.generate_registry_tables(), table_dependencies))
+            table_dependencies = ['registry']
+        return (units + [migration_unit(f"table_{table}", schema, table_dependencies) for table, schema in tables.items()]
+                + [migration_unit('grants', self.generate_grants(), [f"table_{table}" for table in tables])])
+
+    def generate_realtime_publication(self, table_name: str) -> str:
+        """Add a collection table to the supabase_realtime publication so clients can drop cached reads"""
+        if not self.read_cache or is_append_only(table_name):
+            return ""
+        return f"""
+-- Publish changes to realtime subscribers (clients invalidate their read caches on them)
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_publication WHERE pubname = 'supabase_realtime')
+       AND NOT EXISTS (
+           SELECT 1 FROM pg_publication_tables
+           WHERE pubname = 'supabase_realtime' AND schemaname = 'public' AND tablename = '{table_name}'
+       ) THEN
+        ALTER PUBLICATION supabase_realtime ADD TABLE public.{table_name};
+    END IF;
+END $$;
+"""
+    
+    def generate_typescript_read_cache(self) -> str:
+        """Generate the in-process read cache and its realtime invalidation"""
+        if not self.read_cache:
+            return ""
+        return f"""// =====================================================
+// READ CACHE
+// =====================================================
+
+const CACHE_MAX_ENTRIES = {CACHE_MAX_ENTRIES}
+const CACHE_TTL_MS = {CACHE_TTL_MS}
+
+// Least recently used entries are evicted past maxEntries and entries expire after ttlMs;
+// concurrent misses for one key share a single query. Failed lookups are not cached, and
+// nothing is cached while enabled() is false.
+export class RecordCache<V> {{
+  private entries = new Map<string, {{ value: V; expires: number }}>()
+  private pending = new Map<string, Promise<V>>()
+  private generation = 0
+
+  constructor(
+    private maxEntries = CACHE_MAX_ENTRIES,
+    private ttlMs = CACHE_TTL_MS,
+    private enabled: () => boolean = () => true
+  ) {{}}
+
+  async get(key: string, load: () => Promise<V>): Promise<V> {{
+    if (!this.enabled()) return load()
+
+    const entry = this.entries.get(key)
+    if (entry && entry.expires > Date.now()) {{
+      // Re-insert so Map order stays least to most recently used
+      this.entries.delete(key)
+      this.entries.set(key, entry)
+      return entry.value
+    }}
+    this.entries.delete(key)
+
+    const inFlight = this.pending.get(key)
+    if (inFlight) return inFlight
+
+    const generation = this.generation
+    const promise: Promise<V> = load()
+      .then(value => {{
+        // A write that cleared the cache while this query ran may have made the result stale
+        if (generation === this.generation) this.set(key, value)
+        return value
+      }})
+      .finally(() => {{
+        if (this.pending.get(key) === promise) this.pending.delete(key)
+      }})
+    this.pending.set(key, promise)
+    return promise
+  }}
+
+  clear() {{
+    this.generation++
+    this.entries.clear()
+    this.pending.clear()
+  }}
+
+  private set(key: string, value: V) {{
+    this.entries.set(key, {{ value, expires: Date.now() + this.ttlMs }})
+    if (this.entries.size > this.maxEntries) {{
+      this.entries.delete(this.entries.keys().next().value as string)
+    }}
+  }}
+}}
+
+const recordCaches = new Map<string, RecordCache<any>>()
+let invalidationChannel: ReturnType<SupabaseClientType['channel']> | null = null
+let invalidationLive = false
+
+// The first cached read subscribes to realtime invalidation, and reads go straight to the database
+// until the channel is subscribed and whenever it is down. Writes through the managers and batch
+// helpers invalidate their collection themselves. Realtime applies RLS to the subscribing client,
+// so a change another process makes to a row that client cannot see (a record unpublished in the
+// Payload admin, for one) sends no event: such changes stay cached for up to CACHE_TTL_MS.
+function cacheFor<V>(tableName: string): RecordCache<V> {{
+  subscribeToCacheInvalidation()
+  let cache = recordCaches.get(tableName)
+  if (!cache) {{
+    cache = new RecordCache<V>(CACHE_MAX_ENTRIES, CACHE_TTL_MS, () => invalidationLive)
+    recordCaches.set(tableName, cache)
+  }}
+  return cache
+}}
+
+// Drop the cached reads of one collection, or of every collection when no table is given
+export function invalidateCollectionCache(tableName?: string) {{
+  if (tableName) recordCaches.get(tableName)?.clear()
+  else recordCaches.forEach(cache => cache.clear())
+}}
+
+// Invalidate on the changes other clients and servers make that realtime delivers to client.
+// Changes missed while disconnected are unknown, so everything is dropped on every status change.
+// Append-only log collections are not published: their rows do not change once written. Called
+// with the anon client on the first cached read; call it earlier with a client whose role sees
+// every row (server side only) to be told of changes RLS hides from anon as well. Later calls
+// return the existing channel.
+export function subscribeToCacheInvalidation(client: SupabaseClientType = supabase) {{
+  if (invalidationChannel) return invalidationChannel
+  invalidationChannel = client
+    .channel('collection-cache')
+    .on('postgres_changes', {{ event: '*', schema: 'public' }}, (payload: any) => {{
+      invalidateCollectionCache(payload.table)
+    }})
+    .subscribe(status => {{
+      invalidationLive = status === 'SUBSCRIBED'
+      invalidateCollectionCache()
+    }})
+  return invalidationChannel
+}}
+
+"""
+    
+    def generate_typescript_lookup(self, method: str, column: str) -> str:
+        """Generate a single-record lookup of the base manager, read through the cache when enabled"""
+        query = f"""const {{ data, error }} = await this.client
+      .from(this.tableName)
+      .select(this.projections[projection])
+      .eq('{column}', {column})
+      .single()
 
+    if (error) throw error
+    return data as Row<T, P>"""
+        if self.read_cache:
+            body = f"""return cacheFor<Row<T, P> | null>(this.tableName).get(`{column}:${{projection}}:${{{column}}}`, async () => {{
+      {query.replace(chr(10) + '    ', chr(10) + '      ')}
+    }})"""
+        else:
+            body = query
+        return f"""  async {method}<P extends Projection = 'detail'>(
+    {column}: string,
+    projection: P = 'detail' as P
+  ): Promise<Row<T, P> | null> {{
+    {body}
+  }}"""
+    
     def generate_typescript_queries(self) -> str:
         """Generate TypeScript query functions for Supabase"""
+        return ''.join(self.iter_typescript_queries())
+    
+    def iter_typescript_queries(self) -> Iterator[str]:
+        """Yield the TypeScript query module piece by piece"""
         collections = self.collections_info.get('collections', [])
         
-        ts_content = f"""// =====================================================
+        yield f"""// =====================================================
 // SUPABASE QUERIES: ModernMen Collections
-// Generated at: {datetime.now().isoformat()}
+// Content hash: {self.compute_inputs_hash()}
 // Collections: {len(collections)}
 // =====================================================
 
@@ -419,7 +1130,83 @@ import {{
   {', '.join([f'Update{col}' for col in collections])}
 }} from './generated-types'
 
-type SupabaseClientType = SupabaseClient<Database>
+"""
+        yield self.generate_typescript_core()
+        yield """
+// =====================================================
+// COLLECTION-SPECIFIC MANAGERS
+// =====================================================
+"""
+
+        # Generate specific managers for each collection
+        for collection in collections:
+            yield self.render_collection(f"{collection}.ts", collection,
+                                         lambda: self.generate_typescript_manager(collection))
+
+        # Add convenience exports
+        yield self.generate_typescript_exports(collections)
+
+    def generate_typescript_core(self) -> str:
+        """Generate the client setup, read cache and generic manager every collection builds on"""
+        if self.row_counters:
+            count_modes = "'exact' | 'planned' | 'estimated' | 'none' | 'counter'"
+            counter_doc = ("\n// counter reads the trigger-maintained collection_counters table (no filters other than one"
+                           "\n// status), falling back to planned where the counters are not readable")
+            counter_branch = """    if (count === 'counter') {{
+      const status = filters.status ?? undefined
+      // Counters only know collection and status; any other filter, a status list or a like
+      // pattern needs a real count
+      if (Object.keys(filters).some(key => key !== 'status') ||
+          (status !== undefined && (typeof status !== 'string' || status.includes('%')))) {{
+        return this.findMany({{ page, limit, orderBy, orderDirection, filters, projection, count: 'exact' }})
+      }}
+      const [result, counters] = await Promise.all([
+        this.findMany({{ page, limit, orderBy, orderDirection, filters, projection, count: 'none' }}),
+        this.counterRows(status)
+      ])
+      if (!counters.error && counters.data?.length) {{
+        return {{ data: result.data, count: sumCounters(counters.data) }}
+      }}
+      // RLS only lets authenticated users read the counters, so anonymous clients see no rows
+      // (as does a collection nothing was written to yet): use the planner's estimate instead
+      const {{ count: planned, error }} = await this.applyFilters(
+        this.client.from(this.tableName).select('id', {{ count: 'planned', head: true }}),
+        filters
+      )
+      if (error) throw error
+      return {{ data: result.data, count: planned || 0 }}
+    }}
+
+""".replace('{{', '{').replace('}}', '}')
+            counter_method = """
+  // collection_counters rows of this collection, optionally for one status
+  private counterRows(status?: string) {{
+    let query = this.client
+      .from('collection_counters')
+      .select('row_count')
+      .eq('collection', this.tableName)
+    if (status !== undefined) query = query.eq('status', status)
+    return query
+  }}
+
+  // Rows in this collection, optionally with one status, from collection_counters
+  async count(status?: string): Promise<number> {{
+    const {{ data, error }} = await this.counterRows(status)
+
+    if (error) throw error
+    return sumCounters(data || [])
+  }}
+""".replace('{{', '{').replace('}}', '}')
+            counter_helper = """
+const sumCounters = (rows: any[]): number =>
+  rows.reduce((sum: number, row: any) => sum + Number(row.row_count), 0)
+"""
+        else:
+            count_modes = "'exact' | 'planned' | 'estimated' | 'none'"
+            counter_doc = counter_branch = counter_method = counter_helper = ""
+        invalidate = "\n    invalidateCollectionCache(this.tableName)" if self.read_cache else ""
+        
+        return f"""export type SupabaseClientType = SupabaseClient<Database>
 
 // =====================================================
 // SUPABASE CLIENT SETUP
@@ -430,14 +1217,29 @@ const supabaseKey = process.env.NEXT_PUBLIC_SUPABASE_ANON_KEY!
 
 export const supabase = createClient<Database>(supabaseUrl, supabaseKey)
 
-// =====================================================
+{self.generate_typescript_read_cache()}// =====================================================
 // GENERIC COLLECTION OPERATIONS
 // =====================================================
 
+// exact runs COUNT(*) over the filtered rows, planned uses the planner's estimate, estimated
+// is exact for small results and planned otherwise, none skips counting{counter_doc}
+export type CountMode = {count_modes}
+{counter_helper}
+// list selects the short scalar fields of a collection and leaves data out; detail selects whole
+// records. Neither ships search_vector. Each collection manager passes its own column lists.
+export type Projection = 'list' | 'detail'
+export type Row<T, P extends Projection> = P extends 'list' ? Partial<T> : T
+
+const DEFAULT_PROJECTIONS: Record<Projection, string> = {{
+  list: '{list_projection([])}',
+  detail: '{detail_projection([])}'
+}}
+
 export class SupabaseCollectionManager<T extends Record<string, any>> {{
   constructor(
     private client: SupabaseClientType,
-    private tableName: string
+    private tableName: string,
+    protected projections: Record<Projection, string> = DEFAULT_PROJECTIONS
   ) {{}}
 
   async create(data: Omit<T, 'id' | 'created_at' | 'updated_at'>): Promise<T | null> {{
@@ -451,74 +1253,115 @@ export class SupabaseCollectionManager<T extends Record<string, any>> {{
     return result as T
   }}
 
-  async findById(id: string): Promise<T | null> {{
-    const {{ data, error }} = await this.client
-      .from(this.tableName)
-      .select('*')
-      .eq('id', id)
-      .single()
-
-    if (error) throw error
-    return data as T
-  }}
-
-  async findBySlug(slug: string): Promise<T | null> {{
-    const {{ data, error }} = await this.client
-      .from(this.tableName)
-      .select('*')
-      .eq('slug', slug)
-      .single()
+{self.generate_typescript_lookup('findById', 'id')}
 
-    if (error) throw error
-    return data as T
-  }}
+{self.generate_typescript_lookup('findBySlug', 'slug')}
 
-  async findMany({{
+  async findMany<P extends Projection = 'detail'>({{
     page = 1,
     limit = 50,
     orderBy = 'created_at',
     orderDirection = 'desc',
-    filters = {{}}
+    filters = {{}},
+    projection = 'detail' as P,
+    count = 'exact'
   }}: {{
     page?: number
     limit?: number
     orderBy?: string
     orderDirection?: 'asc' | 'desc'
     filters?: Record<string, any>
-  }} = {{}}): Promise<{{ data: T[], count: number }}> {{
-    let query = this.client
-      .from(this.tableName)
-      .select('*', {{ count: 'exact' }})
-
-    // Apply filters
-    Object.entries(filters).forEach(([key, value]) => {{
-      if (value !== undefined && value !== null) {{
-        if (Array.isArray(value)) {{
-          query = query.in(key, value)
-        }} else if (typeof value === 'string' && value.includes('%')) {{
-          query = query.like(key, value)
-        }} else {{
-          query = query.eq(key, value)
-        }}
-      }}
-    }})
+    projection?: P
+    count?: CountMode
+  }} = {{}}): Promise<{{ data: Row<T, P>[], count: number }}> {{
+{counter_branch}    const query = this.applyFilters(
+      this.client
+        .from(this.tableName)
+        .select(this.projections[projection], count === 'none' ? {{}} : {{ count }}),
+      filters
+    )
 
     // Apply pagination and ordering
     const from = (page - 1) * limit
     const to = from + limit - 1
 
-    const {{ data, error, count }} = await query
+    const {{ data, error, count: total }} = await query
       .order(orderBy, {{ ascending: orderDirection === 'asc' }})
       .range(from, to)
 
     if (error) throw error
 
     return {{
-      data: (data as T[]) || [],
-      count: count || 0
+      data: (data as Row<T, P>[]) || [],
+      count: total || 0
     }}
   }}
 
+  // Keyset pagination on (created_at, id): every page is one index range scan, however deep.
+  // Pass the returned nextCursor to get the following page; it is null on the last page.
+  async findPage<P extends Projection = 'detail'>({{
+    cursor = null,
+    limit = 50,
+    direction = 'desc',
+    filters = {{}},
+    projection = 'detail' as P,
+    count = 'none'
+  }}: {{
+    cursor?: string | null
+    limit?: number
+    direction?: 'asc' | 'desc'
+    filters?: Record<string, any>
+    projection?: P
+    count?: CountMode
+  }} = {{}}): Promise<{{ data: Row<T, P>[], nextCursor: string | null, count: number | null }}> {{
+    let query = this.applyFilters(
+      this.client
+        .from(this.tableName)
+        .select(this.projections[projection], count === 'none' ? {{}} : {{ count }}),
+      filters
+    )
+
+    if (cursor) {{
+      const {{ created_at, id }} = JSON.parse(atob(cursor))
+      const op = direction === 'asc' ? 'gt' : 'lt'
+      // The inclusive bound is the index condition that starts the scan at the cursor;
+      // the OR breaks ties on id within the same timestamp
+      query = direction === 'asc' ? query.gte('created_at', created_at) : query.lte('created_at', created_at)
+      query = query.or(`created_at.${{op}}."${{created_at}}",and(created_at.eq."${{created_at}}",id.${{op}}.${{id}})`)
+    }}
+
+    const ascending = direction === 'asc'
+    const {{ data, error, count: total }} = await query
+      .order('created_at', {{ ascending }})
+      .order('id', {{ ascending }})
+      .limit(limit + 1)
+
+    if (error) throw error
+
+    const rows = (data as Row<T, P>[]) || []
+    const last = rows.length > limit ? rows[limit - 1] : null
+    return {{
+      data: rows.slice(0, limit),
+      nextCursor: last ? btoa(JSON.stringify({{ created_at: last.created_at, id: last.id }})) : null,
+      count: count === 'none' ? null : total ?? null
+    }}
+  }}
+
+  private applyFilters(query: any, filters: Record<string, any>) {{
+    Object.entries(filters).forEach(([key, value]) => {{
+      if (value !== undefined && value !== null) {{
+        if (Array.isArray(value)) {{
+          query = query.in(key, value)
+        }} else if (typeof value === 'string' && value.includes('%')) {{
+          query = query.like(key, value)
+        }} else {{
+          query = query.eq(key, value)
+        }}
+      }}
+    }})
+    return query
+  }}
+{counter_method}
   async update(id: string, updates: Partial<T>): Promise<T | null> {{
     const {{ data, error }} = await this.client
       .from(this.tableName)
@@ -527,7 +1370,7 @@ export class SupabaseCollectionManager<T extends Record<string, any>> {{
       .select()
       .single()
 
-    if (error) throw error
+    if (error) throw error{invalidate}
     return data as T
   }}
 
@@ -537,7 +1380,7 @@ export class SupabaseCollectionManager<T extends Record<string, any>> {{
       .delete()
       .eq('id', id)
 
-    if (error) throw error
+    if (error) throw error{invalidate}
     return true
   }}
 
@@ -553,27 +1396,88 @@ export class SupabaseCollectionManager<T extends Record<string, any>> {{
     return (data || []).map((item: any) => item.data as T)
   }}
 }}
+"""
 
+    def iter_typescript_modules(self) -> Iterator[Tuple[str, str]]:
+        """Yield (filename, source) for the split TypeScript output: a shared core, one module per
+        collection and an index whose registry imports collection modules on first access"""
+        collections = list(dict.fromkeys(self.collections_info.get('collections', [])))
+        inputs_hash = self.compute_inputs_hash()
+        
+        yield 'core.ts', f"""// =====================================================
+// SUPABASE QUERIES: shared client, generic manager and helpers
+// Content hash: {inputs_hash}
 // =====================================================
-// COLLECTION-SPECIFIC MANAGERS
+
+import {{ createClient, SupabaseClient }} from '@supabase/supabase-js'
+import {{ Database }} from '../database.types'
+
+{self.generate_typescript_core()}
+// =====================================================
+// CONVENIENCE EXPORTS
 // =====================================================
-"""
 
-        # Generate specific managers for each collection
+{self.generate_typescript_helpers()}"""
+        
         for collection in collections:
-            table_name = self.pascale_to_snake(collection)
-            
-            ts_content += f"""
+            manager = self.render_collection(f"{collection}.ts", collection,
+                                             lambda: self.generate_typescript_manager(collection))
+            # No content hash here: a module only changes when its own collection does
+            yield f"{collection}.ts", f"""// =====================================================
+// SUPABASE QUERIES: {collection}
+// =====================================================
+
+import {{ SupabaseClientType, SupabaseCollectionManager, supabase }} from './core'
+import {{ {collection} }} from '../generated-types'
+{manager}"""
+        
+        loaders = '\n'.join(
+            f"  {collection.lower()}: () => import('./{collection}').then(module => module.{collection.lower()}Manager),"
+            for collection in collections
+        )
+        yield 'index.ts', f"""// =====================================================
+// SUPABASE QUERIES: ModernMen Collections
+// Content hash: {inputs_hash}
+// Collections: {len(collections)}
+// =====================================================
+
+export * from './core'
+
+// Collection modules are imported on first access, so a route only bundles and
+// initialises the managers it asks for
+const loaders = {{
+{loaders}
+}}
+
+export type CollectionName = keyof typeof loaders
+type LoadedManager<K extends CollectionName> = ReturnType<(typeof loaders)[K]>
+
+const loaded: {{ [K in CollectionName]?: LoadedManager<K> }} = {{}}
+
+export function getCollectionManager<K extends CollectionName>(name: K): LoadedManager<K> {{
+  return (loaded[name] ??= loaders[name]() as any) as LoadedManager<K>
+}}
+"""
+
+    def generate_typescript_manager(self, collection: str) -> str:
+        """Generate the manager class for a single collection"""
+        table_name = self.pascale_to_snake(collection)
+        fields = load_collection_fields(collection)
+        
+        return f"""
 export class {collection}Manager extends SupabaseCollectionManager<{collection}> {{
   constructor(client: SupabaseClientType = supabase) {{
-    super(client, '{table_name}')
+    super(client, '{table_name}', {{
+      list: '{list_projection(fields, self.typed_columns)}',
+      detail: '{detail_projection(fields, self.typed_columns)}'
+    }})
   }}
 
   // Collection-specific methods can be added here
   async findPublished(): Promise<{collection}[]> {{
     const {{ data, error }} = await this.client
       .from('{table_name}')
-      .select('*')
+      .select(this.projections.detail)
       .eq('status', 'published')
       .order('created_at', {{ ascending: false }})
 
@@ -584,7 +1488,7 @@ export class {collection}Manager extends SupabaseCollectionManager<{collection}>
   async findByStatus(status: string): Promise<{collection}[]> {{
     const {{ data, error }} = await this.client
       .from('{table_name}')
-      .select('*')
+      .select(this.projections.detail)
       .eq('status', status)
       .order('created_at', {{ ascending: false }})
 
@@ -596,8 +1500,9 @@ export class {collection}Manager extends SupabaseCollectionManager<{collection}>
 export const {collection.lower()}Manager = new {collection}Manager()
 """
 
-        # Add convenience exports
-        ts_content += f"""
+    def generate_typescript_exports(self, collections: List[str]) -> str:
+        """Generate the convenience exports shared by all collections"""
+        return f"""
 
 // =====================================================
 // CONVENIENCE EXPORTS
@@ -608,7 +1513,13 @@ export const collectionManagers = {{
 {chr(10).join([f'  {collection.lower()}: {collection.lower()}Manager,' for collection in collections])}
 }}
 
-// Generic search across all collections
+""" + self.generate_typescript_helpers()
+
+    def generate_typescript_helpers(self) -> str:
+        """Generate the search, statistics and batch helpers that work on any collection"""
+        invalidate = "\n    invalidateCollectionCache(tableName)" if self.read_cache else ""
+        append_only = ', '.join(f"'{table}'" for table in sorted(APPEND_ONLY_TABLES))
+        return f"""// Generic search across all collections
 export async function searchAllCollections(
   searchTerm: string,
   collections?: string[],
@@ -633,53 +1544,134 @@ export async function searchAllCollections(
   return data || []
 }}
 
-// Get collection statistics
-export async function getCollectionStats(): Promise<Array<{{
+// Get collection statistics; 'estimated' reads planner statistics, 'snapshot' the last scheduled
+// refresh, and 'exact' scans every table
+export async function getCollectionStats(
+  mode: 'estimated' | 'snapshot' | 'exact' = 'estimated'
+): Promise<Array<{{
   collection_name: string
   record_count: number
   avg_data_size: number
   last_updated: string
+  total_size: number
 }}>> {{
   const {{ data, error }} = await supabase
-    .rpc('get_collection_stats')
+    .rpc('get_collection_stats', {{ mode }})
 
   if (error) throw error
   return data || []
 }}
 
 // Batch operations
-export async function batchCreate<T>(
+// Large inputs are split into chunks and at most `concurrency` chunks are in flight at once
+export interface BulkOptions {{
+  chunkSize?: number
+  concurrency?: number
+}}
+
+const BULK_CHUNK_SIZE = {BULK_CHUNK_SIZE}
+const BULK_CONCURRENCY = {BULK_CONCURRENCY}
+
+async function runChunked<T, R>(
+  items: T[],
+  worker: (chunk: T[]) => Promise<R[]>,
+  options: BulkOptions = {{}}
+): Promise<R[]> {{
+  const size = Math.max(1, options.chunkSize ?? BULK_CHUNK_SIZE)
+  const chunks: T[][] = []
+  for (let i = 0; i < items.length; i += size) chunks.push(items.slice(i, i + size))
+
+  const results: R[][] = new Array(chunks.length)
+  let next = 0
+  const concurrency = Math.max(1, options.concurrency ?? BULK_CONCURRENCY)
+  const lanes = Array.from({{ length: Math.min(concurrency, chunks.length) }}, async () => {{
+    while (next < chunks.length) {{
+      const index = next++
+      results[index] = await worker(chunks[index])
+    }}
+  }})
+  await Promise.all(lanes)
+  return results.flat()
+}}
+
+// Upsert through the bulk_upsert_<table> RPC (not available for append-only log collections).
+// When an id repeats, the last entry wins: one statement cannot write the same row twice.
+export async function bulkUpsert<T>(
   tableName: string,
-  records: Array<Omit<T, 'id' | 'created_at' | 'updated_at'>>
+  records: Array<{{ id?: string; data: Partial<T> }}>,
+  options: BulkOptions & {{ merge?: boolean; insertMissing?: boolean }} = {{}}
 ): Promise<T[]> {{
-  const {{ data, error }} = await supabase
-    .from(tableName)
-    .insert(records.map(record => ({{ data: record }})))
-    .select()
+  const byId = new Map<string, {{ id?: string; data: Partial<T> }}>()
+  const withoutId: Array<{{ id?: string; data: Partial<T> }}> = []
+  for (const record of records) {{
+    if (record.id) byId.set(record.id, record)
+    else withoutId.push(record)
+  }}
 
-  if (error) throw error
-  return (data as T[]) || []
+  return runChunked([...byId.values(), ...withoutId], async chunk => {{
+    const {{ data, error }} = await supabase
+      .rpc(`bulk_upsert_${{tableName}}`, {{
+        records: chunk,
+        merge_data: options.merge ?? false,
+        insert_missing: options.insertMissing ?? true
+      }})
+
+    if (error) throw error{invalidate}
+    return (data as T[]) || []
+  }}, options)
 }}
 
-export async function batchUpdate<T>(
+export async function batchCreate<T>(
   tableName: string,
-  updates: Array<{{ id: string; data: Partial<T> }}>
+  records: Array<Omit<T, 'id' | 'created_at' | 'updated_at'>>,
+  options: BulkOptions = {{}}
 ): Promise<T[]> {{
-  const results: T[] = []
-  
-  for (const update of updates) {{
+  return runChunked(records, async chunk => {{
     const {{ data, error }} = await supabase
       .from(tableName)
-      .update({{ data: update.data }})
-      .eq('id', update.id)
+      .insert(chunk.map(record => ({{ data: record }})))
       .select()
-      .single()
 
     if (error) throw error
-    if (data) results.push(data as T)
+    return (data as T[]) || []
+  }}, options)
+}}
+
+// Append-only log collections have no bulk_upsert_<table> RPC
+const APPEND_ONLY_TABLES = new Set<string>([{append_only}])
+
+// Replaces the data of existing records in set-based batches. Like a single update it throws when
+// an id is missing (or hidden by RLS), after the batches before it were written.
+export async function batchUpdate<T>(
+  tableName: string,
+  updates: Array<{{ id: string; data: Partial<T> }}>,
+  options: BulkOptions = {{}}
+): Promise<T[]> {{
+  if (APPEND_ONLY_TABLES.has(tableName)) {{
+    return runChunked(updates, async chunk => {{
+      const results: T[] = []
+      for (const update of chunk) {{
+        const {{ data, error }} = await supabase
+          .from(tableName)
+          .update({{ data: update.data }})
+          .eq('id', update.id)
+          .select()
+          .single()
+
+        if (error) throw error
+        results.push(data as T)
+      }}{invalidate.replace(chr(10) + '    ', chr(10) + '      ')}
+      return results
+    }}, options)
   }}
 
-  return results
+  const written = await bulkUpsert<T>(tableName, updates, {{ ...options, insertMissing: false }})
+  const found = new Set((written as Array<T & {{ id: string }}>).map(record => record.id))
+  const missing = updates.filter(update => !found.has(update.id)).map(update => update.id)
+  if (missing.length > 0) {{
+    throw new Error(`batchUpdate: no ${{tableName}} record with id ${{missing.join(', ')}}`)
+  }}
+  return written
 }}
 
 export async function batchDelete(
@@ -691,35 +1683,90 @@ export async function batchDelete(
     .delete()
     .in('id', ids)
 
-  if (error) throw error
+  if (error) throw error{invalidate.replace(chr(10) + '  ', chr(10))}
   return true
 }}
 """
 
-        return ts_content
-
     def save_files(self):
-        """Save all generated files"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        """Save all generated files under deterministic, content-addressed names"""
+        inputs_hash = self.compute_inputs_hash()
+        migration_file, queries_file = self.output_filenames(inputs_hash)
+        if self.split_queries:
+            module_names = ['core.ts', 'index.ts'] + [f"{collection}.ts" for collection in
+                                                      dict.fromkeys(self.collections_info.get('collections', []))]
+            outputs = [migration_file] + [os.path.join(queries_file, name) for name in module_names]
+        else:
+            outputs = [migration_file, queries_file]
+        if self.concurrent_indexes:
+            outputs.append(self.index_phase_filename(inputs_hash))
+        if self.migration_units:
+            outputs.append(os.path.join(self.units_directory(inputs_hash), UNIT_MANIFEST))
         
-        # Save Supabase migration
-        migration_file = f"supabase_migration_{timestamp}.sql"
-        migration_content = self.generate_supabase_migration()
+        if self.use_cache:
+            self.cache = GenerationCache('supabase-schema-generator')
+            if self.cache.is_current(inputs_hash, outputs):
+                print(f"No collection changes since the last run; {migration_file} is up to date.")
+                return migration_file, queries_file
+        
+        # Stream Supabase migration
         with open(migration_file, 'w', encoding='utf-8') as f:
-            f.write(migration_content)
+            for chunk in self.iter_supabase_migration():
+                f.write(chunk)
         print(f"Supabase migration saved to: {migration_file}")
         
-        # Save TypeScript queries
-        queries_file = f"supabase-queries.ts"
-        queries_content = self.generate_typescript_queries()
-        with open(queries_file, 'w', encoding='utf-8') as f:
-            f.write(queries_content)
+        if self.concurrent_indexes:
+            index_file = self.index_phase_filename(inputs_hash)
+            with open(index_file, 'w', encoding='utf-8') as f:
+                f.write(render_index_phase(self.index_phase_tables(), inputs_hash))
+            print(f"Index phase saved to: {index_file}")
+        
+        if self.migration_units:
+            write_migration_units(self.units_directory(inputs_hash), self.generate_migration_units(),
+                                  inputs_hash, self.UNIT_SETTINGS)
+            print(f"Migration units saved to: {self.units_directory(inputs_hash)}")
+        
+        # Stream TypeScript queries
+        if self.split_queries:
+            os.makedirs(queries_file, exist_ok=True)
+            for name, source in self.iter_typescript_modules():
+                with open(os.path.join(queries_file, name), 'w', encoding='utf-8') as f:
+                    f.write(source)
+        else:
+            with open(queries_file, 'w', encoding='utf-8') as f:
+                for chunk in self.iter_typescript_queries():
+                    f.write(chunk)
         print(f"TypeScript queries saved to: {queries_file}")
         
+        if self.index_report:
+            self.print_index_report()
+        if self.rls_report:
+            self.print_policy_report(migration_file,
+                                     self.index_phase_filename(inputs_hash) if self.concurrent_indexes else None)
+        
+        if self.cache is not None:
+            print(f"Re-rendered {len(self.cache.changed)} collection blocks, the rest came from cache")
+            self.cache.save(inputs_hash, outputs)
+        
         return migration_file, queries_file
 
+    def write_migration_to_stdout(self):
+        """Stream the migration to stdout, moving progress output to stderr"""
+        out = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            if not self.collections_info.get('collections'):
+                print("ERROR: No collections found. Run the type generation first.")
+                return
+            for chunk in self.iter_supabase_migration():
+                out.write(chunk)
+        out.flush()
+
     def run(self):
         """Main execution function"""
+        if self.output == '-':
+            self.write_migration_to_stdout()
+            return
+        
         print("Starting Supabase Schema and Query Generation...")
         
         if not self.collections_info.get('collections'):
@@ -737,9 +1784,61 @@ export async function batchDelete(
         print("Next steps:")
         print(f"1. Review and run: supabase db reset")
         print(f"2. Apply migration: supabase db push")
+        if self.migration_units:
+            manifest_file = os.path.join(self.units_directory(self.compute_inputs_hash()), UNIT_MANIFEST)
+            print(f"   Or, on a fresh database, in parallel: python schema-generator.py --apply-units {manifest_file}")
+        if self.concurrent_indexes:
+            index_file = self.index_phase_filename(self.compute_inputs_hash())
+            print(f"   Then build indexes: python schema-generator.py --build-indexes {index_file}")
         print(f"3. Generate types: supabase gen types typescript --local > database.types.ts")
-        print(f"4. Import queries in your app: import {{ collectionManagers }} from './{queries_file}'")
+        if self.split_queries:
+            print(f"4. Import queries in your app: import {{ getCollectionManager }} from './{queries_file}'")
+        else:
+            print(f"4. Import queries in your app: import {{ collectionManagers }} from './{queries_file}'")
 
 if __name__ == "__main__":
-    generator = SupabaseSchemaGenerator()
+    parser = argparse.ArgumentParser(description="Generate Supabase migrations and TypeScript queries for Payload collections")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="re-render every collection even when its inputs are unchanged")
+    parser.add_argument('--stdout', action='store_true',
+                        help="stream the migration to stdout instead of writing files")
+    parser.add_argument('--typed-columns', action='store_true',
+                        help="emit typed columns for scalar Payload fields, keeping data for overflow fields")
+    parser.add_argument('--index-report', action='store_true',
+                        help="print the estimated index write amplification and size per table")
+    parser.add_argument('--search-index', action='store_true',
+                        help="maintain a trigger-fed search_documents table and search only that")
+    parser.add_argument('--rls-report', action='store_true',
+                        help="print how each RLS policy is evaluated and which ones force sequential scans")
+    parser.add_argument('--row-counters', action='store_true',
+                        help="maintain per-collection, per-status row counts with statement-level triggers")
+    parser.add_argument('--read-cache', action='store_true',
+                        help="cache findById/findBySlug in process; local writes and Supabase realtime "
+                             f"invalidate it, other changes RLS hides expire after {CACHE_TTL_MS} ms")
+    parser.add_argument('--concurrent-indexes', action='store_true',
+                        help="move collection indexes to a separate CREATE INDEX CONCURRENTLY file")
+    parser.add_argument('--split-queries', action='store_true',
+                        help="write one TypeScript module per collection plus a lazily loading index")
+    parser.add_argument('--compact', action='store_true',
+                        help="create the collection tables from a registry with shared trigger and audit functions")
+    parser.add_argument('--storage-profiles', action='store_true',
+                        help="set fillfactor, autovacuum thresholds and lz4 data compression per collection class")
+    parser.add_argument('--data-gin', choices=DATA_GIN_CHOICES,
+                        help=f"operator class of the data GIN index on every table, or none "
+                             f"(default: {DEFAULT_DATA_GIN})")
+    parser.add_argument('--partition-logs', action='store_true',
+                        help="create append-only log tables partitioned by month (new tables only; "
+                             "existing heap tables are not converted)")
+    parser.add_argument('--units', action='store_true',
+                        help="also write the migration as dependency-ordered units that can be applied in parallel")
+    args = parser.parse_args()
+    
+    generator = SupabaseSchemaGenerator(use_cache=not args.no_cache, output='-' if args.stdout else None,
+                                        typed_columns=args.typed_columns, index_report=args.index_report,
+                                        search_index=args.search_index, rls_report=args.rls_report,
+                                        row_counters=args.row_counters, read_cache=args.read_cache,
+                                        split_queries=args.split_queries, concurrent_indexes=args.concurrent_indexes,
+                                        migration_units=args.units, compact=args.compact,
+                                        storage_profiles=args.storage_profiles, data_gin=args.data_gin,
+                                        partition_logs=args.partition_logs)
     generator.run()
\ No newline at end of file
@@ -0,0 +1,52 @@
+"""Shared fixtures for the schema generator tests."""
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.join(os.path.dirname(__file__), "..")
+sys.path.insert(0, REPO_ROOT)
+
+
+def _load_module(filepath: str, module_name: str):
+    spec = importlib.util.spec_from_file_location(module_name, filepath)
+    if spec is None or spec.loader is None:
+        raise ImportError(f"Unable to load module from {filepath}")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)  # type: ignore
+    return mod
+
+
+SCHEMA_MOD = _load_module(os.path.join(REPO_ROOT, "schema-generator.py"), "schema_generator_module")
+SUPABASE_MOD = _load_module(os.path.join(REPO_ROOT, "supabase-schema-generator.py"),
+                            "supabase_schema_generator_module")
+
+
+@pytest.fixture(scope="session")
+def schema_mod():
+    return SCHEMA_MOD
+
+
+@pytest.fixture(scope="session")
+def supabase_mod():
+    return SUPABASE_MOD
+
+
+@pytest.fixture
+def generator():
+    return SCHEMA_MOD.SchemaGenerator()
+
+
+@pytest.fixture
+def supabase_generator():
+    return SUPABASE_MOD.SupabaseSchemaGenerator()
+
+
+def make_field(name: str, field_type: str, **flags):
+    """A field as parse_collection_fields returns it"""
+    field = {"name": name, "type": field_type, "required": False, "index": False, "unique": False,
+             "hasMany": False, "relationTo": None, "polymorphic": False}
+    field.update(flags)
+    return field
@@ -0,0 +1,327 @@
+"""Tests for the pure helpers in schema_common."""
+
+import json
+
+import pytest
+
+from conftest import make_field
+from schema_common import (
+    APPEND_ONLY_TABLES,
+    MAX_IDENTIFIER_LENGTH,
+    STATS_MODES,
+    WRITE_HEAVY_TABLES,
+    field_index_specs,
+    index_name,
+    index_spec,
+    load_migration_units,
+    migration_unit,
+    parse_collection_fields,
+    parse_collection_slug,
+    parse_indexes,
+    plan_indexes,
+    policy_evaluation,
+    render_collection_stats,
+    render_partition_functions,
+    render_row_counters,
+    render_typed_columns,
+    typed_columns,
+    unit_checksum,
+    write_migration_units,
+)
+
+COLLECTION_SOURCE = """
+import type { CollectionConfig } from 'payload'
+
+export const Appointments: CollectionConfig = {
+  slug: 'appointments',
+  // fields: [ { name: 'commented' } ]
+  fields: [
+    { name: 'stylist', type: 'relationship', relationTo: 'stylists', index: true },
+    { name: 'services', type: 'relationship', relationTo: 'services', hasMany: true },
+    { name: 'subject', type: 'relationship', relationTo: ['users', 'customers'] },
+    { name: 'startTime', type: 'date', required: true, index: true },
+    { name: 'price', type: 'number' },
+    { name: 'email', type: 'email', unique: true },
+    { name: 'notes', type: 'richText' },
+    { name: 'status', type: 'select', options: ['booked', 'done'] },
+  ],
+}
+"""
+
+
+def data_gin_spec(table):
+    return index_spec(table, table, 'data_gin', ['data'], method='gin')
+
+
+class TestCollectionParsing:
+    def test_parses_top_level_fields(self):
+        fields = {field['name']: field for field in parse_collection_fields(COLLECTION_SOURCE)}
+        assert list(fields) == ['stylist', 'services', 'subject', 'startTime', 'price', 'email', 'notes', 'status']
+        assert fields['stylist']['relationTo'] == 'stylists' and fields['stylist']['index']
+        assert fields['services']['hasMany']
+        assert fields['subject']['polymorphic'] and fields['subject']['relationTo'] is None
+        assert fields['startTime']['required']
+        assert fields['email']['unique']
+
+    def test_slug(self):
+        assert parse_collection_slug(COLLECTION_SOURCE) == 'appointments'
+        assert parse_collection_slug('export const x = 1') is None
+
+
+class TestTypedColumns:
+    def test_promotes_scalar_fields(self):
+        columns = {column['field']: column for column in typed_columns(parse_collection_fields(COLLECTION_SOURCE))}
+        # hasMany and polymorphic relationships, rich text and reserved names stay in data
+        assert set(columns) == {'stylist', 'startTime', 'price', 'email'}
+        assert columns['stylist']['column'] == 'stylist_id'
+        assert columns['stylist']['sql_type'] == 'UUID'
+        assert columns['startTime']['column'] == 'start_time'
+        assert columns['price']['sql_type'] == 'NUMERIC'
+
+    def test_skips_duplicate_and_invalid_columns(self):
+        fields = [make_field('startTime', 'date'), make_field('start_time', 'date'), make_field('9lives', 'text')]
+        assert [column['column'] for column in typed_columns(fields)] == ['start_time']
+
+    def test_quotes_reserved_words(self):
+        [column] = typed_columns([make_field('order', 'number')])
+        assert column['ident'] == '"order"'
+
+
+class TestPromotionTrigger:
+    def render(self):
+        columns = typed_columns([make_field('code', 'text'), make_field('price', 'number')])
+        return render_typed_columns('coupons', columns, 'public.coupons', 'public.', 'trigger_coupons_updated_at')
+
+    def test_every_column_is_assigned_on_every_write(self):
+        trigger = self.render()['trigger']
+        # Unconditional, so a field left out of a replace-update clears its column
+        assert "\n    NEW.code := NULLIF(NEW.data->>'code', '');" in trigger
+        assert "\n    NEW.price := public.typed_numeric(NULLIF(NEW.data->>'price', ''));" in trigger
+        assert "IF NEW.data ? 'code' THEN\n        NEW.code" not in trigger
+
+    def test_only_present_fields_leave_data(self):
+        trigger = self.render()['trigger']
+        assert "IF NEW.data ? 'code' THEN\n        promoted := promoted || 'code'::TEXT;" in trigger
+        assert "ELSIF NEW.data ? 'price' THEN\n        promoted := promoted || 'price'::TEXT;" in trigger
+
+    def test_backfill_rewrites_whole_documents(self):
+        trigger = self.render()['trigger']
+        assert ("UPDATE public.coupons t\nSET data = t.data || jsonb_strip_nulls(jsonb_build_object("
+                "'code', t.code, 'price', t.price))\nWHERE t.data ?| ARRAY['code', 'price'];") in trigger
+        assert 'DISABLE TRIGGER trigger_coupons_updated_at' in trigger
+
+    def test_bulk_upsert_merges_into_whole_documents(self, supabase_generator):
+        document = "t.data || jsonb_strip_nulls(jsonb_build_object('price', t.price))"
+        rpc = supabase_generator.generate_bulk_upsert_function('coupons', document)
+        assert f"THEN {document} || EXCLUDED.data ELSE" in rpc
+        assert f"THEN {document} || r.data ELSE" in rpc
+
+
+class TestFieldIndexSpecs:
+    def specs(self, fields, typed=True):
+        columns = typed_columns(fields) if typed else []
+        return {spec['name']: spec for spec in field_index_specs('appointments', 'appointments', fields, columns)}
+
+    def test_unflagged_typed_columns_get_no_index(self):
+        assert self.specs([make_field('price', 'number'), make_field('email', 'email')]) == {}
+
+    def test_flags_and_relationships(self):
+        specs = self.specs(parse_collection_fields(COLLECTION_SOURCE))
+        assert set(specs) == {'idx_appointments_stylist_id_start_time', 'idx_appointments_start_time',
+                              'idx_appointments_email_unique'}
+        assert specs['idx_appointments_stylist_id_start_time']['keys'] == ['stylist_id', 'start_time']
+        assert specs['idx_appointments_email_unique']['unique']
+
+    def test_untyped_optional_fields_are_partial(self):
+        specs = self.specs([make_field('price', 'number', index=True)], typed=False)
+        spec = specs['idx_appointments_price']
+        assert spec['keys'] == ["((data->>'price')::numeric)"]
+        assert spec['where'] == "((data->>'price')::numeric) IS NOT NULL"
+
+    def test_long_names_are_shortened(self):
+        name = index_name('a' * 40, 'b' * 40)
+        assert len(name) == MAX_IDENTIFIER_LENGTH
+        assert name != index_name('a' * 40, 'b' * 39 + 'c')
+
+
+class TestPlanIndexes:
+    def names(self, plan):
+        return [spec['name'] for spec in plan['indexes']]
+
+    def test_prefix_indexes_are_dropped(self):
+        specs = [index_spec('orders', 'orders', 'customer', ['customer_id']),
+                 index_spec('orders', 'orders', 'customer_created', ['customer_id', 'created_at'])]
+        plan = plan_indexes('orders', specs)
+        assert self.names(plan) == ['idx_orders_customer_created']
+        assert plan['dropped'] == [('idx_orders_customer', 'covered by idx_orders_customer_created')]
+
+    def test_constraint_indexes_cover_but_are_kept(self):
+        implicit = [{'name': 'orders_pkey', 'method': 'btree', 'keys': ['id'], 'where': None, 'unique': True}]
+        plan = plan_indexes('orders', [index_spec('orders', 'orders', 'id', ['id'])], implicit)
+        assert plan['indexes'] == []
+        assert plan['report']['indexes'] == 1
+
+    def test_partial_index_covered_by_full_index(self):
+        specs = [index_spec('orders', 'orders', 'sku_all', ['sku']),
+                 index_spec('orders', 'orders', 'sku', ['sku'], where='sku IS NOT NULL')]
+        assert self.names(plan_indexes('orders', specs)) == ['idx_orders_sku_all']
+
+    def test_unique_indexes_are_never_dropped(self):
+        specs = [index_spec('orders', 'orders', 'sku_unique', ['sku'], unique=True),
+                 index_spec('orders', 'orders', 'sku_created', ['sku', 'created_at'])]
+        assert self.names(plan_indexes('orders', specs)) == ['idx_orders_sku_unique', 'idx_orders_sku_created']
+
+    def test_generated_column_duplicates(self):
+        specs = [index_spec('orders', 'orders', 'total', ["((data->>'total')::numeric)"])]
+        plan = plan_indexes('orders', specs, generated_columns={"((data->>'total')::numeric)": 'total'})
+        assert plan['indexes'] == []
+
+    @pytest.mark.parametrize('data_gin, expected', [
+        (None, ['data']),
+        ('jsonb_ops', ['data']),
+        ('jsonb_path_ops', ['data jsonb_path_ops']),
+        ('none', None),
+    ])
+    def test_data_gin_choices(self, data_gin, expected):
+        plan = plan_indexes('orders', [data_gin_spec('orders')], data_gin=data_gin)
+        assert [spec['keys'] for spec in plan['indexes']] == ([expected] if expected else [])
+
+    @pytest.mark.parametrize('table', sorted(WRITE_HEAVY_TABLES))
+    def test_write_heavy_tables_keep_their_data_gin_by_default(self, table):
+        # Dropping it is an explicit --data-gin choice, never a side effect of regenerating
+        plan = plan_indexes(table, [data_gin_spec(table)])
+        assert [spec['keys'] for spec in plan['indexes']] == [['data']]
+        assert plan['dropped'] == []
+        assert plan_indexes(table, [data_gin_spec(table)], data_gin='none')['indexes'] == []
+
+    def append_only_specs(self, table):
+        return [index_spec(table, table, 'created_at', ['created_at DESC']),
+                index_spec(table, table, 'updated_at', ['updated_at DESC']),
+                index_spec(table, table, 'search', ['search_vector'], method='gin'),
+                index_spec(table, table, 'ref_unique', ['ref'], unique=True)]
+
+    def test_append_only_tables_use_brin(self):
+        table = sorted(APPEND_ONLY_TABLES)[0]
+        plan = plan_indexes(table, self.append_only_specs(table))
+        assert [(spec['name'], spec['method'], spec['unique']) for spec in plan['indexes']] == [
+            (f'idx_{table}_created_at_brin', 'brin', False),
+            (f'idx_{table}_ref_unique', 'btree', True),
+        ]
+        assert plan['report']['hot_updates']
+
+    def test_partitioned_tables_lose_unique_indexes(self):
+        # A unique index on a partitioned table would have to include created_at
+        table = sorted(APPEND_ONLY_TABLES)[0]
+        plan = plan_indexes(table, self.append_only_specs(table), partitioned=True)
+        assert [(spec['name'], spec['unique']) for spec in plan['indexes']] == [
+            (f'idx_{table}_created_at_brin', False),
+            (f'idx_{table}_ref', False),
+        ]
+
+    def test_indexed_updated_at_blocks_hot_updates(self):
+        plan = plan_indexes('orders', [index_spec('orders', 'orders', 'updated_at', ['updated_at DESC'])])
+        assert not plan['report']['hot_updates']
+
+
+class TestPolicyEvaluation:
+    INDEX_SQL = """
+CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(user_id);
+CREATE INDEX IF NOT EXISTS idx_orders_user ON orders(status);
+CREATE INDEX IF NOT EXISTS idx_orders_gone ON orders(customer_id);
+DROP INDEX IF EXISTS idx_orders_gone;
+"""
+
+    def indexes(self):
+        return parse_indexes(self.INDEX_SQL)['orders']
+
+    def test_first_definition_wins_and_drops_apply(self):
+        assert [index['name'] for index in self.indexes()] == ['idx_orders_user']
+
+    def test_indexed_predicate(self):
+        result = policy_evaluation('user_id = (SELECT auth.uid())', self.indexes(), 'orders')
+        assert result['index'] == 'idx_orders_user'
+
+    def test_unindexed_predicate(self):
+        assert policy_evaluation('customer_id = (SELECT auth.uid())', self.indexes(), 'orders')['index'] is None
+
+    def test_bare_auth_call_runs_per_row(self):
+        first = policy_evaluation('user_id = auth.uid()', self.indexes(), 'orders')
+        wrapped = policy_evaluation('user_id = (SELECT auth.uid())', self.indexes(), 'orders')
+        assert first['cost'] != wrapped['cost']
+
+
+class TestCollectionStats:
+    def test_mode_check_is_sql(self):
+        sql = render_collection_stats(['orders'])
+        modes = ', '.join(f"'{mode}'" for mode in STATS_MODES)
+        assert f"IF mode NOT IN ({modes}) THEN" in sql
+
+    def test_schema_follows_prefix(self):
+        assert 'schema_name TEXT := current_schema();' in render_collection_stats(['orders'])
+        assert "schema_name TEXT := 'app';" in render_collection_stats(['orders'], 'app.')
+        assert "'public'" not in render_collection_stats(['orders'], 'app.')
+
+
+class TestRowCounters:
+    def test_rebuild_only_accepts_collection_tables(self):
+        sql = render_row_counters('r.status', ['orders', 'coupons'])
+        assert "IF collection_table <> ALL(ARRAY[\n        'orders', 'coupons'\n    ]::TEXT[]) THEN" in sql
+        assert sql.index("RAISE EXCEPTION '% is not a collection table'") < sql.index('LOCK TABLE')
+
+    def test_rebuild_writes_shard_zero(self):
+        sql = render_row_counters('r.status', ['orders'])
+        assert "INSERT INTO collection_counters (collection, status, shard, row_count)\n" \
+               "         SELECT %L, r.status, 0, COUNT(*)" in sql
+
+    def test_secured_rebuild_is_not_callable_by_clients(self):
+        sql = render_row_counters('r.status', ['orders'], 'public.', secured=True)
+        assert ('REVOKE EXECUTE ON FUNCTION public.rebuild_collection_counters(TEXT) '
+                'FROM PUBLIC, anon, authenticated;') in sql
+        assert 'anon' not in render_row_counters('r.status', ['orders'])
+
+
+class TestPartitionRetention:
+    def drop_function(self, counter_status=None):
+        sql = render_partition_functions('public.', counter_status=counter_status)
+        return sql[sql.index('FUNCTION public.drop_expired_partitions'):]
+
+    def test_dropped_rows_leave_the_counters(self):
+        # DROP TABLE fires no DELETE trigger, so the partition is uncounted first
+        sql = self.drop_function('r.status')
+        uncount = sql.index("'SELECT %L, r.status, 0, -COUNT(*) '")
+        assert sql.index("LOCK TABLE %s IN ACCESS EXCLUSIVE MODE") < uncount
+        assert uncount < sql.index("EXECUTE format('DROP TABLE %s', part.partition);")
+        assert "to_regproc('public.count_collection_rows')" in sql
+
+    def test_counter_status_is_quoted_for_format(self):
+        sql = self.drop_function("COALESCE(r.data->>'status', 'draft')")
+        assert "'SELECT %L, COALESCE(r.data->>''status'', ''draft''), 0, -COUNT(*) '" in sql
+
+    def test_no_counters_no_uncounting(self):
+        assert 'collection_counters' not in self.drop_function()
+
+
+class TestMigrationUnits:
+    def test_checksum_ignores_content_hash_line(self):
+        assert unit_checksum("-- Content hash: a\nSELECT 1;") == unit_checksum("-- Content hash: b\nSELECT 1;")
+        assert unit_checksum("SELECT 1;") != unit_checksum("SELECT 2;")
+
+    def test_round_trip(self, tmp_path):
+        units = [migration_unit('tables', 'CREATE TABLE t ();'), migration_unit('indexes', 'SELECT 1;', ['tables'])]
+        manifest_file = write_migration_units(str(tmp_path), units, 'hash-1', {'lock_timeout': '5s'})
+        manifest = load_migration_units(manifest_file)
+        assert [unit['file'] for unit in manifest['units']] == ['001_tables.sql', '002_indexes.sql']
+        assert manifest['settings'] == {'lock_timeout': '5s'}
+        rewritten = load_migration_units(write_migration_units(str(tmp_path), units, 'hash-2'))
+        assert ([unit['checksum'] for unit in rewritten['units']]
+                == [unit['checksum'] for unit in manifest['units']])
+
+    def test_rejects_unknown_dependencies(self, tmp_path):
+        manifest_file = write_migration_units(str(tmp_path), [migration_unit('a', 'SELECT 1;', ['b'])], 'hash')
+        with pytest.raises(ValueError, match='depends on b'):
+            load_migration_units(manifest_file)
+
+    def test_manifest_is_json(self, tmp_path):
+        manifest_file = write_migration_units(str(tmp_path), [migration_unit('a', 'SELECT 1;')], 'hash')
+        with open(manifest_file, encoding='utf-8') as f:
+            assert json.load(f)['content_hash'] == 'hash'
@@ -0,0 +1,270 @@
+"""Tests for the SQL handling and bulk loading helpers of schema-generator.py."""
+
+import io
+import json
+import uuid
+
+import pytest
+
+SCHEMA = """
+CREATE EXTENSION IF NOT EXISTS "uuid-ossp";
+
+CREATE TABLE IF NOT EXISTS orders (
+    id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+    total NUMERIC(10, 2) NOT NULL,
+    status VARCHAR(20) DEFAULT 'new',
+    CONSTRAINT orders_total_check CHECK (total >= 0)
+);
+ALTER TABLE orders SET (fillfactor = 90);
+
+CREATE INDEX IF NOT EXISTS idx_orders_status ON orders(status);
+
+CREATE OR REPLACE FUNCTION touch_order() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.status := 'touched'; -- keeps the semicolon inside the body
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS orders_touch ON orders;
+CREATE TRIGGER orders_touch BEFORE UPDATE ON orders FOR EACH ROW EXECUTE FUNCTION touch_order();
+
+CREATE TABLE IF NOT EXISTS customers (
+    id UUID PRIMARY KEY
+);
+UPDATE customers SET id = id;
+"""
+
+
+def catalog_of(generator, sql):
+    """The catalog a database holds after applying sql"""
+    catalog = {'tables': {}, 'indexes': set(), 'functions': {}, 'triggers': {}, 'signatures': set(),
+               'extensions': set()}
+    for statement in generator.split_sql_statements(sql):
+        kind, key = generator.classify_statement(statement)
+        if kind == 'table':
+            catalog['tables'][key] = {column: generator.normalize_sql_type(column_type)
+                                      for column, column_type, _ in generator.parse_table_columns(statement)}
+        elif kind == 'index':
+            catalog['indexes'].add(key)
+        elif kind == 'function':
+            catalog['functions'].setdefault(key, []).append(generator.parse_function_body(statement))
+        elif kind == 'trigger':
+            catalog['triggers'][key] = generator.parse_trigger_function(statement)
+        elif kind == 'extension':
+            catalog['extensions'].add(key)
+    return catalog
+
+
+class TestSplitSqlStatements:
+    def test_splits_on_top_level_semicolons(self, generator):
+        assert generator.split_sql_statements("SELECT 1; SELECT 2;\nSELECT 3") == ['SELECT 1', 'SELECT 2', 'SELECT 3']
+
+    def test_keeps_dollar_quoted_bodies_whole(self, generator):
+        statements = generator.split_sql_statements(SCHEMA)
+        [function] = [statement for statement in statements if 'touch_order()' in statement
+                      and statement.startswith('CREATE OR REPLACE')]
+        assert function.endswith('$$ LANGUAGE plpgsql')
+        assert "NEW.status := 'touched';" in function
+
+    def test_tagged_dollar_quotes(self, generator):
+        sql = "DO $body$ BEGIN PERFORM 'a;$$;'; END $body$; SELECT 1;"
+        assert generator.split_sql_statements(sql) == ["DO $body$ BEGIN PERFORM 'a;$$;'; END $body$", 'SELECT 1']
+
+    def test_quotes_and_comments(self, generator):
+        sql = """-- header; not a statement
+SELECT 'it''s; fine', "odd;name" FROM t; -- trailing; comment
+-- only a comment;
+"""
+        assert generator.split_sql_statements(sql) == ["""-- header; not a statement
+SELECT 'it''s; fine', "odd;name" FROM t"""]
+
+    def test_unterminated_dollar_quote_runs_to_the_end(self, generator):
+        assert generator.split_sql_statements("SELECT $$a; b") == ['SELECT $$a; b']
+
+    def test_positional_parameters_are_not_dollar_quotes(self, generator):
+        assert generator.split_sql_statements("SELECT $1; SELECT $2") == ['SELECT $1', 'SELECT $2']
+
+
+class TestClassifyStatement:
+    @pytest.mark.parametrize('statement, expected', [
+        ('BEGIN', ('transaction', None)),
+        ('CREATE EXTENSION IF NOT EXISTS "uuid-ossp"', ('extension', 'uuid-ossp')),
+        ('CREATE TABLE IF NOT EXISTS public.orders (id UUID)', ('table', 'orders')),
+        ('CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_a ON a(b)', ('index', 'idx_a')),
+        ('CREATE OR REPLACE FUNCTION public.f(x TEXT) RETURNS INT', ('function', 'f')),
+        ('DROP TRIGGER IF EXISTS t_touch ON public.t', ('drop_trigger', ('t', 't_touch'))),
+        ('CREATE TRIGGER t_touch BEFORE UPDATE ON t FOR EACH ROW EXECUTE FUNCTION f()', ('trigger', ('t', 't_touch'))),
+        ('DROP INDEX CONCURRENTLY IF EXISTS public.idx_a', ('drop_index', 'idx_a')),
+        ('DROP FUNCTION IF EXISTS public.search_all_collections(TEXT, TEXT[])',
+         ('drop_function', ('search_all_collections', ('text', 'text[]')))),
+        ('DROP FUNCTION IF EXISTS f()', ('drop_function', ('f', ()))),
+        ('ALTER TABLE public.t DROP COLUMN IF EXISTS search_vector', ('drop_column', ('t', 'search_vector'))),
+        ('SET lock_timeout = 0', ('setting', None)),
+        ('ALTER TABLE t SET (fillfactor = 90)', ('maintenance', 'ALTER')),
+        ('-- backfill\nupdate t set x = 1', ('maintenance', 'UPDATE')),
+        ('GRANT SELECT ON t TO anon', ('other', None)),
+    ])
+    def test_kinds(self, generator, statement, expected):
+        assert generator.classify_statement(statement) == expected
+
+
+class TestParseTableColumns:
+    def test_columns_and_constraints(self, generator):
+        [table] = [statement for statement in generator.split_sql_statements(SCHEMA)
+                   if statement.startswith('CREATE TABLE IF NOT EXISTS orders')]
+        assert [(column, column_type) for column, column_type, _ in generator.parse_table_columns(table)] == [
+            ('id', 'UUID'), ('total', 'NUMERIC(10, 2)'), ('status', 'VARCHAR(20)')]
+
+    def test_normalize_sql_type(self, generator):
+        assert generator.normalize_sql_type('VARCHAR (20)') == 'character varying(20)'
+        assert generator.normalize_sql_type('TIMESTAMPTZ') == 'timestamp with time zone'
+
+
+class TestDiffAgainstCatalog:
+    def diff(self, generator, catalog, sql=SCHEMA):
+        return generator.diff_against_catalog(generator.split_sql_statements(sql), catalog)
+
+    def test_up_to_date_catalog_needs_nothing(self, generator):
+        assert self.diff(generator, catalog_of(generator, SCHEMA)) == []
+
+    def test_empty_catalog_keeps_everything(self, generator):
+        empty = {'tables': {}, 'indexes': set(), 'functions': {}, 'triggers': {}, 'signatures': set(),
+                 'extensions': set()}
+        assert self.diff(generator, empty) == generator.split_sql_statements(SCHEMA)
+
+    def test_missing_column_is_added_with_its_section_maintenance(self, generator):
+        catalog = catalog_of(generator, SCHEMA)
+        del catalog['tables']['orders']['status']
+        assert self.diff(generator, catalog) == [
+            "ALTER TABLE orders ADD COLUMN IF NOT EXISTS status VARCHAR(20) DEFAULT 'new'",
+            'ALTER TABLE orders SET (fillfactor = 90)',
+        ]
+
+    def test_type_change_is_a_warning(self, generator):
+        catalog = catalog_of(generator, SCHEMA)
+        catalog['tables']['orders']['total'] = 'integer'
+        [warning] = self.diff(generator, catalog)
+        assert warning.startswith('-- WARNING: orders.total is integer')
+
+    def test_changed_function_and_trigger(self, generator):
+        catalog = catalog_of(generator, SCHEMA)
+        catalog['functions']['touch_order'] = ['BEGIN RETURN NEW; END;']
+        catalog['triggers'][('orders', 'orders_touch')] = 'old_touch'
+        diff = [generator.classify_statement(statement) for statement in self.diff(generator, catalog)]
+        assert diff == [('function', 'touch_order'), ('drop_trigger', ('orders', 'orders_touch')),
+                        ('trigger', ('orders', 'orders_touch'))]
+
+    def test_missing_table_keeps_its_maintenance_only(self, generator):
+        catalog = catalog_of(generator, SCHEMA)
+        del catalog['tables']['customers']
+        diff = self.diff(generator, catalog)
+        assert [generator.classify_statement(statement)[0] for statement in diff] == ['table', 'maintenance']
+        assert diff[1] == 'UPDATE customers SET id = id'
+
+    def test_drops_only_existing_objects(self, generator):
+        sql = """DROP INDEX IF EXISTS idx_orders_status;
+DROP INDEX IF EXISTS idx_orders_gone;
+DROP FUNCTION IF EXISTS touch_order();
+DROP FUNCTION IF EXISTS gone(text);
+ALTER TABLE orders DROP COLUMN IF EXISTS status;
+ALTER TABLE orders DROP COLUMN IF EXISTS gone;
+ALTER TABLE gone DROP COLUMN IF EXISTS status;"""
+        catalog = catalog_of(generator, SCHEMA)
+        catalog['signatures'].add(('touch_order', ()))
+        assert self.diff(generator, catalog, sql) == [
+            'DROP INDEX IF EXISTS idx_orders_status',
+            'DROP FUNCTION IF EXISTS touch_order()',
+            'ALTER TABLE orders DROP COLUMN IF EXISTS status',
+        ]
+
+
+class TestBulkLoaderRows:
+    @pytest.fixture
+    def loader(self, schema_mod):
+        # row() and the id mapping never touch the connection
+        loader = schema_mod.BulkLoader.__new__(schema_mod.BulkLoader)
+        loader.relationships = {'appointments': {'stylist': 'stylists', 'subject': None}}
+        loader.relation_tables = {'blog-posts': 'blog_posts_main'}
+        loader.loaded_at = '2025-01-01T00:00:00+00:00'
+        return loader
+
+    def columns(self, line):
+        assert line.endswith('\n')
+        return line[:-1].split('\t')
+
+    def test_copy_escapes(self, loader):
+        line = loader.row('notes', {'id': 'a', 'body': 'tab\there\nnew line\\slash\r'})
+        row_id, created_at, updated_at, data = self.columns(line)
+        assert created_at == updated_at == loader.loaded_at
+        assert data == '{"id": "a", "body": "tab\\\\there\\\\nnew line\\\\\\\\slash\\\\r"}'
+        assert '\t' not in data and '\n' not in data
+
+    def test_raw_control_characters_are_escaped(self, schema_mod):
+        assert 'a\tb\nc\\d\re'.translate(schema_mod.COPY_ESCAPES) == 'a\\tb\\nc\\\\d\\re'
+
+    def test_unicode_is_written_as_is(self, loader):
+        *_, data = self.columns(loader.row('notes', {'id': 'a', 'title': 'Café'}))
+        assert json.loads(data)['title'] == 'Café'
+
+    def test_document_ids(self, loader):
+        existing = str(uuid.uuid4())
+        assert loader.document_id('orders', existing) == existing
+        derived = loader.document_id('orders', 42)
+        assert derived == loader.document_id('orders', '42') != loader.document_id('customers', 42)
+        assert uuid.UUID(derived).version == 5
+
+    def test_missing_id_gets_a_random_uuid(self, loader):
+        row_id, *_ = self.columns(loader.row('orders', {'createdAt': '2024-05-01'}))
+        assert uuid.UUID(row_id).version == 4
+
+    def test_timestamps_fall_back_to_created_at(self, loader):
+        _, created_at, updated_at, _ = self.columns(loader.row('orders', {'id': 1, 'created_at': '2024-05-01'}))
+        assert created_at == updated_at == '2024-05-01'
+
+    def test_relationships_follow_document_ids(self, loader):
+        record = {'id': 7, 'stylist': 3, 'subject': {'relationTo': 'blog-posts', 'value': 9}, 'other': 5}
+        *_, data = self.columns(loader.row('appointments', record))
+        mapped = json.loads(data)
+        assert mapped['stylist'] == loader.document_id('stylists', 3)
+        assert mapped['subject'] == {'relationTo': 'blog-posts', 'value': loader.document_id('blog_posts_main', 9)}
+        assert mapped['other'] == 5
+
+    def test_reference_shapes(self, loader):
+        assert loader.reference('stylists', [1, None, '']) == [loader.document_id('stylists', 1), None, '']
+        assert loader.reference('stylists', {'id': 1, 'name': 'Ann'}) == {'id': loader.document_id('stylists', 1),
+                                                                          'name': 'Ann'}
+        assert loader.reference(None, 1) == 1
+        assert loader.reference('staffMembers', 1) == loader.document_id('staff_members', 1)
+
+
+class TestReadLoadFile:
+    def records(self, generator, text, path, table=None):
+        return {name: list(records) for name, records in generator.read_load_file(io.StringIO(text), path, table)}
+
+    def test_ndjson(self, generator):
+        assert self.records(generator, '{"a": 1}\n\n{"a": 2}\n', 'x.ndjson', 'orders') == {'orders': [{'a': 1}, {'a': 2}]}
+
+    def test_array(self, generator):
+        assert self.records(generator, ' [ {"a": 1} , 2.5e3, [] ] ', 'x.json', 'orders') == {
+            'orders': [{'a': 1}, 2500.0, []]}
+
+    def test_object_of_collections(self, generator):
+        text = '{"BlogPosts": [{"a": 1}], "Orders": [], "Customers": [{"b": "]}"}]}'
+        assert self.records(generator, text, 'seed.json') == {
+            'blog_posts': [{'a': 1}], 'orders': [], 'customers': [{'b': ']}'}]}
+        assert self.records(generator, text, 'seed.json', 'customers') == {'customers': [{'b': ']}'}]}
+
+    def test_single_collection_files_need_a_table(self, generator):
+        with pytest.raises(ValueError, match='--load-table'):
+            generator.read_load_file(io.StringIO('[]'), 'x.json', None)
+
+    def test_values_split_across_reads(self, generator, schema_mod, monkeypatch):
+        monkeypatch.setattr(schema_mod, 'LOAD_READ_SIZE', 3)
+        text = json.dumps({'Orders': [{'total': 12345, 'note': 'x' * 10}, 1e5, 123456789, True]})
+        assert self.records(generator, text, 'seed.json') == {
+            'orders': [{'total': 12345, 'note': 'x' * 10}, 1e5, 123456789, True]}
+
+    def test_malformed_json(self, generator):
+        with pytest.raises(ValueError):
+            self.records(generator, '{"Orders": [1 2]}', 'seed.json')
@@ -0,0 +1,125 @@
+"""Tests for the SQL supabase-schema-generator.py emits."""
+
+import pytest
+
+from schema_common import render_partition_functions
+
+
+@pytest.fixture
+def search_index_generator(supabase_mod):
+    return supabase_mod.SupabaseSchemaGenerator(search_index=True, typed_columns=True)
+
+
+class TestIndexedSearch:
+    def test_documents_are_fetched_inside_search_collections(self, search_index_generator):
+        sql = search_index_generator.generate_indexed_search_function()
+        assert 'CREATE OR REPLACE FUNCTION search_document_data' not in sql
+        assert 'DROP FUNCTION IF EXISTS search_document_data(TEXT, UUID);' in sql
+        assert 'INTO data USING hit.doc_id;' in sql
+
+    def test_only_accessible_collections_are_read(self, search_index_generator):
+        sql = search_index_generator.generate_indexed_search_function()
+        # The hits, and so the fetched documents, come after the permission lookup
+        assert sql.index("accessible_collections(collections, 'read')") < sql.index('FOR hit IN')
+        assert 'AND d.collection = ANY(collections)' in sql
+
+
+class TestLogPartitioning:
+    def migration(self, generator):
+        return ''.join(generator.iter_supabase_prelude()) + generator.generate_supabase_table_schema(
+            'page_views', 'PageViews')
+
+    def test_existing_heap_tables_stay_applicable_by_default(self, supabase_generator):
+        # CREATE TABLE IF NOT EXISTS keeps an existing heap table, so nothing may assume partitions
+        sql = self.migration(supabase_generator)
+        assert 'PARTITION BY' not in sql
+        assert 'create_monthly_partitions' not in sql
+        assert 'id UUID PRIMARY KEY DEFAULT gen_random_uuid()' in sql
+        assert 'idx_page_views_created_at_brin' in sql
+
+    def test_partition_logs_partitions_new_tables(self, supabase_mod):
+        sql = self.migration(supabase_mod.SupabaseSchemaGenerator(partition_logs=True))
+        assert ') PARTITION BY RANGE (created_at);' in sql
+        assert "SELECT public.create_monthly_partitions('public.page_views');" in sql
+        assert "SELECT public.create_monthly_partitions('public.audit_logs');" in sql
+
+    def test_partitioned_tables_skip_concurrent_builds(self, supabase_mod):
+        assert supabase_mod.SupabaseSchemaGenerator().can_index_concurrently('page_views')
+        assert not supabase_mod.SupabaseSchemaGenerator(partition_logs=True).can_index_concurrently('page_views')
+
+
+class TestPartitionSecurity:
+    def test_partitions_get_the_parents_row_level_security(self):
+        sql = render_partition_functions('public.', secured=True)
+        assert "EXECUTE format('ALTER TABLE %s ENABLE ROW LEVEL SECURITY', part);" in sql
+        assert "EXECUTE format('ALTER TABLE %s FORCE ROW LEVEL SECURITY', part);" in sql
+        assert "EXECUTE format('CREATE POLICY %I ON %s AS %s FOR %s TO %s%s%s'," in sql
+        assert "EXECUTE format('REVOKE ALL ON %s FROM anon, authenticated', part);" in sql
+
+    def test_new_partitions_are_secured(self):
+        sql = render_partition_functions('public.', secured=True)
+        create = sql[sql.index('FUNCTION public.create_monthly_partitions'):]
+        assert 'PERFORM public.secure_partitions(parent);' in create[:create.index('$$ LANGUAGE')]
+
+    def test_default_partition_is_read_through_the_parent(self):
+        # Forced row level security would hide the default partition's rows from its owner
+        sql = render_partition_functions('public.', secured=True)
+        assert "'SELECT * FROM %s WHERE tableoid = %L::regclass AND %I >= %L AND %I < %L',\n" \
+               "                               parent, default_partition," in sql
+
+    def test_unsecured_functions_leave_rls_alone(self):
+        assert 'secure_partitions' not in render_partition_functions()
+
+    def test_grants_are_taken_back_after_they_are_given(self, supabase_mod):
+        grants = supabase_mod.SupabaseSchemaGenerator(partition_logs=True).generate_grants()
+        given = grants.index('GRANT SELECT ON ALL TABLES IN SCHEMA public TO anon;')
+        assert grants.index("SELECT public.secure_partitions('public.audit_logs');") > given
+        assert grants.index("SELECT public.secure_partitions('public.page_views');") > given
+        assert grants.index('REVOKE EXECUTE ON FUNCTION public.create_monthly_partitions') > given
+
+    def test_unpartitioned_grants_are_unchanged(self, supabase_generator):
+        assert 'secure_partitions' not in supabase_generator.generate_grants()
+
+
+class TestRowCounterAccess:
+    def test_rebuild_grant_is_taken_back(self, supabase_mod):
+        grants = supabase_mod.SupabaseSchemaGenerator(row_counters=True).generate_grants()
+        revoke = grants.index('REVOKE EXECUTE ON FUNCTION public.rebuild_collection_counters(TEXT)')
+        assert revoke > grants.index('GRANT ALL ON ALL FUNCTIONS IN SCHEMA public TO authenticated;')
+        assert 'FROM PUBLIC, anon, authenticated;' in grants[revoke:]
+
+    def test_counter_mode_falls_back_when_counters_cannot_answer(self, supabase_mod):
+        core = supabase_mod.SupabaseSchemaGenerator(row_counters=True).generate_typescript_core()
+        assert "(typeof status !== 'string' || status.includes('%'))" in core
+        assert "if (!counters.error && counters.data?.length) {" in core
+        assert "select('id', { count: 'planned', head: true })" in core
+
+
+class TestReadCache:
+    @pytest.fixture
+    def cached(self, supabase_mod):
+        return supabase_mod.SupabaseSchemaGenerator(read_cache=True)
+
+    def test_local_writes_invalidate(self, cached):
+        core = cached.generate_typescript_core()
+        for write in ('async update(', 'async delete('):
+            body = core[core.index(write):]
+            body = body[:body.index('return ')]
+            assert 'invalidateCollectionCache(this.tableName)' in body
+
+        helpers = cached.generate_typescript_helpers()
+        for write in ('export async function bulkUpsert', 'export async function batchUpdate',
+                      'export async function batchDelete'):
+            body = helpers[helpers.index(write):]
+            body = body[:body.index('\n}\n')]
+            assert 'invalidateCollectionCache(tableName)' in body
+
+    def test_time_to_live_bounds_changes_realtime_hides(self, supabase_mod, cached):
+        cache = cached.generate_typescript_read_cache()
+        assert f'const CACHE_TTL_MS = {supabase_mod.CACHE_TTL_MS}' in cache
+        assert 'stay cached for up to CACHE_TTL_MS' in cache
+        assert 'export function subscribeToCacheInvalidation(client: SupabaseClientType = supabase)' in cache
+
+    def test_disabled_by_default(self, supabase_generator):
+        assert supabase_generator.generate_typescript_read_cache() == ''
+        assert 'invalidateCollectionCache' not in supabase_generator.generate_typescript_core()